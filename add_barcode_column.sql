@@ -1 +0,0 @@
-ALTER TABLE drinks ADD COLUMN IF NOT EXISTS barcode VARCHAR(255) UNIQUE;
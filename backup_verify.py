@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Prüfsummen-Vergleich zwischen Live-Datenbank und wiederhergestelltem Backup
+Je Tabelle wird über alle Zeilen eine reihenfolgeunabhängige Prüfsumme
+gebildet: der Server liefert md5 jeder Zeile, der Client addiert die Hashes
+modulo 2^128. Die Zeilen kommen über einen serverseitigen Cursor, sodass der
+Speicherbedarf auch bei einem großen Journal konstant bleibt. Alle Tabellen
+beider Seiten werden parallel in eigenen Prozessen berechnet.
+"""
+
+import time
+from multiprocessing import Pool
+import db_access
+
+VERIFY_TABLES = ('drinks', 'users', 'admin_settings', 'transactions')
+
+# Zeilen pro Round Trip des Prüfsummen-Cursors
+CHECKSUM_FETCH_SIZE = 50000
+
+# Das Journal wächst nur; neuere Zeilen der Live-Seite sind nicht im Backup
+LEDGER_TABLE = 'transactions'
+
+def table_columns(cursor, table):
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+def _table_checksum(args):
+    """Worker: Zeilen und Prüfsumme einer Tabelle auf einer Seite"""
+    side, connect_kwargs, table, columns, max_id, fetch_size = args
+    start = time.perf_counter()
+
+    conn = db_access.open_target(**connect_kwargs)
+    try:
+        cursor = conn.cursor(name=f"checksum_{table}")
+        cursor.itersize = fetch_size
+        where = f"WHERE id <= {int(max_id)}" if max_id is not None else ""
+        cursor.execute(f"SELECT md5(ROW({', '.join(columns)})::text) FROM {table} {where}")
+
+        rows = 0
+        checksum = 0
+        while True:
+            hashes = cursor.fetchmany(fetch_size)
+            if not hashes:
+                break
+            checksum += sum(int(digest, 16) for digest, in hashes)
+            rows += len(hashes)
+        cursor.close()
+        conn.rollback()
+    finally:
+        conn.close()
+
+    return {
+        'side': side,
+        'table': table,
+        'rows': rows,
+        'checksum': f"{checksum % (1 << 128):032x}",
+        'seconds': time.perf_counter() - start
+    }
+
+def verify_databases(live_kwargs, restored_kwargs, workers=4, fetch_size=CHECKSUM_FETCH_SIZE):
+    """Vergleicht alle Tabellen beider Datenbanken
+
+    Die Spalten kommen aus der wiederhergestellten Datenbank, damit eine auf
+    der Live-Seite später ergänzte Spalte nicht jede Zeile verändert. Die
+    Live-Seite des Journals wird auf die höchste wiederhergestellte id
+    begrenzt. Gibt eine Liste mit einem Ergebnis je Tabelle zurück.
+    """
+    conn = db_access.open_target(**restored_kwargs)
+    cursor = conn.cursor()
+    columns = {table: table_columns(cursor, table) for table in VERIFY_TABLES}
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {LEDGER_TABLE}")
+    ledger_max_id = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+
+    jobs = []
+    for table in VERIFY_TABLES:
+        live_max_id = ledger_max_id if table == LEDGER_TABLE else None
+        jobs.append(('live', live_kwargs, table, columns[table], live_max_id, fetch_size))
+        jobs.append(('restored', restored_kwargs, table, columns[table], None, fetch_size))
+
+    with Pool(processes=max(1, min(workers, len(jobs)))) as pool:
+        checksums = pool.map(_table_checksum, jobs)
+
+    by_side = {(result['side'], result['table']): result for result in checksums}
+    results = []
+    for table in VERIFY_TABLES:
+        live = by_side[('live', table)]
+        restored = by_side[('restored', table)]
+        results.append({
+            'table': table,
+            'match': live['rows'] == restored['rows'] and live['checksum'] == restored['checksum'],
+            'live': live,
+            'restored': restored
+        })
+    return results
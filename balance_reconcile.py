@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Abgleich von users.balance mit dem Transaktionsjournal für Getränkekasse
+Je Bereich von Benutzer-ids vergleicht eine einzige set-basierte Abfrage das
+gespeicherte Guthaben mit SUM(amount) der Transaktionen und liefert nur die
+abweichenden Benutzer. Die Bereiche laufen wahlweise parallel in eigenen
+Prozessen. Abweichungen lassen sich reparieren, indem entweder das Guthaben
+auf die Journalsumme gesetzt oder eine Ausgleichsbuchung angelegt wird.
+"""
+
+import time
+from multiprocessing import Pool
+import db_access
+
+# Benutzer-ids pro Abfrage
+CHUNK_USERS = 10000
+
+REPAIR_MODES = ('balance', 'ledger')
+
+# Journalsumme je Benutzer im Bereich, passend zum Schema der Transaktionen
+LEDGER_TOTALS = {
+    'user_id': """
+        SELECT user_id AS id, SUM(amount) AS total
+        FROM transactions
+        WHERE user_id BETWEEN %(low)s AND %(high)s
+        GROUP BY user_id
+    """,
+    'username': """
+        SELECT r.id, SUM(t.amount) AS total
+        FROM transactions t
+        JOIN users r ON r.username = t.username
+        WHERE r.id BETWEEN %(low)s AND %(high)s
+        GROUP BY r.id
+    """,
+}
+
+DRIFT_QUERY = """
+    SELECT u.id, u.username, COALESCE(u.balance, 0) AS balance, COALESCE(l.total, 0) AS ledger,
+           COALESCE(u.balance, 0) - COALESCE(l.total, 0) AS delta
+    FROM users u
+    LEFT JOIN ({ledger}) l ON l.id = u.id
+    WHERE u.id BETWEEN %(low)s AND %(high)s
+      AND COALESCE(u.balance, 0) <> COALESCE(l.total, 0)
+"""
+
+# Ausgleichsbuchung über die Differenz, je Schema
+ADJUSTMENT_INSERT = {
+    'user_id': """
+        INSERT INTO transactions (user_id, transaction_date, amount, transaction_type, description)
+        SELECT d.id, NOW(), d.delta, 'adjustment', 'Abgleich mit users.balance'
+        FROM ({drift}) d
+        RETURNING user_id
+    """,
+    'username': """
+        INSERT INTO transactions (username, timestamp, amount, transaction_type, note)
+        SELECT d.username, NOW(), d.delta, 'adjustment', 'Abgleich mit users.balance'
+        FROM ({drift}) d
+        RETURNING username
+    """,
+}
+
+def ledger_key(cursor):
+    """user_id (Standard-Schema) oder username (vereinfachtes Schema)"""
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'transactions' AND column_name = 'user_id'
+    """)
+    return 'user_id' if cursor.fetchone() else 'username'
+
+def _reconcile_range(args):
+    """Worker: Abweichungen eines id-Bereichs, optional repariert
+
+    Gibt (Abweichungen, reparierte Benutzer) zurück.
+    """
+    connect_kwargs, key, low, high, repair = args
+    drift = DRIFT_QUERY.format(ledger=LEDGER_TOTALS[key])
+    params = {'low': low, 'high': high}
+
+    # Im seriellen Fall teilen sich alle Bereiche eine Verbindung aus dem Pool
+    conn = db_access.connect(**connect_kwargs)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(drift, params)
+        drifts = cursor.fetchall()
+
+        repaired = 0
+        if repair and drifts:
+            # Die Abweichung wird in derselben Anweisung neu bestimmt
+            if repair == 'balance':
+                cursor.execute(f"""
+                    UPDATE users u SET balance = d.ledger
+                    FROM ({drift}) d
+                    WHERE u.id = d.id
+                """, params)
+            else:
+                cursor.execute(ADJUSTMENT_INSERT[key].format(drift=drift), params)
+            repaired = cursor.rowcount
+
+        conn.commit()
+        cursor.close()
+        return drifts, repaired
+    finally:
+        db_access.release(conn)
+
+def reconcile(connect_kwargs, chunk_users=CHUNK_USERS, workers=1, repair=None):
+    """Gleicht alle Benutzer in Bereichen zu chunk_users ids ab
+
+    repair ist None, 'balance' (Guthaben := Journalsumme) oder 'ledger'
+    (Ausgleichsbuchung über die Differenz). Gibt ein Dict mit den
+    Abweichungen (größte zuerst), Bereichen, Reparaturen und Dauer zurück.
+    """
+    if repair not in (None,) + REPAIR_MODES:
+        raise ValueError(f"Unbekannte Reparatur: {repair}")
+
+    start = time.perf_counter()
+    conn = db_access.connect(**connect_kwargs)
+    cursor = conn.cursor()
+    key = ledger_key(cursor)
+    cursor.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1), COUNT(*) FROM users")
+    min_id, max_id, user_count = cursor.fetchone()
+    cursor.close()
+    db_access.release(conn)
+
+    jobs = [
+        (connect_kwargs, key, low, min(low + chunk_users - 1, max_id), repair)
+        for low in range(min_id, max_id + 1, chunk_users)
+    ]
+
+    if workers > 1 and len(jobs) > 1:
+        with Pool(processes=min(workers, len(jobs))) as pool:
+            results = pool.map(_reconcile_range, jobs)
+    else:
+        results = [_reconcile_range(job) for job in jobs]
+
+    drifts = [row for chunk, _ in results for row in chunk]
+    drifts.sort(key=lambda row: abs(row[4]), reverse=True)
+    return {
+        'users': user_count,
+        'chunks': len(jobs),
+        'drifts': drifts,
+        'repaired': sum(repaired for _, repaired in results),
+        'seconds': time.perf_counter() - start
+    }
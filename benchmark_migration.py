@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Benchmark der Migrationspfade für Getränkekasse
+Erzeugt synthetische Daten in beiden Layouts, migriert sie mit jedem Pfad
+(INSERT, COPY, Staging, spaltenweise, Chunks, Worker) in eine frische
+Datenbank einer wegwerfbaren PostgreSQL-Instanz und schreibt Wall-Zeit,
+Zeilen/s und Peak-RSS je Stufe in eine JSON-Ergebnisdatei.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import db_access
+from generate_benchmark_data import LAYOUTS, add_generator_arguments, generate
+from migration_pipeline import (
+    NestedJsonSource, FlatJsonSource, UserIdSchemaSink, UsernameSchemaSink, MigrationPipeline
+)
+from stage_profiler import StageProfiler, peak_rss_kb
+
+RESULTS_FILE = 'benchmark_results.json'
+
+# Pfade je Layout: Optionen für Ziel und Pipeline
+PATHS = {
+    'insert': {},
+    'bulk': {'bulk': True},
+    'staging': {'bulk': True, 'staging': True},
+    'columnar': {'bulk': True, 'columnar': True},
+    'chunked': {'bulk': True, 'chunk_size': 50000},
+    'workers': {'bulk': True, 'workers': 4},
+}
+LAYOUT_PATHS = {
+    'nested': ('insert', 'bulk', 'staging', 'columnar', 'chunked', 'workers'),
+    'flat': ('insert', 'bulk', 'staging', 'columnar'),
+}
+SOURCES = {'nested': NestedJsonSource, 'flat': FlatJsonSource}
+SINKS = {'nested': UserIdSchemaSink, 'flat': UsernameSchemaSink}
+
+def load_database_config():
+    """Lädt die Datenbank-Konfiguration"""
+    with open('database-config.json', 'r') as file:
+        return json.load(file)['database']
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class ThrowawayPostgres:
+    """Wegwerfbare PostgreSQL-Instanz für einen Benchmark-Lauf
+
+    Standardmäßig wird per initdb ein temporärer Cluster angelegt, der nur über
+    einen Unix-Socket im Temp-Verzeichnis erreichbar ist und am Ende samt Daten
+    gelöscht wird. Mit existing=True werden stattdessen Scratch-Datenbanken auf
+    dem Server aus database-config.json angelegt und wieder entfernt.
+    """
+
+    def __init__(self, existing=False):
+        self.existing = existing
+        self.directory = None
+        self.connect_kwargs = None
+
+    def __enter__(self):
+        if self.existing:
+            self.connect_kwargs = load_database_config()
+            return self
+
+        for tool in ('initdb', 'pg_ctl'):
+            if not shutil.which(tool):
+                raise RuntimeError(f"{tool} nicht gefunden (PostgreSQL-Serverpakete installieren oder --existing verwenden)")
+
+        self.directory = tempfile.mkdtemp(prefix='getraenkekasse_bench_')
+        data_dir = os.path.join(self.directory, 'data')
+        port = _free_port()
+
+        subprocess.run(
+            ['initdb', '-D', data_dir, '-U', 'postgres', '--auth=trust', '--no-sync'],
+            check=True, capture_output=True
+        )
+        subprocess.run([
+            'pg_ctl', '-D', data_dir, '-l', os.path.join(self.directory, 'postgres.log'), '-w',
+            '-o', f"-p {port} -k {self.directory} -c listen_addresses='' -c fsync=off",
+            'start'
+        ], check=True, capture_output=True)
+
+        self.connect_kwargs = {
+            'host': self.directory,
+            'port': port,
+            'database': 'postgres',
+            'user': 'postgres'
+        }
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.directory:
+            subprocess.run(
+                ['pg_ctl', '-D', os.path.join(self.directory, 'data'), '-m', 'immediate', 'stop'],
+                capture_output=True
+            )
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _admin_connection(self):
+        kwargs = dict(self.connect_kwargs, database='postgres')
+        conn = db_access.open_target(**kwargs)
+        conn.autocommit = True
+        return conn
+
+    @contextlib.contextmanager
+    def scratch_database(self, name):
+        """Legt eine frische Datenbank an und entfernt sie nach dem Lauf"""
+        conn = self._admin_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+        cursor.execute(f"CREATE DATABASE {name}")
+        try:
+            yield dict(self.connect_kwargs, database=name)
+        finally:
+            cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+            cursor.close()
+            conn.close()
+
+    def server_version(self):
+        conn = self._admin_connection()
+        version = conn.server_version
+        conn.close()
+        return version
+
+def _run_path(layout, path_name, data_path, connect_kwargs, batch_size, results, verbose):
+    """Kind-Prozess: migriert die Datei mit einem Pfad und misst jede Stufe"""
+    options = PATHS[path_name]
+    profiler = StageProfiler('benchmark', enabled=True)
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+
+    with output:
+        source = SOURCES[layout](data_path)
+        sink = SINKS[layout](options.get('bulk', False), batch_size, options.get('staging', False))
+        pipeline = MigrationPipeline(
+            source, sink,
+            chunk_size=options.get('chunk_size', 0),
+            workers=options.get('workers', 1),
+            connect_kwargs=connect_kwargs,
+            columnar=options.get('columnar', False),
+            profiler=profiler
+        )
+
+        wall_start = time.perf_counter()
+        profiler.run('load', source.check)
+
+        conn = db_access.open_target(**connect_kwargs)
+        cursor = conn.cursor()
+        profiler.run('create_tables', sink.create_tables, cursor)
+        conn.commit()
+        cursor.close()
+
+        # Dieselben Stufen wie in den Migrationsskripten
+        pipeline.run(conn)
+        wall_seconds = time.perf_counter() - wall_start
+        conn.close()
+
+    results.put({
+        'layout': layout,
+        'path': path_name,
+        'wall_seconds': round(wall_seconds, 6),
+        'peak_rss_kb': peak_rss_kb(),
+        'stages': [record.as_dict() for record in profiler.stages]
+    })
+
+def run_path(layout, path_name, data_path, connect_kwargs, batch_size, verbose=False):
+    """Führt einen Pfad in einem eigenen Prozess aus, damit Peak-RSS je Pfad gilt"""
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_run_path,
+        args=(layout, path_name, data_path, connect_kwargs, batch_size, results, verbose)
+    )
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Benchmark {layout}/{path_name} fehlgeschlagen (Exit-Code {process.exitcode})")
+    return results.get()
+
+def _transaction_rate(run):
+    for stage in run['stages']:
+        if stage['stage'] in ('transactions', 'users_and_transactions'):
+            return stage['rows_per_sec']
+    return None
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """Vergleicht den Transaktionsdurchsatz mit einem früheren Lauf
+
+    Gibt die Liste der Pfade zurück, die um mehr als tolerance langsamer sind.
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+
+    previous = {(run['layout'], run['path']): _transaction_rate(run) for run in baseline['runs']}
+    regressions = []
+
+    print(f"\n📈 Vergleich mit {baseline_path}:")
+    for run in results['runs']:
+        before = previous.get((run['layout'], run['path']))
+        after = _transaction_rate(run)
+        if not before or not after:
+            continue
+        change = after / before - 1
+        marker = '❌' if change < -tolerance else '✅'
+        print(f"{marker} {run['layout']}/{run['path']}: {before:.0f} → {after:.0f} Zeilen/s ({change:+.1%})")
+        if change < -tolerance:
+            regressions.append(f"{run['layout']}/{run['path']}")
+
+    return regressions
+
+def parse_args():
+    """Liest die Kommandozeilen-Optionen"""
+    parser = argparse.ArgumentParser(description='Benchmark der Migrationspfade')
+    add_generator_arguments(parser)
+    parser.add_argument('--layout', choices=LAYOUTS + ('both',), default='both',
+                       help='Zu messendes JSON-Layout (Standard: both)')
+    parser.add_argument('--paths', default=None,
+                       help=f"Kommagetrennte Pfade (Standard: alle; verfügbar: {', '.join(PATHS)})")
+    parser.add_argument('--batch-size', type=int, default=10000,
+                       help='Zeilen pro COPY-Batch (Standard: 10000)')
+    parser.add_argument('--output', default=RESULTS_FILE,
+                       help=f'Ergebnisdatei (Standard: {RESULTS_FILE})')
+    parser.add_argument('--baseline',
+                       help='Früheres Ergebnis, gegen das der Durchsatz verglichen wird')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                       help='Erlaubter Durchsatzverlust gegenüber --baseline (Standard: 0.2 = 20%%)')
+    parser.add_argument('--existing', action='store_true',
+                       help='Scratch-Datenbanken auf dem Server aus database-config.json statt eines temporären Clusters')
+    parser.add_argument('--verbose', action='store_true',
+                       help='Ausgaben der Migration anzeigen')
+    args = parser.parse_args()
+
+    if args.paths:
+        args.paths = [name.strip() for name in args.paths.split(',') if name.strip()]
+        unknown = [name for name in args.paths if name not in PATHS]
+        if unknown:
+            parser.error(f"Unbekannte Pfade: {', '.join(unknown)}")
+    return args
+
+def main():
+    args = parse_args()
+    layouts = LAYOUTS if args.layout == 'both' else (args.layout,)
+
+    print("⏱️ Starte Migrations-Benchmark...")
+
+    data_dir = tempfile.mkdtemp(prefix='getraenkekasse_bench_data_')
+    results = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'users': args.users,
+            'transactions_per_user': args.transactions_per_user,
+            'drinks': args.drinks,
+            'days': args.days,
+            'seed': args.seed,
+            'batch_size': args.batch_size
+        },
+        'datasets': {},
+        'runs': []
+    }
+
+    try:
+        with ThrowawayPostgres(existing=args.existing) as server:
+            results['postgres_version'] = server.server_version()
+
+            for layout in layouts:
+                data_path = os.path.join(data_dir, f"data_{layout}.json")
+                counts = generate(
+                    data_path, layout, args.users, args.transactions_per_user,
+                    args.drinks, args.days, args.seed
+                )
+                counts['file_bytes'] = os.path.getsize(data_path)
+                results['datasets'][layout] = counts
+                print(f"📂 {layout}: {counts['transactions']} Transaktionen, {counts['file_bytes'] / 1024 / 1024:.1f} MB")
+
+                for path_name in LAYOUT_PATHS[layout]:
+                    if args.paths and path_name not in args.paths:
+                        continue
+                    with server.scratch_database(f"benchmark_{layout}_{path_name}") as connect_kwargs:
+                        run = run_path(layout, path_name, data_path, connect_kwargs,
+                                       args.batch_size, args.verbose)
+                    results['runs'].append(run)
+                    rate = _transaction_rate(run)
+                    rate_text = f"{rate:.0f} Transaktionen/s" if rate else "-"
+                    print(f"✅ {layout}/{path_name}: {run['wall_seconds']:.2f}s, {rate_text}, "
+                          f"Peak-RSS {run['peak_rss_kb'] / 1024:.0f} MB")
+    except Exception as e:
+        print(f"❌ Benchmark fehlgeschlagen: {e}")
+        sys.exit(1)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"💾 Ergebnisse gespeichert: {args.output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"❌ Durchsatz-Regression: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
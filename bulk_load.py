@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Bulk-Loader für die Migrationsskripte der Getränkekasse
+Streamt Transaktionen per COPY ... FROM STDIN statt einzelner INSERTs
+"""
+
+import io
+from datetime import datetime, timezone
+from psycopg2.extras import execute_values
+import db_access
+
+# Anzahl Zeilen pro COPY-Aufruf
+DEFAULT_BATCH_SIZE = 10000
+
+# Anzahl Benutzer pro mehrzeiligem INSERT ... RETURNING
+USER_BATCH_SIZE = 1000
+
+# Spalten für das Schema mit user_id (migrate_to_postgres.py / migrate_data.py)
+TRANSACTION_COLUMNS = (
+    'user_id', 'transaction_date', 'amount',
+    'transaction_type', 'description', 'drink_name'
+)
+
+# Spalten für das Schema mit username (migrate_simple.py)
+SIMPLE_TRANSACTION_COLUMNS = (
+    'username', 'transaction_type', 'amount',
+    'item_name', 'timestamp', 'note'
+)
+
+def parse_transaction_date(value):
+    """Parst ein ISO-Datum aus data.json wie die bisherigen Einzel-INSERTs
+
+    Zeitzonenbehaftete Werte werden nach UTC ohne Zeitzone normalisiert,
+    da COPY bei TIMESTAMP-Spalten einen Offset sonst stillschweigend ignoriert.
+    """
+    if value is None:
+        return datetime.now()
+
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def drink_name_for(transaction):
+    """Bestimmt den Getränkenamen für purchase-Transaktionen"""
+    if transaction.get('type') == 'purchase':
+        return transaction.get('description')
+    return None
+
+def _upsert_user_batch(cursor, batch):
+    """Upsertet einen Batch Benutzer und liefert (id, username)-Paare zurück"""
+    return execute_values(cursor, """
+        INSERT INTO users (username, pin, balance) 
+        VALUES %s 
+        ON CONFLICT (username) DO UPDATE SET 
+            pin = EXCLUDED.pin, 
+            balance = EXCLUDED.balance
+        RETURNING id, username
+    """, batch, page_size=len(batch), fetch=True)
+
+def upsert_users(cursor, users, batch_size=USER_BATCH_SIZE):
+    """Upsertet Benutzer in mehrzeiligen Batches mit RETURNING id, username
+
+    Ersetzt INSERT + SELECT pro Benutzer durch einen Round Trip pro Batch.
+    Gibt eine Zuordnung username -> id zurück.
+    """
+    user_ids = {}
+    # Innerhalb eines Batches darf ON CONFLICT dieselbe Zeile nur einmal
+    # treffen, daher gewinnt wie bisher der letzte Eintrag je username
+    batch = {}
+
+    for user in users:
+        batch[user['username']] = (user['username'], user['pin'], user.get('balance', 0))
+
+        if len(batch) >= batch_size:
+            user_ids.update((username, user_id) for user_id, username
+                            in _upsert_user_batch(cursor, list(batch.values())))
+            batch = {}
+
+    if batch:
+        user_ids.update((username, user_id) for user_id, username
+                        in _upsert_user_batch(cursor, list(batch.values())))
+
+    return user_ids
+
+def _copy_value(value):
+    """Formatiert einen Wert für das COPY-Textformat"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    text = str(value)
+    return (text.replace('\\', '\\\\')
+                .replace('\t', '\\t')
+                .replace('\n', '\\n')
+                .replace('\r', '\\r'))
+
+def _flush(cursor, table, columns, buffer):
+    """Schickt einen gefüllten Puffer per COPY an die Datenbank"""
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN",
+        buffer
+    )
+
+def copy_rows(cursor, table, columns, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Streamt Zeilen in Batches per COPY ... FROM STDIN in eine Tabelle
+
+    rows darf ein Generator sein; es wird immer nur ein Batch im Speicher gehalten.
+    Gibt die Anzahl geschriebener Zeilen zurück.
+    """
+    total = 0
+    pending = 0
+    buffer = io.StringIO()
+
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+        pending += 1
+
+        if pending >= batch_size:
+            _flush(cursor, table, columns, buffer)
+            total += pending
+            pending = 0
+            buffer = io.StringIO()
+
+    if pending:
+        _flush(cursor, table, columns, buffer)
+        total += pending
+
+    return total
+
+def copy_rows_via_staging(cursor, table, columns, rows, batch_size=DEFAULT_BATCH_SIZE, before_insert=None):
+    """Lädt Zeilen per COPY in eine temporäre Staging-Tabelle und übernimmt sie
+    anschließend mit einem einzigen INSERT ... SELECT in die Zieltabelle
+
+    before_insert(cursor, staging) läuft vor dem INSERT, etwa um fehlende
+    Partitionen der Zieltabelle anzulegen.
+    """
+    staging = f"staging_{table}"
+    column_list = ', '.join(columns)
+
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {staging}
+        (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP
+    """)
+    cursor.execute(f"TRUNCATE {staging}")
+
+    total = copy_rows(cursor, staging, columns, rows, batch_size)
+    if before_insert:
+        before_insert(cursor, staging)
+
+    cursor.execute(f"""
+        INSERT INTO {table} ({column_list})
+        SELECT {column_list} FROM {staging}
+    """)
+    cursor.execute(f"TRUNCATE {staging}")
+
+    return total
+
+def insert_rows(cursor, table, columns, rows):
+    """Schreibt Zeilen per einzelnem INSERT (ohne COPY) als vorbereitete Anweisung"""
+    placeholders = ', '.join(['%s'] * len(columns))
+    return db_access.execute_prepared_batch(
+        cursor,
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        rows
+    )
+
+def load_rows(cursor, table, columns, rows, batch_size=DEFAULT_BATCH_SIZE, staging=False, before_insert=None):
+    """Wählt zwischen direktem COPY und COPY über eine Staging-Tabelle"""
+    if staging or before_insert:
+        return copy_rows_via_staging(cursor, table, columns, rows, batch_size, before_insert)
+    return copy_rows(cursor, table, columns, rows, batch_size)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Spaltenweise Batch-Transformation für die Migrationsskripte der Getränkekasse
+Sammelt Transaktionen in Spalten (Schlüssel, Epoch-Mikrosekunden, Cent-Beträge,
+Typ-Codes), normalisiert und prüft jeden Batch als Ganzes und übergibt die
+Spalten per COPY an eine Staging-Tabelle. Erst PostgreSQL wandelt die Werte
+mit einem einzigen INSERT ... SELECT in TIMESTAMP und DECIMAL zurück.
+Ist numpy installiert, werden Zeitstempel und Beträge vektorisiert geparst.
+"""
+
+import math
+import warnings
+from datetime import datetime, timedelta, timezone
+from bulk_load import DEFAULT_BATCH_SIZE, copy_rows
+
+try:
+    import numpy as np
+except ImportError:  # numpy ist optional
+    np = None
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = EPOCH.replace(tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# DECIMAL(10,2): höchstens 8 Vor- und 2 Nachkommastellen
+MAX_CENTS = 10 ** 10 - 1
+# transaction_type ist VARCHAR(50)
+MAX_TYPE_LENGTH = 50
+
+STAGING_TABLE = 'columnar_transactions'
+STAGING_COLUMNS = ('key', 'ts_us', 'cents', 'type_code', 'description', 'drink_name')
+
+class ColumnBatch:
+    """Rohe Spalten eines Batches, so wie sie die Quelle liefert"""
+
+    def __init__(self):
+        self.usernames = []
+        self.dates = []
+        self.amounts = []
+        self.types = []
+        self.descriptions = []
+        self.drink_names = []
+
+    def __len__(self):
+        return len(self.usernames)
+
+    def append(self, username, date, amount, transaction_type, description, drink_name):
+        self.usernames.append(username)
+        self.dates.append(date)
+        self.amounts.append(amount)
+        self.types.append(transaction_type)
+        self.descriptions.append(description)
+        self.drink_names.append(drink_name)
+
+def _timestamp_to_us(value, now_us):
+    """Wandelt ein ISO-Datum in Mikrosekunden seit 1970 (UTC, ohne Zeitzone)"""
+    if value is None:
+        return now_us
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        return (parsed - EPOCH_UTC) // MICROSECOND
+    return (parsed - EPOCH) // MICROSECOND
+
+def _amount_to_cents(value):
+    amount = float(value)
+    if not math.isfinite(amount):
+        raise ValueError(f"Ungültiger Betrag: {value!r}")
+    cents = round(amount * 100)
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f"Betrag außerhalb von DECIMAL(10,2): {value!r}")
+    return cents
+
+def _vector_timestamps(dates, now_us):
+    """Parst alle Zeitstempel eines Batches mit numpy; None, wenn das nicht geht
+
+    Nur Werte ohne Offset oder mit 'Z' werden vektorisiert, alles andere
+    (z.B. +01:00) übernimmt der zeilenweise Pfad.
+    """
+    if np is None:
+        return None
+    stripped = []
+    for value in dates:
+        if value is None:
+            stripped.append(None)
+        elif not isinstance(value, str) or 'T' not in value:
+            return None
+        elif value.endswith('Z'):
+            stripped.append(value[:-1])
+        elif '+' in value or '-' in value[value.index('T'):]:
+            return None
+        else:
+            stripped.append(value)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            parsed = np.array(
+                ['NaT' if value is None else value for value in stripped],
+                dtype='datetime64[us]'
+            ).astype(np.int64)
+    except (ValueError, TypeError, DeprecationWarning):
+        return None
+    return [now_us if value is None else int(us) for value, us in zip(stripped, parsed)]
+
+def _vector_cents(amounts):
+    """Rechnet alle Beträge eines Batches mit numpy in Cent um; None bei ungültigen Werten"""
+    if np is None:
+        return None
+    try:
+        values = np.asarray(amounts, dtype=np.float64)
+    except (ValueError, TypeError):
+        return None
+    if not np.isfinite(values).all():
+        return None
+    cents = np.rint(values * 100)
+    if (np.abs(cents) > MAX_CENTS).any():
+        return None
+    return cents.astype(np.int64).tolist()
+
+def _convert_column(values, convert):
+    """Wandelt eine ganze Spalte um; None, falls mindestens ein Wert ungültig ist"""
+    try:
+        return [convert(value) for value in values]
+    except (ValueError, AttributeError, TypeError, OverflowError):
+        return None
+
+def _valid_type(transaction_type):
+    return isinstance(transaction_type, str) and len(transaction_type) <= MAX_TYPE_LENGTH
+
+def normalize_batch(batch, keys):
+    """Normalisiert einen Batch und liefert die Spalten für die Staging-Tabelle
+
+    keys enthält den Zielschlüssel je Zeile (user_id bzw. username) oder None
+    für unbekannte Benutzer. Gibt (Spalten, Typ-Wörterbuch) zurück; ungültige
+    Zeilen werden wie beim zeilenweisen Pfad mit Warnung übersprungen.
+    """
+    now_us = (datetime.now() - EPOCH) // MICROSECOND
+
+    # Schneller Pfad: ganze Spalten auf einmal (mit numpy vektorisiert)
+    timestamps = _vector_timestamps(batch.dates, now_us)
+    if timestamps is None:
+        timestamps = _convert_column(batch.dates, lambda value: _timestamp_to_us(value, now_us))
+    cents = _vector_cents(batch.amounts)
+    if cents is None:
+        cents = _convert_column(batch.amounts, _amount_to_cents)
+
+    # Wörterbuch-Kodierung: Codes beginnen wie WITH ORDINALITY bei 1
+    type_codes = {}
+
+    if (timestamps is not None and cents is not None and None not in keys
+            and all(_valid_type(name) for name in set(batch.types))):
+        codes = [type_codes.setdefault(name, len(type_codes) + 1) for name in batch.types]
+        columns = (list(keys), timestamps, cents, codes, batch.descriptions, batch.drink_names)
+        return columns, list(type_codes)
+
+    # Mindestens eine Zeile ist ungültig: Zeile für Zeile prüfen
+    columns = tuple([] for _ in STAGING_COLUMNS)
+    key_column, ts_column, cents_column, code_column, description_column, drink_column = columns
+
+    for i, username in enumerate(batch.usernames):
+        try:
+            key = keys[i]
+            if key is None:
+                raise KeyError(f"Unbekannter Benutzer {username!r}")
+            transaction_type = batch.types[i]
+            if not _valid_type(transaction_type):
+                raise ValueError(f"Ungültiger Transaktionstyp: {transaction_type!r}")
+            ts_us = timestamps[i] if timestamps is not None else _timestamp_to_us(batch.dates[i], now_us)
+            amount_cents = cents[i] if cents is not None else _amount_to_cents(batch.amounts[i])
+        except (ValueError, AttributeError, KeyError, TypeError, OverflowError) as e:
+            print(f"⚠️ Fehler beim Migrieren einer Transaktion für {username}: {e}")
+            continue
+
+        key_column.append(key)
+        ts_column.append(ts_us)
+        cents_column.append(amount_cents)
+        code_column.append(type_codes.setdefault(transaction_type, len(type_codes) + 1))
+        description_column.append(batch.descriptions[i])
+        drink_column.append(batch.drink_names[i])
+
+    return columns, list(type_codes)
+
+def iter_column_batches(source, entries, batch_size=DEFAULT_BATCH_SIZE):
+    """Sammelt rohe Einträge der Quelle in ColumnBatches zu je batch_size Zeilen"""
+    batch = ColumnBatch()
+    for entry in entries:
+        source.append_to_batch(batch, entry)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = ColumnBatch()
+    if len(batch):
+        yield batch
+
+def write_column_batches(cursor, source, entries, sink, batch_size=DEFAULT_BATCH_SIZE):
+    """Transformiert Einträge spaltenweise und lädt sie über eine Staging-Tabelle
+
+    Je Batch ein COPY in die Staging-Tabelle und ein INSERT ... SELECT, das
+    Epoch-Mikrosekunden, Cent-Beträge und Typ-Codes zurückwandelt.
+    Gibt die Anzahl geschriebener Zeilen zurück.
+    """
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+            seq BIGSERIAL,
+            key {sink.columnar_key_type} NOT NULL,
+            ts_us BIGINT NOT NULL,
+            cents BIGINT NOT NULL,
+            type_code SMALLINT NOT NULL,
+            description TEXT,
+            drink_name VARCHAR(255)
+        ) ON COMMIT DROP
+    """)
+    cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+
+    target_columns = ', '.join(sink.columnar_target_columns)
+    total = 0
+
+    for batch in iter_column_batches(source, entries, batch_size):
+        columns, type_names = normalize_batch(batch, sink.keys_for(batch.usernames))
+        if not columns[0]:
+            continue
+
+        if getattr(sink, 'partitioned', False):
+            # Monatspartitionen des Batches vor dem INSERT ... SELECT anlegen
+            sink.prepare_partitions(
+                cursor,
+                EPOCH + timedelta(microseconds=int(min(columns[1]))),
+                EPOCH + timedelta(microseconds=int(max(columns[1])))
+            )
+        copy_rows(cursor, STAGING_TABLE, STAGING_COLUMNS, zip(*columns), batch_size)
+        cursor.execute(f"""
+            INSERT INTO {sink.transaction_table} ({target_columns})
+            SELECT s.key,
+                   TIMESTAMP 'epoch' + s.ts_us * INTERVAL '1 microsecond',
+                   s.cents / 100.0,
+                   c.name,
+                   s.description,
+                   s.drink_name
+            FROM {STAGING_TABLE} s
+            JOIN unnest(%s::text[]) WITH ORDINALITY AS c(name, code) ON c.code = s.type_code
+            ORDER BY s.seq
+        """, (type_names,))
+        cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+        total += len(columns[0])
+
+    return total
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Gemeinsamer Datenbankzugriff für die Python-Werkzeuge der Getränkekasse
+database-config.json wird einmal je Prozess gelesen. Verbindungen kommen aus
+einem Pool je Verbindungsziel und werden nach Gebrauch zurückgegeben statt
+geschlossen, sodass ein Skript den Verbindungsaufbau nur einmal bezahlt.
+Vorübergehende Verbindungsfehler (Server startet neu, zu viele Verbindungen)
+werden mit wachsender Wartezeit wiederholt. Anweisungen, die je Zeile laufen,
+werden einmal je Verbindung serverseitig vorbereitet (PREPARE) und danach nur
+noch mit ihren Parametern ausgeführt.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import execute_batch
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+CONFIG_FILE = 'database-config.json'
+
+DEFAULT_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'database': 'getraenkekasse',
+    'user': 'getraenkekasse_user',
+    'password': 'getraenkekasse_password_2025'
+}
+
+# Offen gehaltene und maximal gleichzeitige Verbindungen je Ziel
+POOL_IDLE = 1
+POOL_SIZE = 8
+
+# Wartezeit auf eine freie Verbindung, wenn alle POOL_SIZE vergeben sind
+POOL_WAIT_SECONDS = 30
+POOL_POLL_SECONDS = 0.1
+
+# Verbindungsaufbau: Versuche und erste Wartezeit (verdoppelt sich je Versuch)
+CONNECT_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.5
+
+# EXECUTE-Aufrufe je Round Trip bei execute_prepared_batch
+PREPARED_PAGE_SIZE = 100
+
+# Verbindungsfehler, bei denen ein neuer Versuch nichts ändert
+PERMANENT_ERRORS = ('authentication', 'Authentifizierung', 'does not exist', 'existiert nicht')
+
+_PLACEHOLDER = re.compile(r'%\((\w+)\)s|%s')
+
+_config = None
+_pools = {}
+_pools_pid = os.getpid()
+# Von einem Elternprozess geerbte Pools: nie schließen, sonst beendet der
+# Kindprozess die Verbindungen des Elternprozesses mit
+_inherited = []
+_lock = threading.Lock()
+# Signalisiert release(), damit wartende connect()-Aufrufe weitermachen
+_released = threading.Condition()
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Verbindung, die sich ihren Pool und ihre vorbereiteten Anweisungen merkt"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_key = None
+        self.prepared = set()
+
+def load_config():
+    """Verbindungsdaten aus database-config.json, einmal je Prozess gelesen"""
+    global _config
+    if _config is None:
+        try:
+            with open(CONFIG_FILE, 'r') as file:
+                _config = json.load(file)['database']
+        except FileNotFoundError:
+            _config = dict(DEFAULT_CONFIG)
+    return dict(_config)
+
+def connect_kwargs(**overrides):
+    """Argumente für psycopg2.connect; None entfernt einen Eintrag (z.B. host für Unix-Socket)"""
+    kwargs = load_config()
+    kwargs.update(overrides)
+    return {key: value for key, value in kwargs.items() if value is not None}
+
+def _with_retries(action, attempts=CONNECT_ATTEMPTS):
+    """Wiederholt action bei Verbindungsfehlern mit wachsender Wartezeit"""
+    for attempt in range(attempts):
+        try:
+            return action()
+        except psycopg2.OperationalError as e:
+            if attempt == attempts - 1 or any(text in str(e) for text in PERMANENT_ERRORS):
+                raise
+            wait = BACKOFF_SECONDS * 2 ** attempt
+            print(f"⚠️ Verbindung fehlgeschlagen ({str(e).strip()}), neuer Versuch in {wait:.1f}s")
+            time.sleep(wait)
+
+def open_target(**kwargs):
+    """Eigene Verbindung genau mit kwargs, ohne database-config.json
+
+    Für Ziele, deren Verbindungsdaten nicht aus der Konfiguration stammen,
+    etwa temporäre Cluster oder Worker mit übergebenen Argumenten. Der
+    Aufrufer schließt sie selbst mit close().
+    """
+    return _with_retries(lambda: psycopg2.connect(**kwargs))
+
+def open_connection(**overrides):
+    """Eigene Verbindung außerhalb des Pools, z.B. für Schatten-Datenbanken
+
+    Der Aufrufer schließt sie selbst mit close().
+    """
+    return open_target(**connect_kwargs(**overrides))
+
+def _pool_for(kwargs):
+    global _pools, _pools_pid
+    key = tuple(sorted(kwargs.items()))
+    with _lock:
+        if _pools_pid != os.getpid():
+            _inherited.append(_pools)
+            _pools = {}
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _with_retries(lambda: ThreadedConnectionPool(
+                POOL_IDLE, POOL_SIZE, connection_factory=PooledConnection, **kwargs
+            ))
+            _pools[key] = pool
+    return key, pool
+
+def _usable(conn):
+    """Erkennt Verbindungen, die der Server inzwischen getrennt hat"""
+    if conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        conn.poll()
+    except psycopg2.Error:
+        return False
+    return True
+
+def _getconn(pool, timeout=POOL_WAIT_SECONDS):
+    """Holt eine Verbindung und wartet, solange der Pool ausgeschöpft ist"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return pool.getconn()
+        except PoolError:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolError(f"Keine freie Verbindung nach {timeout}s ({POOL_SIZE} vergeben)")
+            with _released:
+                _released.wait(min(remaining, POOL_POLL_SECONDS))
+
+def connect(**overrides):
+    """Verbindung aus dem Pool; zurückgeben mit release(conn)
+
+    Sind alle POOL_SIZE Verbindungen vergeben, wartet connect bis zu
+    POOL_WAIT_SECONDS auf eine zurückgegebene.
+    """
+    key, pool = _pool_for(connect_kwargs(**overrides))
+
+    def checkout():
+        conn = _getconn(pool)
+        if not _usable(conn):
+            pool.putconn(conn, close=True)
+            conn = _getconn(pool)
+        conn.pool_key = key
+        return conn
+
+    return _with_retries(checkout)
+
+def release(conn):
+    """Gibt eine Verbindung aus connect() in sauberem Zustand an den Pool zurück
+
+    Offene Transaktionen werden verworfen und Sitzungseinstellungen per
+    RESET ALL zurückgesetzt. Bewusst nicht conn.reset(): dessen DISCARD ALL
+    würde auch die vorbereiteten Anweisungen verwerfen, die conn.prepared
+    weiter als vorhanden führt.
+    """
+    pool = _pools.get(getattr(conn, 'pool_key', None)) if _pools_pid == os.getpid() else None
+    if pool is None:
+        conn.close()
+        return
+
+    broken = not _usable(conn)
+    if not broken:
+        try:
+            conn.rollback()
+            conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT',
+                             deferrable='DEFAULT', autocommit=False)
+            cursor = conn.cursor()
+            cursor.execute("RESET ALL")
+            cursor.close()
+            conn.commit()
+        except psycopg2.Error:
+            broken = True
+    if broken:
+        conn.prepared.clear()
+    pool.putconn(conn, close=broken)
+    with _released:
+        _released.notify()
+
+@contextmanager
+def connection(**overrides):
+    """with db_access.connection() as conn: ... – connect und release"""
+    conn = connect(**overrides)
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+def warm_up(**overrides):
+    """Baut die erste Verbindung vorab auf, damit sie in keinem Profil auftaucht"""
+    release(connect(**overrides))
+
+@atexit.register
+def close_all():
+    """Schließt alle Pools dieses Prozesses"""
+    global _pools
+    if _pools_pid != os.getpid():
+        return
+    for pool in _pools.values():
+        pool.closeall()
+    _pools = {}
+
+def _statement(sql):
+    """Name, Text mit $n und Parameterreihenfolge einer Anweisung mit %s bzw. %(name)s"""
+    names = []
+
+    def placeholder(match):
+        name = match.group(1)
+        if name is None:
+            names.append(len(names))
+            return f"${len(names)}"
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    text = _PLACEHOLDER.sub(placeholder, sql)
+    name = 'stmt_' + hashlib.md5(sql.encode('utf-8')).hexdigest()[:16]
+    return name, text, names
+
+def prepare(cursor, sql):
+    """Bereitet sql auf der Verbindung des Cursors vor (einmal je Verbindung)
+
+    Gibt (Name, Parameterreihenfolge) zurück. Verbindungen außerhalb des
+    Pools merken sich vorbereitete Anweisungen nicht selbst; für sie fragt
+    prepare pg_prepared_statements ab.
+    """
+    name, text, names = _statement(sql)
+    prepared = getattr(cursor.connection, 'prepared', None)
+    if prepared is not None and name in prepared:
+        return name, names
+
+    cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,))
+    if cursor.fetchone() is None:
+        cursor.execute(f"PREPARE {name} AS {text}")
+    if prepared is not None:
+        prepared.add(name)
+    return name, names
+
+def _execute_sql(name, count):
+    if not count:
+        return f"EXECUTE {name}"
+    return f"EXECUTE {name} ({', '.join(['%s'] * count)})"
+
+def _ordered(names, params):
+    if isinstance(params, dict):
+        return [params[name] for name in names]
+    return params
+
+def execute_prepared(cursor, sql, params=()):
+    """Führt sql als vorbereitete Anweisung aus; Parameter wie bei cursor.execute"""
+    name, names = prepare(cursor, sql)
+    cursor.execute(_execute_sql(name, len(names)), _ordered(names, params))
+
+def execute_prepared_batch(cursor, sql, rows, page_size=PREPARED_PAGE_SIZE):
+    """Führt sql für viele Parameterzeilen aus, page_size EXECUTE je Round Trip
+
+    rows wird seitenweise gelesen, sodass ein Generator nie ganz im Speicher
+    liegt. Gibt die Anzahl der Zeilen zurück.
+    """
+    name, names = prepare(cursor, sql)
+    statement = _execute_sql(name, len(names))
+    rows = iter(rows)
+    count = 0
+    while True:
+        page = [_ordered(names, row) for row in islice(rows, page_size)]
+        if not page:
+            return count
+        execute_batch(cursor, statement, page, page_size=page_size)
+        count += len(page)
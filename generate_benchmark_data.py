@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Erzeugt synthetische data.json-Dateien für Benchmarks der Getränkekasse
+Unterstützt beide Layouts: verschachtelt (consumption je Benutzer, wie
+data_backup_*.json) und flach (transactions-Liste, wie für migrate_simple.py).
+Die Datei wird benutzerweise geschrieben, sodass auch sehr große Dateien
+ohne großen Speicherbedarf entstehen.
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+
+LAYOUTS = ('nested', 'flat')
+
+# Verteilung der Transaktionstypen wie im echten Backup
+TRANSACTION_TYPES = (
+    ('purchase', 0.80),
+    ('deposit', 0.10),
+    ('transfer', 0.06),
+    ('withdraw', 0.04),
+)
+
+def _make_drinks(count, rng):
+    return [
+        {'name': f"Getränk {i + 1}", 'price': round(rng.uniform(0.5, 5.0), 2)}
+        for i in range(count)
+    ]
+
+def _make_transactions(rng, drinks, usernames, count, start, span_seconds):
+    """Erzeugt zeitlich sortierte Transaktionen eines Benutzers"""
+    types = [name for name, _ in TRANSACTION_TYPES]
+    weights = [weight for _, weight in TRANSACTION_TYPES]
+    offsets = sorted(rng.uniform(0, span_seconds) for _ in range(count))
+
+    for offset in offsets:
+        date = (start + timedelta(seconds=offset)).isoformat(timespec='milliseconds') + 'Z'
+        transaction_type = rng.choices(types, weights)[0]
+
+        if transaction_type == 'purchase':
+            drink = rng.choice(drinks)
+            yield date, -drink['price'], transaction_type, drink['name'], drink['name']
+        elif transaction_type == 'deposit':
+            yield date, float(rng.choice((5, 10, 20, 50))), transaction_type, 'Einzahlung', None
+        elif transaction_type == 'transfer':
+            amount = round(rng.uniform(1, 20), 2)
+            partner = rng.choice(usernames)
+            if rng.random() < 0.5:
+                yield date, amount, transaction_type, f"Erhalten von {partner}", None
+            else:
+                yield date, -amount, transaction_type, f"Überwiesen an {partner}", None
+        else:
+            yield date, -float(rng.choice((5, 10))), transaction_type, 'Auszahlung', None
+
+def generate(path, layout='nested', users=100, transactions_per_user=100, drinks=20,
+             days=365, seed=42):
+    """Schreibt eine synthetische Datei und liefert die Anzahl der Datensätze"""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unbekanntes Layout: {layout}")
+
+    rng = random.Random(seed)
+    drink_list = _make_drinks(max(drinks, 1), rng)
+    usernames = [f"user{i:06d}" for i in range(users)]
+    end = datetime(2025, 9, 1)
+    start = end - timedelta(days=days)
+    span_seconds = days * 86400
+
+    def transactions(username):
+        return _make_transactions(rng, drink_list, usernames, transactions_per_user, start, span_seconds)
+
+    def user_record(i, username):
+        return {
+            'username': username,
+            'pin': f"{i % 10000:04d}",
+            'balance': round(rng.uniform(-20, 200), 2)
+        }
+
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('{\n  "drinks": ')
+        file.write(json.dumps(drink_list, ensure_ascii=False))
+        file.write(',\n  "users": [')
+
+        if layout == 'nested':
+            for i, username in enumerate(usernames):
+                user = user_record(i, username)
+                user['consumption'] = [
+                    {'date': date, 'amount': amount, 'type': transaction_type, 'description': description}
+                    for date, amount, transaction_type, description, _ in transactions(username)
+                ]
+                file.write(',\n    ' if i else '\n    ')
+                file.write(json.dumps(user, ensure_ascii=False))
+            file.write('\n  ],\n')
+        else:
+            for i, username in enumerate(usernames):
+                user = user_record(i, username)
+                user['displayName'] = username.capitalize()
+                user['role'] = 'admin' if i == 0 else 'user'
+                file.write(',\n    ' if i else '\n    ')
+                file.write(json.dumps(user, ensure_ascii=False))
+            file.write('\n  ],\n  "transactions": [')
+
+            first = True
+            for username in usernames:
+                for date, amount, transaction_type, description, drink_name in transactions(username):
+                    transaction = {
+                        'username': username,
+                        'type': transaction_type,
+                        'amount': amount,
+                        'itemName': drink_name,
+                        'timestamp': date,
+                        'note': None if drink_name else description
+                    }
+                    file.write('\n    ' if first else ',\n    ')
+                    file.write(json.dumps(transaction, ensure_ascii=False))
+                    first = False
+            file.write('\n  ],\n')
+
+        file.write('  "admin": ')
+        file.write(json.dumps({'password': '9999', 'timersDisabled': True}))
+        file.write('\n}\n')
+
+    return {
+        'drinks': len(drink_list),
+        'users': users,
+        'transactions': users * transactions_per_user
+    }
+
+def add_generator_arguments(parser):
+    """Fügt die Größenparameter des Generators hinzu"""
+    parser.add_argument('--users', type=int, default=1000,
+                       help='Anzahl Benutzer (Standard: 1000)')
+    parser.add_argument('--transactions-per-user', type=int, default=100,
+                       help='Transaktionen je Benutzer (Standard: 100)')
+    parser.add_argument('--drinks', type=int, default=20,
+                       help='Anzahl Getränke (Standard: 20)')
+    parser.add_argument('--days', type=int, default=365,
+                       help='Zeitraum der Transaktionen in Tagen (Standard: 365)')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Startwert des Zufallsgenerators (Standard: 42)')
+
+def main():
+    parser = argparse.ArgumentParser(description='Erzeugt synthetische data.json-Dateien für Benchmarks')
+    parser.add_argument('output', help='Zieldatei, z.B. data.json')
+    parser.add_argument('--layout', choices=LAYOUTS, default='nested',
+                       help='nested: consumption je Benutzer, flat: transactions-Liste (Standard: nested)')
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    counts = generate(
+        args.output, args.layout, args.users, args.transactions_per_user,
+        args.drinks, args.days, args.seed
+    )
+    print(f"✅ {args.output}: {counts['users']} Benutzer, {counts['transactions']} Transaktionen, "
+          f"{counts['drinks']} Getränke ({args.layout})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Inkrementelle, inhaltsadressierte Backups für Getränkekasse
+transactions wird nur ab dem id-High-Water-Mark des letzten Backups gesichert,
+die kleinen Tabellen users, drinks und admin_settings jeweils vollständig.
+Der High-Water-Mark zählt nur ids, unter denen keine Transaktion der App mehr
+offen sein kann; darüber liest das nächste Backup erneut, der Restore nimmt
+je id die jüngste Kopie.
+Alle Teile landen komprimiert unter ihrem SHA-256 im Objektspeicher, sodass
+unveränderte Inhalte nur einmal abgelegt werden. Ein Manifest je Backup
+verweist auf seinen Vorgänger; ein Restore setzt einen beliebigen Stand aus
+der Kette wieder zusammen. Das Archiv (ledger_archive.py) wird in festen
+id-Bereichen vollständig gesichert; unveränderte Bereiche kosten dank
+Inhaltsadressierung nichts. Nach einer Archivierung beginnt eine neue Kette,
+weil archivierte Zeilen aus dem Journal verschwunden sind.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import datetime
+from shadow_restore import database_summary
+import ledger_archive
+
+DEFAULT_STORE = 'backups'
+
+# Vollständig gesicherte Tabellen (Reihenfolge = Restore-Reihenfolge wegen Fremdschlüsseln)
+FULL_TABLES = ('drinks', 'users', 'admin_settings')
+LEDGER_TABLE = 'transactions'
+
+# Breite der id-Bereiche, in die transactions zerlegt wird
+CHUNK_IDS = 100000
+
+# Breite der id-Bereiche des Archivs (eine Zeile je Benutzer und Monat)
+ARCHIVE_CHUNK_IDS = 1000
+
+# Wartezeit auf offene Transaktionen, bevor der High-Water-Mark vorrückt
+SETTLE_SECONDS = 10
+SETTLE_POLL_SECONDS = 0.2
+
+class BackupStore:
+    """Objektspeicher (objects/) und Manifeste (manifests/) eines Backup-Verzeichnisses"""
+
+    def __init__(self, root=DEFAULT_STORE):
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        self.manifests = os.path.join(root, 'manifests')
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], f"{digest}.gz")
+
+    def put(self, content):
+        """Legt Inhalt ab und liefert (Hash, neu geschrieben, Bytes auf der Platte)"""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest, False, 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with gzip.open(temp_path, 'wb') as file:
+            file.write(content)
+        os.replace(temp_path, path)
+        return digest, True, os.path.getsize(path)
+
+    def get(self, digest):
+        with gzip.open(self._object_path(digest), 'rb') as file:
+            content = file.read()
+        if hashlib.sha256(content).hexdigest() != digest:
+            raise ValueError(f"Objekt {digest} ist beschädigt")
+        return content
+
+    def manifest_path(self, name):
+        return os.path.join(self.manifests, f"{name}.json")
+
+    def list_manifests(self):
+        if not os.path.isdir(self.manifests):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.manifests) if name.endswith('.json'))
+
+    def load_manifest(self, name):
+        with open(self.manifest_path(name), 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def save_manifest(self, manifest):
+        os.makedirs(self.manifests, exist_ok=True)
+        path = self.manifest_path(manifest['name'])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(temp_path, path)
+        return path
+
+    def chain(self, name):
+        """Manifeste vom ersten Voll-Backup bis einschließlich name"""
+        manifests = []
+        while name:
+            manifest = self.load_manifest(name)
+            manifests.append(manifest)
+            name = manifest.get('parent')
+        return list(reversed(manifests))
+
+def _table_columns(cursor, table):
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+def _copy_out(cursor, query):
+    buffer = io.BytesIO()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT", buffer)
+    return buffer.getvalue()
+
+def _committed_mark(conn, timeout=SETTLE_SECONDS):
+    """Höchste id, unter der keine offene Transaktion mehr Zeilen einfügen kann
+
+    Eine id wird beim INSERT vergeben, committet aber erst mit ihrer
+    Transaktion; eine kleinere id kann also nach dem Snapshot sichtbar werden.
+    Nach dem Lesen von MAX(id) wird gewartet, bis alle Transaktionen, die
+    davor begonnen haben, beendet sind. Alles bis zu dieser id ist dann im
+    folgenden Snapshot sichtbar. Gibt None zurück, wenn das nicht innerhalb
+    von timeout Sekunden geschieht.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0), clock_timestamp() FROM {LEDGER_TABLE}")
+    mark, read_at = cursor.fetchone()
+    conn.rollback()
+
+    deadline = time.monotonic() + timeout
+    while True:
+        cursor.execute("""
+            SELECT COUNT(*) FROM pg_stat_activity
+            WHERE datname = current_database() AND pid <> pg_backend_pid()
+              AND backend_type = 'client backend'
+              AND xact_start < %s
+        """, (read_at,))
+        running = cursor.fetchone()[0]
+        conn.rollback()
+        if not running:
+            cursor.close()
+            return mark
+        if time.monotonic() >= deadline:
+            cursor.close()
+            return None
+        time.sleep(SETTLE_POLL_SECONDS)
+
+def create_incremental_backup(conn, store):
+    """Sichert alle Änderungen seit dem letzten Manifest und liefert das neue Manifest
+
+    Alle Tabellen werden in einer REPEATABLE READ-Transaktion gelesen und
+    bilden damit einen konsistenten Stand. Gesichert werden alle sichtbaren
+    Transaktionen oberhalb des High-Water-Marks des Vorgängers; der neue
+    High-Water-Mark rückt nur bis _committed_mark vor.
+    """
+    previous = store.list_manifests()
+    parent = store.load_manifest(previous[-1]) if previous else None
+
+    committed_mark = _committed_mark(conn)
+    if committed_mark is None:
+        print(f"⚠️ Offene Transaktionen nach {SETTLE_SECONDS}s, High-Water-Mark bleibt stehen")
+
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    cursor = conn.cursor()
+
+    archived = ledger_archive.has_archive(cursor)
+    archive_mark = 0
+    if archived:
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {ledger_archive.ARCHIVE_TABLE}")
+        archive_mark = cursor.fetchone()[0]
+    if parent and parent.get('archive_mark', 0) != archive_mark:
+        # Seit dem letzten Backup wurde archiviert: neue Kette mit vollem Journal
+        parent = None
+    high_water_mark = parent['high_water_mark'] if parent else 0
+
+    manifest = {
+        'name': datetime.now().strftime('%Y%m%d_%H%M%S_%f'),
+        'created_at': datetime.now().isoformat(),
+        'parent': parent['name'] if parent else None,
+        'tables': {},
+        'columns': {},
+        'transactions': [],
+    }
+    stats = {'objects_written': 0, 'objects_reused': 0, 'bytes_written': 0}
+
+    def store_content(content):
+        digest, written, size = store.put(content)
+        stats['objects_written' if written else 'objects_reused'] += 1
+        stats['bytes_written'] += size
+        return digest
+
+    for table in FULL_TABLES:
+        columns = _table_columns(cursor, table)
+        manifest['columns'][table] = columns
+        content = _copy_out(cursor, f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+        manifest['tables'][table] = store_content(content)
+
+    columns = _table_columns(cursor, LEDGER_TABLE)
+    manifest['columns'][LEDGER_TABLE] = columns
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {LEDGER_TABLE}")
+    max_id = cursor.fetchone()[0]
+
+    # Nur Zeilen oberhalb des High-Water-Marks, zerlegt in feste id-Bereiche
+    first_id = high_water_mark
+    while first_id < max_id:
+        last_id = min(first_id + CHUNK_IDS, max_id)
+        content = _copy_out(cursor, (
+            f"SELECT {', '.join(columns)} FROM {LEDGER_TABLE} "
+            f"WHERE id > {int(first_id)} AND id <= {int(last_id)} ORDER BY id"
+        ))
+        if content:
+            manifest['transactions'].append({
+                'object': store_content(content),
+                'first_id': first_id + 1,
+                'last_id': last_id,
+                'rows': content.count(b'\n')
+            })
+        first_id = last_id
+
+    # Nur ids, die dieser Snapshot sicher vollständig sieht; darüber liest
+    # das nächste Backup noch einmal
+    if committed_mark is not None:
+        high_water_mark = max(high_water_mark, min(committed_mark, max_id))
+    manifest['high_water_mark'] = high_water_mark
+    manifest['max_id'] = max_id
+
+    if archived:
+        columns = _table_columns(cursor, ledger_archive.ARCHIVE_TABLE)
+        manifest['columns'][ledger_archive.ARCHIVE_TABLE] = columns
+        manifest['archive'] = [
+            store_content(_copy_out(cursor, (
+                f"SELECT {', '.join(columns)} FROM {ledger_archive.ARCHIVE_TABLE} "
+                f"WHERE id > {first_id} AND id <= {first_id + ARCHIVE_CHUNK_IDS} ORDER BY id"
+            )))
+            for first_id in range(0, archive_mark, ARCHIVE_CHUNK_IDS)
+        ]
+    manifest['archive_mark'] = archive_mark
+    manifest['stats'] = stats
+    # Sollwerte für die Prüfung eines Restores aus demselben Snapshot
+    manifest['summary'] = database_summary(cursor)
+
+    conn.rollback()
+    conn.set_session(isolation_level='DEFAULT', readonly=False)
+    cursor.close()
+
+    store.save_manifest(manifest)
+    return manifest
+
+def restore_incremental_backup(conn, store, name):
+    """Stellt den Stand des Manifests name aus der Backup-Kette wieder her
+
+    Die Tabellen werden geleert und in einer Transaktion neu befüllt; die
+    id-Sequenzen werden anschließend nachgezogen. Gibt (Tabellen, Transaktionen)
+    als Zeilenzahlen zurück.
+    """
+    chain = store.chain(name)
+    target = chain[-1]
+    cursor = conn.cursor()
+
+    cursor.execute(f"TRUNCATE {LEDGER_TABLE}, {', '.join(FULL_TABLES)} RESTART IDENTITY CASCADE")
+    if ledger_archive.has_archive(cursor):
+        cursor.execute(f"TRUNCATE {ledger_archive.ARCHIVE_TABLE} RESTART IDENTITY")
+
+    table_rows = 0
+    for table in FULL_TABLES:
+        content = store.get(target['tables'][table])
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(target['columns'][table])}) FROM STDIN",
+            io.BytesIO(content)
+        )
+        table_rows += content.count(b'\n')
+
+    # Chunks aller Backups der Kette über eine Staging-Tabelle einspielen;
+    # restore_order merkt sich das Backup, damit je id die jüngste Kopie zählt
+    cursor.execute(f"CREATE TEMP TABLE restore_{LEDGER_TABLE} (LIKE {LEDGER_TABLE}) ON COMMIT DROP")
+    cursor.execute(f"ALTER TABLE restore_{LEDGER_TABLE} ADD COLUMN restore_order integer")
+    for order, manifest in enumerate(chain):
+        cursor.execute(f"ALTER TABLE restore_{LEDGER_TABLE} ALTER COLUMN restore_order SET DEFAULT {order}")
+        columns = ', '.join(manifest['columns'][LEDGER_TABLE])
+        for chunk in manifest['transactions']:
+            cursor.copy_expert(
+                f"COPY restore_{LEDGER_TABLE} ({columns}) FROM STDIN",
+                io.BytesIO(store.get(chunk['object']))
+            )
+    cursor.execute(f"SELECT COUNT(DISTINCT id) FROM restore_{LEDGER_TABLE}")
+    staged_rows = cursor.fetchone()[0]
+
+    # Transaktionen inzwischen gelöschter Benutzer entfallen wie bei ON DELETE CASCADE
+    columns = ', '.join(target['columns'][LEDGER_TABLE])
+    cursor.execute(f"""
+        INSERT INTO {LEDGER_TABLE} ({columns})
+        SELECT {columns} FROM (
+            SELECT DISTINCT ON (id) * FROM restore_{LEDGER_TABLE}
+            ORDER BY id, restore_order DESC
+        ) r
+        WHERE r.user_id IS NULL OR EXISTS (SELECT 1 FROM users u WHERE u.id = r.user_id)
+    """)
+    transaction_rows = cursor.rowcount
+    if transaction_rows < staged_rows:
+        print(f"⚠️ {staged_rows - transaction_rows} Transaktionen gelöschter Benutzer übersprungen")
+
+    if target.get('archive'):
+        ledger_archive.install_archive(cursor)
+        columns = ', '.join(target['columns'][ledger_archive.ARCHIVE_TABLE])
+        for digest in target['archive']:
+            cursor.copy_expert(
+                f"COPY {ledger_archive.ARCHIVE_TABLE} ({columns}) FROM STDIN",
+                io.BytesIO(store.get(digest))
+            )
+        cursor.execute(f"""
+            SELECT setval(pg_get_serial_sequence('{ledger_archive.ARCHIVE_TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false)
+            FROM {ledger_archive.ARCHIVE_TABLE}
+        """)
+
+    for table in FULL_TABLES + (LEDGER_TABLE,):
+        cursor.execute(f"""
+            SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false)
+            FROM {table}
+        """)
+
+    conn.commit()
+    cursor.close()
+    return table_rows, transaction_rows
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Idempotente, inkrementelle Re-Migration für Getränkekasse
+Lädt nur consumption-Einträge ab dem High-Water-Mark (letztes transaction_date)
+je Benutzer und gleicht sie über den natürlichen Schlüssel
+(user_id, transaction_date, amount, transaction_type, description) mit dem
+Bestand ab, sodass ein erneuter Lauf keine Zeilen verdoppelt.
+"""
+
+from bulk_load import DEFAULT_BATCH_SIZE, copy_rows
+
+INCOMING_COLUMNS = (
+    'user_id', 'transaction_date', 'amount',
+    'transaction_type', 'description', 'drink_name'
+)
+
+def load_high_water_marks(cursor):
+    """Liefert user_id -> letztes transaction_date aus dem Bestand"""
+    cursor.execute("""
+        SELECT user_id, MAX(transaction_date)
+        FROM transactions
+        GROUP BY user_id
+    """)
+    return dict(cursor.fetchall())
+
+def migrate_consumption_incrementally(cursor, rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Übernimmt nur neue Transaktionen
+
+    rows liefert Zeilen in der Spaltenreihenfolge von INCOMING_COLUMNS.
+    Einträge vor dem High-Water-Mark des Benutzers werden schon beim Lesen
+    verworfen. Die übrigen landen per COPY in einer Staging-Tabelle und werden
+    mit einem einzigen INSERT ... SELECT gegen den Bestand abgeglichen. Dabei
+    zählen Vorkommen je natürlichem Schlüssel, damit echte Doppelbuchungen
+    (gleicher Zeitpunkt, gleicher Betrag) erhalten bleiben.
+    Gibt (neu eingefügt, bereits vorhanden) zurück.
+    """
+    high_water_marks = load_high_water_marks(cursor)
+    skipped = 0
+
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS incoming_transactions (
+            seq BIGSERIAL,
+            user_id INTEGER NOT NULL,
+            transaction_date TIMESTAMP NOT NULL,
+            amount DECIMAL(10,2) NOT NULL,
+            transaction_type VARCHAR(50) NOT NULL,
+            description TEXT,
+            drink_name VARCHAR(255)
+        ) ON COMMIT DROP
+    """)
+    cursor.execute("TRUNCATE incoming_transactions")
+
+    def candidate_rows():
+        nonlocal skipped
+        for row in rows:
+            # Gleichstand am High-Water-Mark entscheidet der Schlüsselabgleich
+            high_water_mark = high_water_marks.get(row[0])
+            if high_water_mark is not None and row[1] < high_water_mark:
+                skipped += 1
+                continue
+            yield row
+
+    candidates = copy_rows(
+        cursor, 'incoming_transactions', INCOMING_COLUMNS, candidate_rows(), batch_size
+    )
+    cursor.execute("ANALYZE incoming_transactions")
+
+    cursor.execute("""
+        WITH incoming AS (
+            SELECT s.*,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY user_id, transaction_date, amount, transaction_type, description
+                       ORDER BY seq
+                   ) AS occurrence
+            FROM incoming_transactions s
+        ),
+        existing AS (
+            SELECT t.user_id, t.transaction_date, t.amount, t.transaction_type, t.description,
+                   COUNT(*) AS copies
+            FROM transactions t
+            WHERE t.user_id IN (SELECT DISTINCT user_id FROM incoming_transactions)
+              AND t.transaction_date >= (SELECT MIN(transaction_date) FROM incoming_transactions)
+            GROUP BY t.user_id, t.transaction_date, t.amount, t.transaction_type, t.description
+        )
+        INSERT INTO transactions
+        (user_id, transaction_date, amount, transaction_type, description, drink_name)
+        SELECT i.user_id, i.transaction_date, i.amount, i.transaction_type, i.description, i.drink_name
+        FROM incoming i
+        LEFT JOIN existing e
+               ON e.user_id = i.user_id
+              AND e.transaction_date = i.transaction_date
+              AND e.amount = i.amount
+              AND e.transaction_type = i.transaction_type
+              AND e.description IS NOT DISTINCT FROM i.description
+        WHERE i.occurrence > COALESCE(e.copies, 0)
+    """)
+    inserted = cursor.rowcount
+
+    cursor.execute("TRUNCATE incoming_transactions")
+    return inserted, skipped + candidates - inserted
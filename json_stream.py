@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Streamender JSON-Reader für data.json und data_backup_*.json
+Liefert Getränke, Benutzer und consumption-Einträge einzeln, ohne die
+ganze Datei in den Speicher zu laden
+"""
+
+import json
+import re
+
+# Zeichen pro Lesevorgang
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_NUMBER_TAIL = re.compile(r'[0-9.eE+\-]*')
+
+class JsonStreamReader:
+    """Inkrementeller Pull-Parser über einer Textdatei
+
+    Hält nur den aktuell benötigten Ausschnitt der Datei im Puffer.
+    Fehler werden wie bei json.load als json.JSONDecodeError gemeldet.
+    """
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Liest den nächsten Block und verwirft bereits verarbeiteten Text"""
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _error(self, message):
+        return json.JSONDecodeError(message, self.buf, self.pos)
+
+    def peek(self):
+        """Überspringt Leerzeichen und liefert das nächste Zeichen ('' am Ende)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error(f"Expecting '{char}'")
+        self.pos += 1
+
+    def _string_end(self):
+        """Liefert (Text, Ende) des Strings, der an self.pos beginnt"""
+        while True:
+            try:
+                return json.decoder.scanstring(self.buf, self.pos + 1)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+
+    def read_string(self):
+        if self.peek() != '"':
+            raise self._error("Expecting property name enclosed in double quotes")
+        text, self.pos = self._string_end()
+        return text
+
+    def read_value(self):
+        """Liest einen vollständigen (kleinen) JSON-Wert"""
+        while True:
+            self.peek()
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # Eine Zahl am Pufferende könnte abgeschnitten sein ("8." von "8.5")
+            if _NUMBER_TAIL.match(self.buf, end).end() == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        """Überspringt einen Wert, ohne Python-Objekte aufzubauen"""
+        if self.peek() not in ('[', '{'):
+            self.read_value()
+            return
+
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self._fill():
+                    raise self._error("Unexpected end of data")
+                continue
+
+            char = match.group()
+            self.pos = match.start()
+            if char == '"':
+                _, self.pos = self._string_end()
+                continue
+
+            self.pos += 1
+            if char in '[{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def iter_array(self):
+        """Positioniert den Reader nacheinander auf jedem Array-Element
+
+        Der Aufrufer muss das Element vor dem nächsten Schritt konsumieren.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise self._error("Expecting ',' delimiter")
+
+    def iter_object(self):
+        """Liefert nacheinander die Schlüssel eines Objekts
+
+        Der Aufrufer muss den zugehörigen Wert vor dem nächsten Schritt konsumieren.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read_string()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise self._error("Expecting ',' delimiter")
+
+def _iter_user(reader, kinds, username_filter=None):
+    """Liefert die consumption-Einträge und zuletzt den Benutzer selbst"""
+    user = {}
+    pending = []
+
+    def wanted():
+        return username_filter is None or username_filter(user['username'])
+
+    for key in reader.iter_object():
+        if key != 'consumption':
+            user[key] = reader.read_value()
+            if pending and 'username' in user:
+                if wanted():
+                    for entry in pending:
+                        yield 'consumption', (user['username'], entry)
+                pending = []
+            continue
+
+        if 'consumption' not in kinds or ('username' in user and not wanted()):
+            reader.skip_value()
+            continue
+
+        for _ in reader.iter_array():
+            entry = reader.read_value()
+            if 'username' in user:
+                yield 'consumption', (user['username'], entry)
+            else:
+                # Nur falls username in der Datei erst nach consumption steht
+                pending.append(entry)
+
+    if 'user' in kinds and wanted():
+        yield 'user', user
+
+def iter_records(path, kinds=('drink', 'user', 'consumption', 'transaction', 'admin'),
+                 username_filter=None):
+    """Liefert (Art, Datensatz)-Paare aus einer data.json-Datei
+
+    Arten: 'drink', 'user' (ohne consumption), 'consumption' als
+    (username, Eintrag), 'transaction' (flaches Layout) und 'admin'.
+    Nicht angeforderte Bereiche werden übersprungen, ohne sie zu parsen.
+    Mit username_filter werden nur Benutzer geliefert, für die der Filter
+    True ergibt; die consumption-Listen aller anderen werden übersprungen.
+    """
+    kinds = set(kinds)
+
+    with open(path, 'r', encoding='utf-8') as file:
+        reader = JsonStreamReader(file)
+
+        for key in reader.iter_object():
+            if key == 'drinks' and 'drink' in kinds:
+                for _ in reader.iter_array():
+                    yield 'drink', reader.read_value()
+            elif key == 'users' and kinds & {'user', 'consumption'}:
+                for _ in reader.iter_array():
+                    yield from _iter_user(reader, kinds, username_filter)
+            elif key == 'transactions' and 'transaction' in kinds:
+                for _ in reader.iter_array():
+                    yield 'transaction', reader.read_value()
+            elif key == 'admin' and 'admin' in kinds:
+                yield 'admin', reader.read_value()
+            else:
+                reader.skip_value()
+
+        if reader.peek() != '':
+            raise reader._error("Extra data")
+
+class StreamingDataFile:
+    """Generator-basierter Zugriff auf eine data.json-Datei
+
+    Jede Methode ist ein eigener Durchlauf über die Datei, der Speicherbedarf
+    bleibt damit unabhängig von der Dateigröße.
+    """
+
+    def __init__(self, path, username_filter=None):
+        self.path = path
+        self.username_filter = username_filter
+
+    def _records(self, *kinds):
+        return iter_records(self.path, kinds, self.username_filter)
+
+    def check(self):
+        """Prüft die komplette Datei auf gültiges JSON, ohne sie festzuhalten"""
+        for _ in iter_records(self.path):
+            pass
+
+    def drinks(self):
+        for _, drink in self._records('drink'):
+            yield drink
+
+    def users(self):
+        """Benutzer ohne consumption-Liste"""
+        for _, user in self._records('user'):
+            yield user
+
+    def consumption(self):
+        """(username, Eintrag)-Paare aus den consumption-Listen aller Benutzer"""
+        for _, item in self._records('consumption'):
+            yield item
+
+    def transactions(self):
+        """Transaktionen aus dem flachen Layout (migrate_simple.py)"""
+        for _, transaction in self._records('transaction'):
+            yield transaction
+
+    def admin(self):
+        admin = {}
+        for _, settings in self._records('admin'):
+            admin.update(settings)
+        return admin
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Archivierung alter Transaktionen für Getränkekasse
+archive_before verschiebt alle Transaktionen vor einem Stichtag aus
+transactions nach transactions_archive: je Benutzer und Monat eine Zeile mit
+Anzahl, Summe und den Transaktionen als JSON-Array, das PostgreSQL per TOAST
+komprimiert speichert. An ihre Stelle tritt je Benutzer eine einzige
+Eröffnungsbuchung (opening_balance) über die archivierte Summe, sodass
+SUM(amount) je Benutzer und damit Guthaben und Abgleich exakt bleiben. Die
+heiße Tabelle enthält danach nur noch die jüngere Historie; Export und
+Statistik setzen Archiv und Journal auf Wunsch wieder zusammen.
+"""
+
+import time
+import db_access
+import ledger_partitions
+
+ARCHIVE_TABLE = 'transactions_archive'
+
+# Typ der Eröffnungsbuchung, die archivierte Transaktionen zusammenfasst
+OPENING_TYPE = 'opening_balance'
+
+# Benutzer-ids je Archivierungs-Transaktion
+CHUNK_USERS = 1000
+
+ARCHIVE_TABLES = f"""
+    CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        month DATE NOT NULL,
+        transactions INTEGER NOT NULL,
+        amount DECIMAL(14,2) NOT NULL,
+        rows JSON NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITH (toast_tuple_target = 128);
+    CREATE INDEX IF NOT EXISTS idx_{ARCHIVE_TABLE}_month ON {ARCHIVE_TABLE} (month);
+    CREATE INDEX IF NOT EXISTS idx_{ARCHIVE_TABLE}_user_month ON {ARCHIVE_TABLE} (user_id, month);
+"""
+
+# Ein id-Bereich in einer Anweisung: Zeilen entfernen, je Benutzer und Monat
+# archivieren und die Eröffnungsbuchung um die archivierte Summe fortschreiben
+ARCHIVE_CHUNK = f"""
+    WITH moved AS (
+        DELETE FROM transactions
+        WHERE user_id BETWEEN %(low)s AND %(high)s
+          AND transaction_date < %(before)s
+          AND transaction_type <> '{OPENING_TYPE}'
+        RETURNING *
+    ), packed AS (
+        INSERT INTO {ARCHIVE_TABLE} (user_id, month, transactions, amount, rows)
+        SELECT user_id, date_trunc('month', transaction_date)::date, COUNT(*), SUM(amount),
+               json_agg(json_build_object(
+                   'id', id, 'transaction_date', transaction_date, 'amount', amount,
+                   'transaction_type', transaction_type, 'description', description,
+                   'drink_name', drink_name, 'created_at', created_at
+               ) ORDER BY transaction_date, id)
+        FROM moved
+        GROUP BY 1, 2
+        RETURNING user_id, transactions, amount
+    ), archived AS (
+        SELECT user_id, SUM(transactions) AS transactions, SUM(amount) AS amount
+        FROM packed
+        GROUP BY user_id
+    ), previous AS (
+        DELETE FROM transactions o
+        USING archived a
+        WHERE o.user_id = a.user_id AND o.transaction_type = '{OPENING_TYPE}'
+        RETURNING o.user_id, o.transaction_date, o.amount
+    ), opening AS (
+        INSERT INTO transactions (user_id, transaction_date, amount, transaction_type, description)
+        SELECT a.user_id,
+               GREATEST(%(before)s::timestamp, MAX(p.transaction_date)),
+               a.amount + COALESCE(SUM(p.amount), 0),
+               '{OPENING_TYPE}', %(description)s
+        FROM archived a
+        LEFT JOIN previous p ON p.user_id = a.user_id
+        GROUP BY a.user_id, a.amount
+        RETURNING user_id
+    )
+    SELECT (SELECT COUNT(*) FROM opening), COALESCE(SUM(transactions), 0), COALESCE(SUM(amount), 0)
+    FROM archived
+"""
+
+# Archivierte Transaktionen als Zeilen mit den Spalten von transactions
+ARCHIVE_ROWS = f"""
+    SELECT r.id, a.user_id, r.transaction_date, r.amount, r.transaction_type,
+           r.description, r.drink_name, r.created_at
+    FROM {ARCHIVE_TABLE} a
+    CROSS JOIN LATERAL json_to_recordset(a.rows) AS r(
+        id INTEGER, transaction_date TIMESTAMP, amount DECIMAL(10,2), transaction_type VARCHAR(50),
+        description TEXT, drink_name VARCHAR(255), created_at TIMESTAMP
+    )
+"""
+
+def install_archive(cursor):
+    """Legt die Archivtabelle an (idempotent, der Aufrufer committet)"""
+    cursor.execute(ARCHIVE_TABLES)
+
+def has_archive(cursor):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (ARCHIVE_TABLE,))
+    return cursor.fetchone()[0]
+
+def stitched_ledger():
+    """Unterabfrage mit Journal und Archiv ohne Eröffnungsbuchungen
+
+    Liefert dieselben Spalten wie transactions und lässt sich überall statt
+    des Tabellennamens einsetzen. Bewusst keine View, damit das Umbenennen
+    von transactions (ledger_partitions) sie nicht mitnimmt.
+    """
+    return f"""(
+        SELECT id, user_id, transaction_date, amount, transaction_type,
+               description, drink_name, created_at
+        FROM transactions
+        WHERE transaction_type <> '{OPENING_TYPE}'
+        UNION ALL
+        {ARCHIVE_ROWS}
+    )"""
+
+def _drop_empty_partitions(cursor, before):
+    """Entfernt leere Monatspartitionen, die vollständig vor dem Stichtag liegen"""
+    if not ledger_partitions.is_partitioned(cursor):
+        return []
+    dropped = []
+    for month in sorted(ledger_partitions.existing_months(cursor)):
+        if ledger_partitions.next_month(month) > before:
+            break
+        name = ledger_partitions.partition_name(month)
+        cursor.execute(f"SELECT 1 FROM {name} LIMIT 1")
+        if cursor.fetchone() is None:
+            cursor.execute(f"ALTER TABLE {ledger_partitions.LEDGER_TABLE} DETACH PARTITION {name}")
+            cursor.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+    return dropped
+
+def archive_before(connect_kwargs, before, chunk_users=CHUNK_USERS):
+    """Archiviert alle Transaktionen vor before (date) in Bereichen von Benutzer-ids
+
+    Jeder Bereich ist eine eigene Transaktion, sodass Sperren kurz bleiben und
+    ein Abbruch nur den laufenden Bereich verwirft. Danach werden leere alte
+    Monatspartitionen entfernt bzw. transactions per VACUUM für neue Zeilen
+    freigegeben. Gibt ein Dict mit Benutzern, Transaktionen, Summe,
+    entfernten Partitionen und Dauer zurück.
+    """
+    start = time.perf_counter()
+    conn = db_access.connect(**connect_kwargs)
+    try:
+        cursor = conn.cursor()
+        install_archive(cursor)
+        cursor.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM users")
+        min_id, max_id = cursor.fetchone()
+        conn.commit()
+
+        params = {'before': before, 'description': f"Saldo vor {before.isoformat()} (archiviert)"}
+        users = transactions = 0
+        amount = 0
+        for low in range(min_id, max_id + 1, chunk_users):
+            params.update(low=low, high=min(low + chunk_users - 1, max_id))
+            cursor.execute(ARCHIVE_CHUNK, params)
+            chunk_users_archived, chunk_transactions, chunk_amount = cursor.fetchone()
+            conn.commit()
+            users += chunk_users_archived
+            transactions += chunk_transactions
+            amount += chunk_amount
+            if chunk_transactions:
+                print(f"  📦 Benutzer-ids bis {params['high']}: {chunk_transactions} Transaktionen archiviert")
+
+        dropped = _drop_empty_partitions(cursor, before)
+        conn.commit()
+        cursor.close()
+
+        # Freigewordenen Platz wiederverwenden statt die Tabelle wachsen zu lassen
+        if transactions:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute("VACUUM ANALYZE transactions")
+            cursor.close()
+    finally:
+        db_access.release(conn)
+
+    return {
+        'users': users,
+        'transactions': transactions,
+        'amount': amount,
+        'dropped_partitions': dropped,
+        'seconds': time.perf_counter() - start
+    }
+
+def archive_summary(cursor):
+    """Zählt archivierte Transaktionen je Typ und Käufe je Getränk
+
+    Gibt (Anzahl, {Typ: Anzahl}, {Getränk: Käufe}) zurück; ohne Archiv leer.
+    """
+    if not has_archive(cursor):
+        return 0, {}, {}
+    cursor.execute(f"""
+        SELECT r.transaction_type, r.drink_name, COUNT(*)
+        FROM ({ARCHIVE_ROWS}) r
+        GROUP BY r.transaction_type, r.drink_name
+    """)
+    total = 0
+    types = {}
+    drinks = {}
+    for transaction_type, drink_name, count in cursor.fetchall():
+        total += count
+        types[transaction_type] = types.get(transaction_type, 0) + count
+        if transaction_type == 'purchase' and drink_name is not None:
+            drinks[drink_name] = drinks.get(drink_name, 0) + count
+    return total, types, drinks
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Monatliche Range-Partitionierung von transactions für Getränkekasse
+transactions wird nach transaction_date in Monatspartitionen
+(transactions_JJJJ_MM) zerlegt, dazu eine Default-Partition für Zeilen
+außerhalb der angelegten Monate. ensure_partitions legt künftige Monate an und
+verschiebt gestrandete Zeilen aus der Default-Partition in ihren Monat.
+migrate_to_partitioned baut eine bestehende, unpartitionierte Tabelle im
+laufenden Betrieb um: Spiegel-Trigger, Backfill in id-Bereichen und ein kurzer
+Tausch per Umbenennung.
+"""
+
+import re
+import time
+from datetime import date, datetime, timedelta
+
+LEDGER_TABLE = 'transactions'
+DEFAULT_PARTITION = 'transactions_default'
+
+# Monate, die über den aktuellen hinaus vorab angelegt werden
+MONTHS_AHEAD = 3
+
+# Zeilen pro Backfill-Transaktion bei der Online-Migration
+BACKFILL_IDS = 100000
+
+_INDEX_DEFINITION = re.compile(r'^CREATE INDEX (\S+) ON (?:ONLY )?(\S+) (.*)$', re.DOTALL)
+
+# Zeitlimit für die exklusive Sperre beim Umschalten
+SWAP_LOCK_TIMEOUT = '5s'
+
+def partition_name(month):
+    return f"{LEDGER_TABLE}_{month:%Y_%m}"
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def is_partitioned(cursor, table=LEDGER_TABLE):
+    cursor.execute("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = %s AND c.relnamespace = to_regnamespace(current_schema())
+    """, (table,))
+    return cursor.fetchone() is not None
+
+def existing_months(cursor, table=LEDGER_TABLE):
+    """Monate, für die bereits eine Partition existiert"""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s AND p.relnamespace = to_regnamespace(current_schema())
+    """, (table,))
+    months = set()
+    for (name,) in cursor.fetchall():
+        try:
+            months.add(datetime.strptime(name[len(table) + 1:], '%Y_%m').date())
+        except ValueError:
+            continue  # Default-Partition
+    return months
+
+def ledger_months(cursor, table=LEDGER_TABLE, default=DEFAULT_PARTITION):
+    """Alle Monate mit Partition oder mit Zeilen in der Default-Partition, sortiert
+
+    Abfragen mit den Grenzen eines dieser Monate lesen nur seine Partition.
+    """
+    months = existing_months(cursor, table)
+    cursor.execute(f"SELECT DISTINCT date_trunc('month', transaction_date)::date FROM {default}")
+    months.update(month for (month,) in cursor.fetchall())
+    return sorted(months)
+
+def _bound_clause(first, end):
+    # Partitionsgrenzen müssen (vor PostgreSQL 12) reine Literale sein
+    return f"FOR VALUES FROM ('{first.isoformat()}') TO ('{end.isoformat()}')"
+
+def _create_month(cursor, month, table=LEDGER_TABLE, default=DEFAULT_PARTITION):
+    """Legt die Partition eines Monats an und holt ihre Zeilen aus der Default-Partition"""
+    name = partition_name(month) if table == LEDGER_TABLE else f"{table}_{month:%Y_%m}"
+    bounds = (month, next_month(month))
+
+    cursor.execute(
+        f"SELECT 1 FROM {default} WHERE transaction_date >= %s AND transaction_date < %s LIMIT 1",
+        bounds
+    )
+    if cursor.fetchone() is None:
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} {_bound_clause(*bounds)}")
+        return name, 0
+
+    # Zeilen dieses Monats liegen schon in der Default-Partition: erst
+    # herausnehmen, dann die fertige Tabelle als Partition anhängen
+    cursor.execute(f"""
+        CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS,
+            CHECK (transaction_date >= %s AND transaction_date < %s))
+    """, bounds)
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM {default}
+            WHERE transaction_date >= %s AND transaction_date < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """, bounds)
+    moved = cursor.rowcount
+    cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} {_bound_clause(*bounds)}")
+    return name, moved
+
+def ensure_month_range(cursor, first, last, table=LEDGER_TABLE, default=DEFAULT_PARTITION):
+    """Stellt Partitionen für alle Monate von first bis last sicher
+
+    Gibt (angelegte Partitionen, verschobene Zeilen) zurück.
+    """
+    existing = existing_months(cursor, table)
+    created = []
+    moved = 0
+    month = month_start(first)
+    while month <= month_start(last):
+        if month not in existing:
+            name, rows = _create_month(cursor, month, table, default)
+            created.append(name)
+            moved += rows
+        month = next_month(month)
+    return created, moved
+
+def ensure_partitions(cursor, months_ahead=MONTHS_AHEAD, table=LEDGER_TABLE, default=DEFAULT_PARTITION):
+    """Legt die kommenden Monate an und leert die Default-Partition
+
+    Idempotent und für einen regelmäßigen Cron-Lauf gedacht. Gibt
+    (angelegte Partitionen, verschobene Zeilen) zurück.
+    """
+    today = date.today()
+    created, moved = ensure_month_range(
+        cursor, today, today + timedelta(days=31 * months_ahead), table, default
+    )
+
+    cursor.execute(f"SELECT DISTINCT date_trunc('month', transaction_date)::date FROM {default}")
+    for (month,) in sorted(cursor.fetchall()):
+        more, rows = ensure_month_range(cursor, month, month, table, default)
+        created += more
+        moved += rows
+    return created, moved
+
+def prepare_staging(cursor, staging):
+    """Legt vor einem INSERT ... SELECT die Monate der Staging-Tabelle an"""
+    cursor.execute(f"SELECT MIN(transaction_date), MAX(transaction_date) FROM {staging}")
+    first, last = cursor.fetchone()
+    if first is not None:
+        ensure_month_range(cursor, first, last)
+
+# === ONLINE-MIGRATION ===
+
+NEW_TABLE = 'transactions_partitioned'
+RETIRED_TABLE = 'transactions_unpartitioned'
+
+MIRROR_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION transactions_partition_mirror() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM {NEW_TABLE} WHERE id = OLD.id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO {NEW_TABLE} SELECT NEW.* ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+def _index_name(name, suffix):
+    return f"{name}_{suffix}"[:63]
+
+def _copy_index(cursor, name, definition):
+    """Legt einen Index der alten Tabelle auf der partitionierten Kopie an"""
+    match = _INDEX_DEFINITION.match(definition)
+    if not match:
+        return False
+    cursor.execute(f"CREATE INDEX {_index_name(name, 'partitioned')} ON {NEW_TABLE} {match.group(3)}")
+    return True
+
+def _drop_mirror(cursor):
+    """Entfernt Spiegel-Trigger, -Funktion und partitionierte Kopie samt Partitionen"""
+    cursor.execute(f"DROP TRIGGER IF EXISTS transactions_partition_mirror ON {LEDGER_TABLE}")
+    cursor.execute("DROP FUNCTION IF EXISTS transactions_partition_mirror()")
+    cursor.execute(f"DROP TABLE IF EXISTS {NEW_TABLE}")
+
+def migrate_to_partitioned(conn, batch_ids=BACKFILL_IDS, months_ahead=MONTHS_AHEAD, reinstall_triggers=None):
+    """Baut eine unpartitionierte transactions-Tabelle im laufenden Betrieb um
+
+    1. Partitionierte Kopie mit Monatspartitionen für den ganzen Datumsbereich
+    2. Spiegel-Trigger überträgt alle neuen Änderungen in die Kopie
+    3. Backfill in id-Bereichen, je Bereich ein Commit
+    4. Während des Backfills gelöschte Zeilen werden per Anti-Join entfernt
+    5. Kurze exklusive Sperre: Trigger entfernen und Tabellen umbenennen
+
+    Die alte Tabelle bleibt als transactions_unpartitioned erhalten. Trigger
+    der alten Tabelle werden entfernt; reinstall_triggers(cursor, Namen) legt
+    sie noch unter der Sperre an der neuen Tabelle an, damit keine Änderung
+    ohne sie durchrutscht. Gibt (kopierte Zeilen, Dauer der Sperre in
+    Sekunden, Namen der entfernten Trigger) zurück. Schlägt ein Schritt vor
+    dem Umschalten fehl, werden Spiegel-Trigger und Kopie wieder entfernt;
+    Reste eines abgebrochenen Laufs räumt der nächste Aufruf vorab auf.
+    """
+    cursor = conn.cursor()
+    if is_partitioned(cursor):
+        raise RuntimeError("transactions ist bereits partitioniert")
+
+    cursor.execute(f"SELECT MIN(transaction_date), COALESCE(MAX(id), 0) FROM {LEDGER_TABLE}")
+    first, max_id = cursor.fetchone()
+
+    # Reste eines abgebrochenen Laufs: ohne Aufräumen schlüge CREATE TRIGGER
+    # fehl bzw. spiegelte der alte Trigger in eine halb gebaute Kopie
+    _drop_mirror(cursor)
+    conn.commit()
+
+    try:
+        # 1. Partitionierte Kopie mit identischer Spaltenreihenfolge
+        new_default = f"{NEW_TABLE}_default"
+        cursor.execute(f"""
+            CREATE TABLE {NEW_TABLE} (LIKE {LEDGER_TABLE} INCLUDING DEFAULTS)
+            PARTITION BY RANGE (transaction_date)
+        """)
+        cursor.execute(f"ALTER TABLE {NEW_TABLE} ADD PRIMARY KEY (id, transaction_date)")
+        cursor.execute(f"""
+            ALTER TABLE {NEW_TABLE} ADD FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        """)
+        # Sekundärindizes so, wie sie die Schema-Migrationen angelegt haben
+        cursor.execute("""
+            SELECT c.relname, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass AND NOT i.indisprimary AND NOT i.indisunique
+        """, (LEDGER_TABLE,))
+        indexes = [row[0] for row in cursor.fetchall() if _copy_index(cursor, *row)]
+        cursor.execute(f"CREATE TABLE {new_default} PARTITION OF {NEW_TABLE} DEFAULT")
+        today = date.today()
+        ensure_month_range(
+            cursor, min(month_start(first), today) if first else today, today + timedelta(days=31 * months_ahead),
+            NEW_TABLE, new_default
+        )
+
+        # 2. Spiegel-Trigger
+        cursor.execute(MIRROR_FUNCTION)
+        cursor.execute(f"""
+            CREATE TRIGGER transactions_partition_mirror
+            AFTER INSERT OR UPDATE OR DELETE ON {LEDGER_TABLE}
+            FOR EACH ROW EXECUTE PROCEDURE transactions_partition_mirror()
+        """)
+        conn.commit()
+
+        # 3. Backfill bis zur höchsten id beim Start, alles Neuere kommt per Trigger
+        copied = 0
+        low = 0
+        while low < max_id:
+            high = min(low + batch_ids, max_id)
+            cursor.execute(f"""
+                INSERT INTO {NEW_TABLE}
+                SELECT * FROM {LEDGER_TABLE} WHERE id > %s AND id <= %s
+                ON CONFLICT DO NOTHING
+            """, (low, high))
+            copied += cursor.rowcount
+            conn.commit()
+            print(f"  📦 Backfill bis id {high}/{max_id} ({copied} Zeilen)")
+            low = high
+
+        # 4. Zeilen, die während ihres Backfills gelöscht wurden
+        cursor.execute(f"""
+            DELETE FROM {NEW_TABLE} n
+            WHERE NOT EXISTS (SELECT 1 FROM {LEDGER_TABLE} o WHERE o.id = n.id)
+        """)
+        conn.commit()
+
+        # 5. Umschalten unter kurzer exklusiver Sperre
+        start = time.perf_counter()
+        cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+        cursor.execute(f"LOCK TABLE {LEDGER_TABLE} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"DROP TRIGGER transactions_partition_mirror ON {LEDGER_TABLE}")
+        cursor.execute("DROP FUNCTION transactions_partition_mirror()")
+
+        # Übrige Trigger (etwa der Statistik) gehören ab jetzt zur neuen Tabelle
+        cursor.execute("""
+            SELECT tgname FROM pg_trigger
+            WHERE tgrelid = %s::regclass AND NOT tgisinternal
+        """, (LEDGER_TABLE,))
+        triggers = [row[0] for row in cursor.fetchall()]
+        for name in triggers:
+            cursor.execute(f"DROP TRIGGER {name} ON {LEDGER_TABLE}")
+
+        months = existing_months(cursor, NEW_TABLE)
+        cursor.execute(f"ALTER TABLE {LEDGER_TABLE} RENAME TO {RETIRED_TABLE}")
+        cursor.execute(f"ALTER INDEX IF EXISTS {LEDGER_TABLE}_pkey RENAME TO {RETIRED_TABLE}_pkey")
+        cursor.execute(f"ALTER INDEX {NEW_TABLE}_pkey RENAME TO {LEDGER_TABLE}_pkey")
+        for name in indexes:
+            cursor.execute(f"ALTER INDEX {name} RENAME TO {_index_name(name, 'unpartitioned')}")
+            cursor.execute(f"ALTER INDEX {_index_name(name, 'partitioned')} RENAME TO {name}")
+        cursor.execute(f"ALTER TABLE {NEW_TABLE} RENAME TO {LEDGER_TABLE}")
+        cursor.execute(f"ALTER TABLE {new_default} RENAME TO {DEFAULT_PARTITION}")
+        for month in months:
+            cursor.execute(f"ALTER TABLE {NEW_TABLE}_{month:%Y_%m} RENAME TO {partition_name(month)}")
+        cursor.execute(f"ALTER SEQUENCE IF EXISTS {LEDGER_TABLE}_id_seq OWNED BY {LEDGER_TABLE}.id")
+        if reinstall_triggers and triggers:
+            reinstall_triggers(cursor, triggers)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        _drop_mirror(cursor)
+        conn.commit()
+        raise
+    lock_seconds = time.perf_counter() - start
+
+    cursor.close()
+    return copied, lock_seconds, triggers
@@ -5,17 +5,22 @@ Vereinfachte PostgreSQL Migration für Getränkekasse
 Verwendet Unix-Socket Verbindungen
 """
 
-import json
 import os
 import sys
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import hashlib
+import argparse
+from collections import Counter
 from datetime import datetime
+from json_stream import iter_records
+from migration_pipeline import (
+    FlatJsonSource, UsernameSchemaSink,
+    add_pipeline_arguments, validate_pipeline_arguments, build_pipeline
+)
+from stage_profiler import add_profile_arguments, profiler_from_args
+import balance_reconcile
+import db_access
 
-# Konfiguration
-DATABASE_NAME = "getraenkekasse"
-DATABASE_USER = "getraenkekasse_user"
+# Datenbank und Benutzer aus database-config.json, verbunden über den Unix-Socket
+SOCKET = {'host': None}
 
 def load_data():
     """Lädt die JSON-Daten"""
@@ -25,59 +30,29 @@ def load_data():
         print("❌ data.json nicht gefunden")
         return None
         
-    with open('data.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    # Ein Durchlauf über die Datei zählt Benutzer und Transaktionen,
+    # ohne sie im Speicher zu halten
+    source = FlatJsonSource('data.json')
+    counts = Counter(kind for kind, _ in iter_records(source.path, kinds=('user', 'transaction')))
     
-    print(f"✅ {len(data.get('users', []))} Benutzer geladen")
-    print(f"✅ {len(data.get('transactions', []))} Transaktionen geladen")
+    print(f"✅ {counts['user']} Benutzer geladen")
+    print(f"✅ {counts['transaction']} Transaktionen geladen")
     
-    return data
+    return source
 
 def create_tables():
     """Erstellt die Tabellen-Struktur"""
     print("📋 Erstelle Tabellen...")
     
     try:
-        conn = psycopg2.connect(
-            database=DATABASE_NAME,
-            user=DATABASE_USER
-        )
+        conn = db_access.connect(**SOCKET)
         cursor = conn.cursor()
         
-        # Tabellen erstellen
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(255) UNIQUE NOT NULL,
-                display_name VARCHAR(255) NOT NULL,
-                pin_hash VARCHAR(255) NOT NULL,
-                balance DECIMAL(10,2) DEFAULT 0.00,
-                role VARCHAR(50) DEFAULT 'user',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(255) NOT NULL,
-                transaction_type VARCHAR(50) NOT NULL,
-                amount DECIMAL(10,2) NOT NULL,
-                item_name VARCHAR(255),
-                timestamp TIMESTAMP NOT NULL,
-                note TEXT,
-                FOREIGN KEY (username) REFERENCES users(username)
-            );
-        """)
-        
-        # Indizes für bessere Performance
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_username ON transactions(username);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions(timestamp);")
+        UsernameSchemaSink.create_tables(cursor)
         
         conn.commit()
         cursor.close()
-        conn.close()
+        db_access.release(conn)
         
         print("✅ Tabellen erfolgreich erstellt")
         return True
@@ -86,109 +61,52 @@ def create_tables():
         print(f"❌ Fehler beim Erstellen der Tabellen: {e}")
         return False
 
-def migrate_users(data):
+def migrate_users(pipeline):
     """Migriert Benutzer zur PostgreSQL"""
-    print("👥 Migriere Benutzer...")
-    
-    users = data.get('users', [])
-    if not users:
-        print("⚠️ Keine Benutzer zum Migrieren gefunden")
-        return True
-    
     try:
-        conn = psycopg2.connect(
-            database=DATABASE_NAME,
-            user=DATABASE_USER
-        )
+        conn = db_access.connect(**SOCKET)
         cursor = conn.cursor()
         
-        for user in users:
-            # Bestimme displayName
-            display_name = user.get('displayName', user.get('username', 'Unbekannt'))
-            
-            # Bestimme PIN hash
-            pin_hash = user.get('pinHash', user.get('pin', ''))
-            if not pin_hash.startswith('$'):  # Falls es noch nicht gehashed ist
-                pin_hash = hashlib.sha256(pin_hash.encode()).hexdigest()
-            
-            cursor.execute("""
-                INSERT INTO users (username, display_name, pin_hash, balance, role)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (username) DO UPDATE SET
-                    display_name = EXCLUDED.display_name,
-                    pin_hash = EXCLUDED.pin_hash,
-                    balance = EXCLUDED.balance,
-                    role = EXCLUDED.role
-            """, (
-                user['username'],
-                display_name,
-                pin_hash,
-                float(user.get('balance', 0.0)),
-                user.get('role', 'user')
-            ))
+        user_count = pipeline.profiler.run('users', pipeline.migrate_users, cursor)
         
-        conn.commit()
+        pipeline.profiler.run('commit', conn.commit)
         cursor.close()
-        conn.close()
+        db_access.release(conn)
         
-        print(f"✅ {len(users)} Benutzer erfolgreich migriert")
+        if not user_count:
+            print("⚠️ Keine Benutzer zum Migrieren gefunden")
         return True
         
     except Exception as e:
         print(f"❌ Fehler beim Migrieren der Benutzer: {e}")
         return False
 
-def migrate_transactions(data):
+def migrate_transactions(pipeline):
     """Migriert Transaktionen zur PostgreSQL"""
-    print("💰 Migriere Transaktionen...")
-    
-    transactions = data.get('transactions', [])
-    if not transactions:
-        print("⚠️ Keine Transaktionen zum Migrieren gefunden")
-        return True
-    
     try:
-        conn = psycopg2.connect(
-            database=DATABASE_NAME,
-            user=DATABASE_USER
-        )
+        conn = db_access.connect(**SOCKET)
         cursor = conn.cursor()
         
-        for trans in transactions:
-            timestamp = datetime.fromisoformat(trans['timestamp'].replace('Z', '+00:00'))
-            
-            cursor.execute("""
-                INSERT INTO transactions (username, transaction_type, amount, item_name, timestamp, note)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                trans['username'],
-                trans['type'],
-                float(trans['amount']),
-                trans.get('itemName'),
-                timestamp,
-                trans.get('note')
-            ))
+        total = pipeline.profiler.run('transactions', pipeline.migrate_transactions, cursor)
         
-        conn.commit()
+        pipeline.profiler.run('commit', conn.commit)
         cursor.close()
-        conn.close()
+        db_access.release(conn)
         
-        print(f"✅ {len(transactions)} Transaktionen erfolgreich migriert")
+        if not total:
+            print("⚠️ Keine Transaktionen zum Migrieren gefunden")
         return True
         
     except Exception as e:
         print(f"❌ Fehler beim Migrieren der Transaktionen: {e}")
         return False
 
-def verify_migration():
-    """Überprüft die Migration"""
+def verify_migration(pipeline):
+    """Überprüft die Migration, mit --verify per Digest je Benutzer gegen data.json"""
     print("🔍 Überprüfe Migration...")
     
     try:
-        conn = psycopg2.connect(
-            database=DATABASE_NAME,
-            user=DATABASE_USER
-        )
+        conn = db_access.connect(**SOCKET)
         cursor = conn.cursor()
         
         # Anzahl Benutzer
@@ -204,12 +122,22 @@ def verify_migration():
         total_balance = cursor.fetchone()[0] or 0
         
         cursor.close()
-        conn.close()
+        if pipeline.verify:
+            pipeline.verify_against_source(conn)
+        db_access.release(conn)
         
         print(f"✅ {user_count} Benutzer in der Datenbank")
         print(f"✅ {trans_count} Transaktionen in der Datenbank")
         print(f"✅ Gesamtsaldo: {total_balance:.2f}€")
         
+        # Guthaben gegen die Summe der migrierten Transaktionen prüfen
+        result = balance_reconcile.reconcile(db_access.connect_kwargs(**SOCKET))
+        if result['drifts']:
+            print(f"⚠️ {len(result['drifts'])} Benutzer mit Guthaben ungleich Transaktionssumme "
+                  f"(Details: python3 postgres_backup.py reconcile)")
+        else:
+            print("✅ Alle Guthaben entsprechen der Transaktionssumme")
+        
         return True
         
     except Exception as e:
@@ -223,33 +151,60 @@ def create_backup():
         os.rename('data.json', backup_name)
         print(f"💾 Backup erstellt: {backup_name}")
 
-def main():
-    print("🐘 Vereinfachte PostgreSQL Migration")
-    print("=====================================")
-    
+def parse_args():
+    """Liest die Kommandozeilen-Optionen"""
+    parser = argparse.ArgumentParser(description='Vereinfachte PostgreSQL Migration')
+    add_pipeline_arguments(parser, advanced=False)
+    add_profile_arguments(parser)
+    return validate_pipeline_arguments(parser, parser.parse_args())
+
+def run_migration(args, profiler):
+    """Führt alle Migrationsschritte aus"""
     # 1. Lade JSON-Daten
-    data = load_data()
-    if not data:
+    source = profiler.run('load', load_data)
+    if not source:
         return False
+    pipeline = build_pipeline(source, UsernameSchemaSink, args, profiler=profiler)
     
     # 2. Erstelle Tabellen
-    if not create_tables():
+    if not profiler.run('create_tables', create_tables):
         return False
     
     # 3. Migriere Benutzer
-    if not migrate_users(data):
+    if not migrate_users(pipeline):
         return False
     
     # 4. Migriere Transaktionen
-    if not migrate_transactions(data):
+    if not migrate_transactions(pipeline):
         return False
     
     # 5. Überprüfe Migration
-    if not verify_migration():
+    if not profiler.run('verify', verify_migration, pipeline):
         return False
     
     # 6. Erstelle Backup der JSON-Datei
     create_backup()
+    return True
+
+def main():
+    args = parse_args()
+    profiler = profiler_from_args(args, 'migrate_simple')
+    
+    print("🐘 Vereinfachte PostgreSQL Migration")
+    print("=====================================")
+    
+    # Verbindungsaufbau vor der ersten Stufe, danach teilen sich alle Schritte die Verbindung
+    try:
+        db_access.warm_up(**SOCKET)
+    except Exception as e:
+        print(f"❌ Keine Verbindung zur Datenbank: {e}")
+        return False
+    
+    profiler.start()
+    success = run_migration(args, profiler)
+    profiler.finish('ok' if success else 'error')
+    if not success:
+        return False
     
     print("\n🎉 Migration erfolgreich abgeschlossen!")
     print("\nNächste Schritte:")
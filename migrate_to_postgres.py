@@ -9,15 +9,30 @@ import subprocess
 import sys
 import os
 import getpass
-from datetime import datetime
+import time
+import argparse
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import db_access
+from migration_pipeline import (
+    NestedJsonSource, UserIdSchemaSink, add_pipeline_arguments,
+    validate_pipeline_arguments, build_pipeline
+)
+from stage_profiler import add_profile_arguments, profiler_from_args
 
 # Konfiguration
 DATABASE_NAME = "getraenkekasse"
 DATABASE_USER = "getraenkekasse_user"
 DEFAULT_PASSWORD = "getraenkekasse_password_2025"
 
+# Ziel der Migration; database-config.json entsteht erst am Ende
+CONNECTION = {
+    'host': "localhost",
+    'database': DATABASE_NAME,
+    'user': DATABASE_USER,
+    'password': DEFAULT_PASSWORD
+}
+
 def install_dependencies():
     """Installiert benötigte Python-Pakete"""
     print("🔧 Installiere Python-Abhängigkeiten...")
@@ -167,11 +182,12 @@ def setup_database():
     print("🗄️ Richte Datenbank ein...")
     
     try:
-        # Verbindung als postgres user
-        conn = psycopg2.connect(
+        # Verbindung als postgres user, wiederholt, solange der Server noch startet
+        conn = db_access.open_connection(
             host="localhost",
             database="postgres",
-            user="postgres"
+            user="postgres",
+            password=None
         )
         conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
         cursor = conn.cursor()
@@ -286,78 +302,14 @@ def try_fedora_setup():
         print(f"❌ Automatisches Setup fehlgeschlagen")
         return False
 
-def create_tables():
-    """Erstellt die Tabellen-Struktur"""
-    print("📋 Erstelle Tabellen...")
-    
-    # Warte kurz nach Authentifizierung-Konfiguration
-    import time
-    time.sleep(2)
-    
+def connect_database():
+    """Baut die Verbindung des Pools vorab auf, damit sie in keiner Stufe mitgemessen wird
+
+    Solange der Server nach der Authentifizierung-Konfiguration noch neu lädt,
+    wiederholt db_access den Verbindungsaufbau mit wachsender Wartezeit.
+    """
     try:
-        conn = psycopg2.connect(
-            host="localhost",
-            database=DATABASE_NAME,
-            user=DATABASE_USER,
-            password=DEFAULT_PASSWORD
-        )
-        cursor = conn.cursor()
-        
-        # Drinks Tabelle
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS drinks (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255) UNIQUE NOT NULL,
-                price DECIMAL(10,2) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        # Users Tabelle
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(255) UNIQUE NOT NULL,
-                pin VARCHAR(4) NOT NULL,
-                balance DECIMAL(10,2) DEFAULT 0.00,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        # Transactions Tabelle (für consumption history)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                transaction_date TIMESTAMP NOT NULL,
-                amount DECIMAL(10,2) NOT NULL,
-                transaction_type VARCHAR(50) NOT NULL,
-                description TEXT,
-                drink_name VARCHAR(255),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        # Admin Tabelle
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS admin_settings (
-                id SERIAL PRIMARY KEY,
-                setting_key VARCHAR(255) UNIQUE NOT NULL,
-                setting_value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        # Indizes erstellen
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions(user_id);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(transaction_date);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_type ON transactions(transaction_type);")
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        print("✅ Tabellen erfolgreich erstellt")
+        db_access.warm_up(**CONNECTION)
         
     except psycopg2.OperationalError as e:
         if "Ident-Authentifizierung" in str(e) or "ident authentication failed" in str(e):
@@ -379,30 +331,48 @@ def create_tables():
             response = input("Soll ich versuchen, das automatisch zu beheben? (j/n): ")
             if response.lower() == 'j':
                 if configure_postgresql_auth():
-                    print("🔄 Versuche erneut Tabellen zu erstellen...")
+                    print("🔄 Versuche erneut zu verbinden...")
+                    # pg_hba.conf wird asynchron neu geladen
                     time.sleep(2)
                     # Rekursiver Aufruf
-                    create_tables()
+                    connect_database()
                 else:
                     sys.exit(1)
             else:
                 sys.exit(1)
         else:
-            print(f"❌ Fehler beim Erstellen der Tabellen: {e}")
+            print(f"❌ Fehler beim Verbinden zur Datenbank: {e}")
             sys.exit(1)
+
+def create_tables(partitioned=False):
+    """Erstellt die Tabellen-Struktur, transactions wahlweise monatsweise partitioniert"""
+    print("📋 Erstelle Tabellen...")
+    
+    try:
+        with db_access.connection(**CONNECTION) as conn:
+            cursor = conn.cursor()
+            
+            # Tabellen und Indizes über die versionierten Migrationen in migrations/main
+            UserIdSchemaSink.create_tables(cursor, partitioned)
+            
+            conn.commit()
+            cursor.close()
+        
+        print("✅ Tabellen erfolgreich erstellt")
+        
     except Exception as e:
         print(f"❌ Fehler beim Erstellen der Tabellen: {e}")
         sys.exit(1)
 
 def load_json_data():
-    """Lädt die Daten aus data.json"""
+    """Öffnet data.json als Stream und prüft die Datei vorab auf gültiges JSON"""
     print("📂 Lade Daten aus data.json...")
     
     try:
-        with open('data.json', 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        source = NestedJsonSource('data.json')
+        source.check()
         print("✅ data.json erfolgreich geladen")
-        return data
+        return source
     except FileNotFoundError:
         print("❌ data.json nicht gefunden")
         sys.exit(1)
@@ -410,128 +380,19 @@ def load_json_data():
         print(f"❌ Fehler beim Parsen von data.json: {e}")
         sys.exit(1)
 
-def migrate_drinks(data, cursor):
-    """Migriert Getränke-Daten"""
-    print("🥤 Migriere Getränke...")
-    
-    drinks = data.get('drinks', [])
-    for drink in drinks:
-        try:
-            cursor.execute("""
-                INSERT INTO drinks (name, price) 
-                VALUES (%s, %s) 
-                ON CONFLICT (name) DO UPDATE SET price = EXCLUDED.price
-            """, (drink['name'], drink['price']))
-        except Exception as e:
-            print(f"⚠️ Fehler beim Migrieren von Getränk {drink['name']}: {e}")
-    
-    print(f"✅ {len(drinks)} Getränke migriert")
-
-def migrate_users_and_transactions(data, cursor):
-    """Migriert Benutzer und Transaktionen"""
-    print("👥 Migriere Benutzer und Transaktionen...")
-    
-    users = data.get('users', [])
-    total_transactions = 0
-    
-    for user in users:
-        try:
-            # Benutzer einfügen
-            cursor.execute("""
-                INSERT INTO users (username, pin, balance) 
-                VALUES (%s, %s, %s) 
-                ON CONFLICT (username) DO UPDATE SET 
-                    pin = EXCLUDED.pin, 
-                    balance = EXCLUDED.balance
-            """, (user['username'], user['pin'], user.get('balance', 0)))
-            
-            # User ID abrufen
-            cursor.execute("SELECT id FROM users WHERE username = %s", (user['username'],))
-            user_id = cursor.fetchone()[0]
-            
-            # Transaktionen migrieren
-            consumption = user.get('consumption', [])
-            for transaction in consumption:
-                try:
-                    # Datum parsen
-                    if 'date' in transaction:
-                        trans_date = datetime.fromisoformat(transaction['date'].replace('Z', '+00:00'))
-                    else:
-                        trans_date = datetime.now()
-                    
-                    # Bestimme Getränkename für purchase transactions
-                    drink_name = None
-                    if transaction.get('type') == 'purchase':
-                        drink_name = transaction.get('description')
-                    
-                    cursor.execute("""
-                        INSERT INTO transactions 
-                        (user_id, transaction_date, amount, transaction_type, description, drink_name) 
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    """, (
-                        user_id,
-                        trans_date,
-                        transaction.get('amount', 0),
-                        transaction.get('type', 'unknown'),
-                        transaction.get('description', ''),
-                        drink_name
-                    ))
-                    total_transactions += 1
-                    
-                except Exception as e:
-                    print(f"⚠️ Fehler beim Migrieren einer Transaktion für {user['username']}: {e}")
-                    
-        except Exception as e:
-            print(f"⚠️ Fehler beim Migrieren von Benutzer {user['username']}: {e}")
-    
-    print(f"✅ {len(users)} Benutzer und {total_transactions} Transaktionen migriert")
-
-def migrate_admin_settings(data, cursor):
-    """Migriert Admin-Einstellungen"""
-    print("⚙️ Migriere Admin-Einstellungen...")
-    
-    admin = data.get('admin', {})
-    
-    for key, value in admin.items():
-        try:
-            cursor.execute("""
-                INSERT INTO admin_settings (setting_key, setting_value) 
-                VALUES (%s, %s) 
-                ON CONFLICT (setting_key) DO UPDATE SET 
-                    setting_value = EXCLUDED.setting_value,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (key, str(value)))
-        except Exception as e:
-            print(f"⚠️ Fehler beim Migrieren der Admin-Einstellung {key}: {e}")
-    
-    print(f"✅ {len(admin)} Admin-Einstellungen migriert")
-
-def migrate_data():
+def migrate_data(args, profiler):
     """Führt die komplette Datenmigration durch"""
     print("🚀 Starte Datenmigration...")
     
     # Lade JSON-Daten
-    data = load_json_data()
+    source = profiler.run('load', load_json_data)
     
     try:
-        # Verbindung zur Datenbank
-        conn = psycopg2.connect(
-            host="localhost",
-            database=DATABASE_NAME,
-            user=DATABASE_USER,
-            password=DEFAULT_PASSWORD
-        )
-        cursor = conn.cursor()
-        
-        # Migriere alle Daten
-        migrate_drinks(data, cursor)
-        migrate_users_and_transactions(data, cursor)
-        migrate_admin_settings(data, cursor)
-        
-        # Commit alle Änderungen
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Migriere alle Daten über die Verbindung aus create_tables und committe
+        with db_access.connection(**CONNECTION) as conn:
+            build_pipeline(
+                source, UserIdSchemaSink, args, db_access.connect_kwargs(**CONNECTION), profiler
+            ).run(conn)
         
         print("✅ Datenmigration erfolgreich abgeschlossen!")
         
@@ -573,8 +434,20 @@ def show_connection_info():
     print("\nKonfigurationsdatei: database-config.json")
     print("="*50)
 
+def parse_args():
+    """Liest die Kommandozeilen-Optionen"""
+    parser = argparse.ArgumentParser(description='PostgreSQL Migration für Getränkekasse')
+    add_pipeline_arguments(parser)
+    parser.add_argument('--partitioned', action='store_true',
+                       help='transactions monatsweise nach transaction_date partitionieren')
+    add_profile_arguments(parser)
+    return validate_pipeline_arguments(parser, parser.parse_args())
+
 def main():
     """Hauptfunktion"""
+    args = parse_args()
+    profiler = profiler_from_args(args, 'migrate_to_postgres')
+    
     print("🐘 PostgreSQL Migration für Getränkekasse (Fedora)")
     print("=" * 50)
     
@@ -583,6 +456,8 @@ def main():
         print("❌ data.json nicht gefunden. Bitte führe das Skript im Projektverzeichnis aus.")
         sys.exit(1)
     
+    profiler.start()
+    status = 'error'
     try:
         # 1. Installiere Dependencies
         install_dependencies()
@@ -593,17 +468,19 @@ def main():
         # 3. Richte Datenbank ein
         setup_database()
         
-        # 4. Erstelle Tabellen
-        create_tables()
+        # 4. Verbinde und erstelle Tabellen
+        connect_database()
+        profiler.run('create_tables', create_tables, args.partitioned)
         
         # 5. Migriere Daten
-        migrate_data()
+        migrate_data(args, profiler)
         
         # 6. Erstelle Konfigurationsdatei
         create_database_config()
         
         # 7. Zeige Verbindungsinformationen
         show_connection_info()
+        status = 'ok'
         
     except KeyboardInterrupt:
         print("\n❌ Migration abgebrochen")
@@ -611,6 +488,8 @@ def main():
     except Exception as e:
         print(f"❌ Unerwarteter Fehler: {e}")
         sys.exit(1)
+    finally:
+        profiler.finish(status)
 
 if __name__ == "__main__":
     main()
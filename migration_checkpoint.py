@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Chunk-weise Commits mit wiederaufnehmbarem Checkpoint für lange Migrationen
+Der Fortschritt wird in derselben Transaktion wie der jeweilige Chunk in der
+Datenbank festgehalten und zusätzlich in eine Checkpoint-Datei geschrieben,
+sodass --resume nach einem Abbruch ohne doppelte Zeilen weitermacht.
+"""
+
+import json
+import os
+from datetime import datetime
+from itertools import islice
+import db_access
+
+CHECKPOINT_FILE = 'migration_checkpoint.json'
+DEFAULT_CHUNK_SIZE = 50000
+
+class MigrationCheckpoint:
+    """Fortschritt einer Migration: Anzahl bereits committeter consumption-Einträge"""
+
+    def __init__(self, conn, source, path=CHECKPOINT_FILE):
+        self.conn = conn
+        self.source = source
+        self.path = path
+
+    def ensure_table(self):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS migration_checkpoints (
+                source VARCHAR(255) PRIMARY KEY,
+                entry_offset BIGINT NOT NULL,
+                username VARCHAR(255),
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        self.conn.commit()
+        cursor.close()
+
+    def load(self):
+        """Liefert (offset, username) des letzten committeten Chunks
+
+        Maßgeblich ist der Stand in der Datenbank, da er atomar mit den Daten
+        committet wurde; die Datei dient als Fallback und zur Anzeige.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "SELECT entry_offset, username FROM migration_checkpoints WHERE source = %s",
+            (self.source,)
+        )
+        row = cursor.fetchone()
+        cursor.close()
+        if row:
+            return row[0], row[1]
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+            if state.get('source') == self.source:
+                return state['offset'], state.get('username')
+
+        return 0, None
+
+    def save(self, cursor, offset, username):
+        """Hält den Fortschritt in der laufenden Transaktion fest"""
+        db_access.execute_prepared(cursor, """
+            INSERT INTO migration_checkpoints (source, entry_offset, username)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (source) DO UPDATE SET
+                entry_offset = EXCLUDED.entry_offset,
+                username = EXCLUDED.username,
+                updated_at = CURRENT_TIMESTAMP
+        """, (self.source, offset, username))
+
+    def write_file(self, offset, username):
+        """Schreibt den committeten Fortschritt atomar in die Checkpoint-Datei"""
+        state = {
+            'source': self.source,
+            'offset': offset,
+            'username': username,
+            'updated_at': datetime.now().isoformat()
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file, indent=2)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        """Entfernt den Checkpoint nach erfolgreichem Abschluss"""
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM migration_checkpoints WHERE source = %s", (self.source,))
+        self.conn.commit()
+        cursor.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def migrate_in_chunks(conn, source_name, entries, username_of, write_chunk,
+                      chunk_size=DEFAULT_CHUNK_SIZE, resume=False):
+    """Schreibt Einträge einer Quelle in Chunks mit je einem Commit
+
+    entries liefert die rohen Einträge in Dateireihenfolge, username_of(eintrag)
+    den zugehörigen Benutzer und write_chunk(cursor, einträge) schreibt einen
+    Chunk und liefert die Anzahl geschriebener Zeilen.
+    Gibt die Gesamtzahl geschriebener Zeilen zurück.
+    """
+    checkpoint = MigrationCheckpoint(conn, source_name)
+    checkpoint.ensure_table()
+
+    offset = 0
+    if resume:
+        offset, username = checkpoint.load()
+        if offset:
+            print(f"⏩ Setze nach {offset} Einträgen fort (zuletzt: {username})")
+    else:
+        offset, _ = checkpoint.load()
+        if offset:
+            print(f"⚠️ Vorhandener Checkpoint bei {offset} Einträgen wird verworfen (--resume zum Fortsetzen)")
+        offset = 0
+
+    entries = islice(entries, offset, None)
+    cursor = conn.cursor()
+    total = 0
+
+    while True:
+        chunk = list(islice(entries, chunk_size))
+        if not chunk:
+            break
+
+        total += write_chunk(cursor, chunk)
+        offset += len(chunk)
+        last_username = username_of(chunk[-1])
+
+        checkpoint.save(cursor, offset, last_username)
+        conn.commit()
+        checkpoint.write_file(offset, last_username)
+        print(f"💾 Checkpoint: {offset} Einträge committet (zuletzt: {last_username})")
+
+    cursor.close()
+    checkpoint.clear()
+    return total
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+Gemeinsame Migrations-Engine für Getränkekasse
+Quelle -> Transformation -> Ziel: Quell-Adapter für beide JSON-Layouts
+(verschachteltes consumption bzw. flache transactions-Liste) und Ziel-Adapter
+für beide Schemata (transactions mit user_id bzw. mit username-FK).
+migrate_to_postgres.py, migrate_data.py und migrate_simple.py sind nur noch
+dünne Hüllen um diese Engine.
+"""
+
+import hashlib
+from collections import namedtuple
+from bulk_load import (
+    DEFAULT_BATCH_SIZE, TRANSACTION_COLUMNS, SIMPLE_TRANSACTION_COLUMNS,
+    parse_transaction_date, drink_name_for, insert_rows, load_rows, upsert_users
+)
+from json_stream import StreamingDataFile
+from migration_checkpoint import DEFAULT_CHUNK_SIZE, migrate_in_chunks
+from incremental_migration import migrate_consumption_incrementally
+from columnar_batch import write_column_batches
+import ledger_partitions
+import schema_migrate
+import stats_summary
+import migration_verify
+from stage_profiler import StageProfiler
+import db_access
+
+# Einheitliche Datensätze zwischen Quelle und Ziel
+UserRecord = namedtuple('UserRecord', 'username pin balance display_name role')
+TransactionRecord = namedtuple(
+    'TransactionRecord', 'username date amount type description drink_name'
+)
+
+# === QUELLEN ===
+
+class NestedJsonSource:
+    """data.json / data_backup_*.json mit consumption-Listen je Benutzer"""
+
+    def __init__(self, path, username_filter=None):
+        self.path = path
+        self.username_filter = username_filter
+        self.data = StreamingDataFile(path, username_filter)
+
+    def for_shard(self, username_filter):
+        return NestedJsonSource(self.path, username_filter)
+
+    def check(self):
+        self.data.check()
+
+    def drinks(self):
+        return self.data.drinks()
+
+    def admin(self):
+        return self.data.admin()
+
+    def users(self):
+        for user in self.data.users():
+            yield UserRecord(
+                user['username'],
+                user['pin'],
+                user.get('balance', 0),
+                user.get('displayName', user['username']),
+                user.get('role', 'user')
+            )
+
+    def entries(self):
+        """Rohe (username, Eintrag)-Paare in Dateireihenfolge"""
+        return self.data.consumption()
+
+    @staticmethod
+    def username_of(entry):
+        return entry[0]
+
+    @staticmethod
+    def to_record(entry):
+        username, transaction = entry
+        return TransactionRecord(
+            username,
+            parse_transaction_date(transaction.get('date')),
+            transaction.get('amount', 0),
+            transaction.get('type', 'unknown'),
+            transaction.get('description', ''),
+            drink_name_for(transaction)
+        )
+
+    @staticmethod
+    def append_to_batch(batch, entry):
+        username, transaction = entry
+        batch.append(
+            username,
+            transaction.get('date'),
+            transaction.get('amount', 0),
+            transaction.get('type', 'unknown'),
+            transaction.get('description', ''),
+            drink_name_for(transaction)
+        )
+
+class FlatJsonSource:
+    """data.json mit flacher transactions-Liste (username, type, itemName, note)"""
+
+    def __init__(self, path, username_filter=None):
+        self.path = path
+        self.username_filter = username_filter
+        self.data = StreamingDataFile(path)
+
+    def for_shard(self, username_filter):
+        return FlatJsonSource(self.path, username_filter)
+
+    def _wanted(self, username):
+        return self.username_filter is None or self.username_filter(username)
+
+    def check(self):
+        self.data.check()
+
+    def drinks(self):
+        return self.data.drinks()
+
+    def admin(self):
+        return self.data.admin()
+
+    def users(self):
+        for user in self.data.users():
+            if not self._wanted(user['username']):
+                continue
+            yield UserRecord(
+                user['username'],
+                user.get('pinHash', user.get('pin', '')),
+                float(user.get('balance', 0.0)),
+                user.get('displayName', user.get('username', 'Unbekannt')),
+                user.get('role', 'user')
+            )
+
+    def entries(self):
+        for transaction in self.data.transactions():
+            if self._wanted(transaction['username']):
+                yield transaction
+
+    @staticmethod
+    def username_of(entry):
+        return entry['username']
+
+    @staticmethod
+    def to_record(entry):
+        return TransactionRecord(
+            entry['username'],
+            parse_transaction_date(entry['timestamp']),
+            float(entry['amount']),
+            entry['type'],
+            entry.get('note'),
+            entry.get('itemName')
+        )
+
+    @staticmethod
+    def append_to_batch(batch, entry):
+        batch.append(
+            entry['username'],
+            entry['timestamp'],
+            entry['amount'],
+            entry['type'],
+            entry.get('note'),
+            entry.get('itemName')
+        )
+
+# === TRANSFORMATION ===
+
+def transform(source, entries):
+    """Wandelt rohe Einträge der Quelle in TransactionRecords um
+
+    Ungültige Einträge werden mit Warnung übersprungen, statt die ganze
+    Migration abzubrechen.
+    """
+    for entry in entries:
+        try:
+            yield source.to_record(entry)
+        except (ValueError, AttributeError, KeyError, TypeError) as e:
+            print(f"⚠️ Fehler beim Migrieren einer Transaktion für {source.username_of(entry)}: {e}")
+
+# === ZIELE ===
+
+class UserIdSchemaSink:
+    """Schema aus migrations/main: transactions.user_id -> users.id"""
+
+    transaction_table = 'transactions'
+    transaction_columns = TRANSACTION_COLUMNS
+    ledger_key = 'user_id'
+    columnar_key_type = 'INTEGER'
+    columnar_target_columns = TRANSACTION_COLUMNS
+
+    def __init__(self, bulk=False, batch_size=DEFAULT_BATCH_SIZE, staging=False):
+        self.bulk = bulk
+        self.batch_size = batch_size
+        self.staging = staging
+        self.user_ids = {}
+        # Wird von der Pipeline gesetzt, wenn transactions partitioniert ist
+        self.partitioned = False
+
+    @staticmethod
+    def create_tables(cursor, partitioned=False):
+        """Spielt die Schema-Migrationen ein; committet
+
+        Mit partitioned wird transactions anschließend monatsweise
+        partitioniert. Die leere Ausgangstabelle einer frischen Installation
+        wird dabei verworfen; vorhandene Statistik-Trigger werden an der
+        neuen Tabelle neu angelegt.
+        """
+        conn = cursor.connection
+        schema_migrate.upgrade(conn, 'main')
+        if partitioned and not ledger_partitions.is_partitioned(cursor):
+            ledger_partitions.migrate_to_partitioned(
+                conn, reinstall_triggers=stats_summary.reinstall_triggers
+            )
+            cursor.execute(f"SELECT 1 FROM {ledger_partitions.RETIRED_TABLE} LIMIT 1")
+            if cursor.fetchone() is None:
+                cursor.execute(f"DROP TABLE {ledger_partitions.RETIRED_TABLE}")
+            conn.commit()
+
+    def write_drinks(self, cursor, drinks):
+        return db_access.execute_prepared_batch(cursor, """
+            INSERT INTO drinks (name, price)
+            VALUES (%s, %s)
+            ON CONFLICT (name) DO UPDATE SET price = EXCLUDED.price
+        """, ((drink['name'], drink['price']) for drink in drinks))
+
+    def write_users(self, cursor, users):
+        self.user_ids = upsert_users(
+            cursor,
+            ({'username': user.username, 'pin': user.pin, 'balance': user.balance} for user in users)
+        )
+        return len(self.user_ids)
+
+    def keys_for(self, usernames):
+        return [self.user_ids.get(username) for username in usernames]
+
+    def rows(self, records):
+        for record in records:
+            yield (
+                self.user_ids[record.username], record.date, record.amount,
+                record.type, record.description, record.drink_name
+            )
+
+    def prepare_partitions(self, cursor, first, last):
+        ledger_partitions.ensure_month_range(cursor, first, last)
+
+    def write_transactions(self, cursor, records):
+        if self.bulk:
+            # Partitioniert: über Staging, damit die Monate vor dem INSERT existieren
+            return load_rows(
+                cursor, self.transaction_table, self.transaction_columns,
+                self.rows(records), self.batch_size, self.staging,
+                ledger_partitions.prepare_staging if self.partitioned else None
+            )
+        return insert_rows(cursor, self.transaction_table, self.transaction_columns, self.rows(records))
+
+    def write_admin(self, cursor, admin):
+        return db_access.execute_prepared_batch(cursor, """
+            INSERT INTO admin_settings (setting_key, setting_value)
+            VALUES (%s, %s)
+            ON CONFLICT (setting_key) DO UPDATE SET
+                setting_value = EXCLUDED.setting_value,
+                updated_at = CURRENT_TIMESTAMP
+        """, ((key, str(value)) for key, value in admin.items()))
+
+class UsernameSchemaSink:
+    """Schema aus migrations/simple: transactions.username -> users.username"""
+
+    transaction_table = 'transactions'
+    transaction_columns = SIMPLE_TRANSACTION_COLUMNS
+    ledger_key = 'username'
+    columnar_key_type = 'VARCHAR(255)'
+    # Reihenfolge wie TransactionRecord: Schlüssel, Datum, Betrag, Typ, Beschreibung, Getränk
+    columnar_target_columns = ('username', 'timestamp', 'amount', 'transaction_type', 'note', 'item_name')
+
+    def __init__(self, bulk=False, batch_size=DEFAULT_BATCH_SIZE, staging=False):
+        self.bulk = bulk
+        self.batch_size = batch_size
+        self.staging = staging
+
+    @staticmethod
+    def create_tables(cursor):
+        """Spielt die Schema-Migrationen der Spur simple ein; committet"""
+        schema_migrate.upgrade(cursor.connection, 'simple')
+
+    def write_drinks(self, cursor, drinks):
+        # Dieses Schema kennt keine drinks-Tabelle
+        return 0
+
+    @staticmethod
+    def _pin_hash(pin):
+        if pin.startswith('$'):
+            return pin
+        # Falls es noch nicht gehashed ist
+        return hashlib.sha256(pin.encode()).hexdigest()
+
+    def write_users(self, cursor, users):
+        return db_access.execute_prepared_batch(cursor, """
+            INSERT INTO users (username, display_name, pin_hash, balance, role)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (username) DO UPDATE SET
+                display_name = EXCLUDED.display_name,
+                pin_hash = EXCLUDED.pin_hash,
+                balance = EXCLUDED.balance,
+                role = EXCLUDED.role
+        """, (
+            (user.username, user.display_name, self._pin_hash(user.pin), user.balance, user.role)
+            for user in users
+        ))
+
+    def keys_for(self, usernames):
+        return usernames
+
+    def rows(self, records):
+        for record in records:
+            yield (
+                record.username, record.type, record.amount,
+                record.drink_name, record.date, record.description
+            )
+
+    def write_transactions(self, cursor, records):
+        if self.bulk:
+            return load_rows(
+                cursor, self.transaction_table, self.transaction_columns,
+                self.rows(records), self.batch_size, self.staging
+            )
+        return insert_rows(cursor, self.transaction_table, self.transaction_columns, self.rows(records))
+
+    def write_admin(self, cursor, admin):
+        # Dieses Schema kennt keine admin_settings-Tabelle
+        return 0
+
+# === ENGINE ===
+
+class MigrationPipeline:
+    """Führt eine Migration von einer Quelle in ein Ziel durch
+
+    Modi: Standard (eine Transaktion), chunk_size/resume (Commit je Chunk mit
+    Checkpoint), incremental (nur neue Transaktionen) und workers (parallel,
+    nach username geshardet). Mit columnar werden Transaktionen im Standard-
+    und Chunk-Modus spaltenweise in Batches transformiert. Mit verify wird
+    nach dem Commit per Digest je Benutzer gegen die Quelle geprüft.
+    """
+
+    def __init__(self, source, sink, chunk_size=0, resume=False, incremental=False,
+                 workers=1, connect_kwargs=None, columnar=False, profiler=None, verify=False):
+        self.source = source
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.resume = resume
+        self.incremental = incremental
+        self.workers = workers
+        self.connect_kwargs = connect_kwargs
+        self.columnar = columnar
+        self.profiler = profiler or StageProfiler('migration')
+        self.verify = verify
+
+        # Sharding und Schlüsselabgleich setzen das Schema mit user_id voraus
+        if (workers > 1 or incremental) and not isinstance(sink, UserIdSchemaSink):
+            raise ValueError("--workers und --incremental werden nur für das Schema mit user_id unterstützt")
+
+    def migrate_drinks(self, cursor):
+        print("🥤 Migriere Getränke...")
+        count = self.sink.write_drinks(cursor, self.source.drinks())
+        print(f"✅ {count} Getränke migriert")
+        return count
+
+    def migrate_users(self, cursor):
+        print("👥 Migriere Benutzer...")
+        count = self.sink.write_users(cursor, self.source.users())
+        print(f"✅ {count} Benutzer migriert")
+        return count
+
+    def write_entries(self, cursor, entries):
+        """Transformiert rohe Einträge und schreibt sie ins Ziel"""
+        if self.columnar:
+            return write_column_batches(
+                cursor, self.source, entries, self.sink, self.sink.batch_size
+            )
+        return self.sink.write_transactions(cursor, transform(self.source, entries))
+
+    def migrate_transactions(self, cursor):
+        print("💰 Migriere Transaktionen...")
+        count = self.write_entries(cursor, self.source.entries())
+        mode = " (spaltenweise, COPY)" if self.columnar else " (COPY)" if self.sink.bulk else ""
+        print(f"✅ {count} Transaktionen migriert{mode}")
+        return count
+
+    def migrate_transactions_chunked(self, conn):
+        print("💰 Migriere Transaktionen in Chunks...")
+
+        count = migrate_in_chunks(
+            conn, self.source.path, self.source.entries(), self.source.username_of,
+            self.write_entries, self.chunk_size, self.resume
+        )
+        print(f"✅ {count} Transaktionen migriert (Chunks à {self.chunk_size})")
+        return count
+
+    def migrate_transactions_incremental(self, cursor):
+        print("💰 Migriere neue Transaktionen...")
+        inserted, existing = migrate_consumption_incrementally(
+            cursor,
+            self.sink.rows(transform(self.source, self.source.entries())),
+            self.sink.batch_size
+        )
+        print(f"✅ {inserted} neue Transaktionen migriert ({existing} bereits vorhanden)")
+        return inserted
+
+    def migrate_admin(self, cursor):
+        print("⚙️ Migriere Admin-Einstellungen...")
+        count = self.sink.write_admin(cursor, self.source.admin())
+        print(f"✅ {count} Admin-Einstellungen migriert")
+        return count
+
+    def sink_partitioned(self):
+        return getattr(self.sink, 'partitioned', False)
+
+    def split_default_partition(self, cursor):
+        created, moved = ledger_partitions.ensure_partitions(cursor)
+        if created or moved:
+            print(f"🗂️ {len(created)} Monatspartitionen angelegt, {moved} Zeilen aus der Default-Partition verschoben")
+        return moved
+
+    def verify_against_source(self, conn):
+        """Vergleicht die Digests je Benutzer; wirft bei Abweichungen"""
+        print("🔍 Verifiziere Transaktionen gegen die Quelle...")
+        result = migration_verify.verify_against_source(self.source, transform, conn, self.sink.ledger_key)
+        migration_verify.print_report(result)
+        if result['mismatched']:
+            raise RuntimeError(f"Verifikation fehlgeschlagen: {len(result['mismatched'])} Benutzer weichen ab")
+        return result['transactions']
+
+    def run(self, conn):
+        """Führt alle Stufen aus und committet"""
+        profile = self.profiler.run
+        cursor = conn.cursor()
+
+        if isinstance(self.sink, UserIdSchemaSink):
+            self.sink.partitioned = ledger_partitions.is_partitioned(cursor)
+
+        profile('drinks', self.migrate_drinks, cursor)
+
+        if self.workers > 1:
+            # Getränke und Admin-Einstellungen einmal vorab, Benutzer parallel
+            from parallel_migration import run_sharded_migration
+            profile('admin', self.migrate_admin, cursor)
+            print("👥 Migriere Benutzer und Transaktionen...")
+            profile(
+                'users_and_transactions', run_sharded_migration,
+                conn, self.source, self.connect_kwargs, self.workers, self.sink.batch_size
+            )
+        elif self.chunk_size:
+            # Getränke, Admin-Einstellungen und Benutzer vor dem ersten Chunk committen
+            profile('admin', self.migrate_admin, cursor)
+            profile('users', self.migrate_users, cursor)
+            profile('commit', conn.commit)
+            profile('transactions', self.migrate_transactions_chunked, conn)
+        elif self.incremental:
+            profile('users', self.migrate_users, cursor)
+            profile('transactions', self.migrate_transactions_incremental, cursor)
+            profile('admin', self.migrate_admin, cursor)
+        else:
+            profile('users', self.migrate_users, cursor)
+            profile('transactions', self.migrate_transactions, cursor)
+            profile('admin', self.migrate_admin, cursor)
+
+        if self.sink_partitioned():
+            # Zeilen aus Workern und Einzel-INSERTs landen ggf. in der Default-Partition
+            profile('partitions', self.split_default_partition, cursor)
+
+        profile('commit', conn.commit)
+        cursor.close()
+
+        if self.verify:
+            profile('verify', self.verify_against_source, conn)
+
+# === KOMMANDOZEILE ===
+
+def add_pipeline_arguments(parser, advanced=True):
+    """Fügt die gemeinsamen Optionen der Migrationsskripte hinzu"""
+    parser.add_argument('--bulk', action='store_true',
+                       help='Transaktionen per COPY statt einzelner INSERTs laden')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                       help=f'Zeilen pro COPY-Batch (Standard: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--staging', action='store_true',
+                       help='Bulk-Load über eine temporäre Staging-Tabelle')
+    parser.add_argument('--columnar', action='store_true',
+                       help='Transaktionen spaltenweise in Batches transformieren und per COPY laden')
+    parser.add_argument('--verify', action='store_true',
+                       help='Nach der Migration Digests je Benutzer mit der Quelle vergleichen')
+    if not advanced:
+        return
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Anzahl paralleler Worker-Prozesse, nach username geshardet (Standard: 1)')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                       help='Commit nach je N Transaktionen mit Checkpoint (Standard: eine Transaktion)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Nach einem Abbruch am letzten Checkpoint fortsetzen')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Nur neue Transaktionen übernehmen (High-Water-Mark und Abgleich über den natürlichen Schlüssel)')
+
+def validate_pipeline_arguments(parser, args):
+    """Prüft Kombinationen der gemeinsamen Optionen"""
+    args.bulk = args.bulk or args.staging or args.columnar
+    if not hasattr(args, 'workers'):
+        return args
+    if args.resume and not args.chunk_size:
+        args.chunk_size = DEFAULT_CHUNK_SIZE
+    if args.chunk_size and args.workers > 1:
+        parser.error('--chunk-size/--resume kann nicht mit --workers kombiniert werden')
+    if args.incremental and (args.chunk_size or args.workers > 1):
+        parser.error('--incremental kann nicht mit --chunk-size/--resume oder --workers kombiniert werden')
+    if args.columnar and (args.incremental or args.workers > 1):
+        parser.error('--columnar kann nicht mit --incremental oder --workers kombiniert werden')
+    return args
+
+def build_pipeline(source, sink_class, args, connect_kwargs=None, profiler=None):
+    """Erzeugt die Pipeline aus den geparsten Kommandozeilen-Optionen"""
+    sink = sink_class(args.bulk, args.batch_size, args.staging)
+    return MigrationPipeline(
+        source, sink,
+        chunk_size=getattr(args, 'chunk_size', 0),
+        resume=getattr(args, 'resume', False),
+        incremental=getattr(args, 'incremental', False),
+        workers=getattr(args, 'workers', 1),
+        connect_kwargs=connect_kwargs,
+        columnar=args.columnar,
+        profiler=profiler,
+        verify=args.verify
+    )
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Hash-basierter Abgleich zwischen JSON-Quelle und Datenbank nach einer Migration
+Je Benutzer wird über die normalisierten Tupel (Datum, Betrag, Typ,
+Beschreibung) ein reihenfolgeunabhängiger Digest gebildet: auf der JSON-Seite
+in einem Durchlauf über den Stream, auf der Datenbank-Seite mit einer einzigen
+aggregierten Abfrage. Nur Benutzer mit abweichendem Digest werden danach Tupel
+für Tupel verglichen.
+"""
+
+import hashlib
+from collections import Counter
+from decimal import Decimal, ROUND_HALF_UP
+
+# Benutzer, für die Einzelabweichungen ermittelt werden
+DRILL_DOWN_USERS = 20
+
+# Abweichende Tupel, die je Benutzer angezeigt werden
+DRILL_DOWN_ROWS = 5
+
+# Spalten der Transaktionstabelle je Ziel-Schema (Schlüssel, Datum, Beschreibung)
+LEDGER_COLUMNS = {
+    'user_id': ('user_id', 'id', 'transaction_date', 'description'),
+    'username': ('username', 'username', 'timestamp', 'note'),
+}
+
+_SIGN = 1 << 63
+_HALF = 1 << 64
+
+def normalize(record):
+    """Kanonische Textform eines TransactionRecords, identisch zu _canonical_sql"""
+    cents = Decimal(str(record.amount)).quantize(Decimal('0.01'), ROUND_HALF_UP) * 100
+    return (
+        f"{record.date.strftime('%Y-%m-%dT%H:%M:%S.%f')}|{int(cents)}|"
+        f"{record.type}|{record.description or ''}"
+    )
+
+def _canonical_sql(date_column, description_column):
+    return (
+        f"to_char(t.{date_column}, 'YYYY-MM-DD\"T\"HH24:MI:SS.US') || '|' || "
+        f"(t.amount * 100)::bigint || '|' || t.transaction_type || '|' || "
+        f"COALESCE(t.{description_column}, '')"
+    )
+
+def _halves(digest):
+    """md5 als zwei vorzeichenbehaftete 64-Bit-Werte wie bit(64)::bigint in SQL"""
+    values = []
+    for part in (digest[:16], digest[16:]):
+        value = int(part, 16)
+        values.append(value - _HALF if value >= _SIGN else value)
+    return values
+
+def source_digests(source, transform):
+    """{username: (Anzahl, Summe1, Summe2)} über alle Transaktionen der Quelle"""
+    digests = {user.username: [0, 0, 0] for user in source.users()}
+    for record in transform(source, source.entries()):
+        high, low = _halves(hashlib.md5(normalize(record).encode('utf-8')).hexdigest())
+        entry = digests.setdefault(record.username, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += high
+        entry[2] += low
+    return {username: tuple(entry) for username, entry in digests.items()}
+
+def database_digests(cursor, key):
+    """Dieselben Digests für alle Benutzer der Datenbank in einer Abfrage"""
+    ledger_column, user_column, date_column, description_column = LEDGER_COLUMNS[key]
+    cursor.execute(f"""
+        SELECT u.username, COUNT(t.h),
+               COALESCE(SUM(('x' || substr(t.h, 1, 16))::bit(64)::bigint::numeric), 0),
+               COALESCE(SUM(('x' || substr(t.h, 17, 16))::bit(64)::bigint::numeric), 0)
+        FROM users u
+        LEFT JOIN (
+            SELECT {ledger_column}, md5({_canonical_sql(date_column, description_column)}) AS h
+            FROM transactions t
+        ) t ON t.{ledger_column} = u.{user_column}
+        GROUP BY u.username
+    """)
+    return {username: (count, int(high), int(low)) for username, count, high, low in cursor.fetchall()}
+
+def diff_digests(source, database):
+    """Liefert die Benutzer mit abweichendem oder fehlendem Digest, sortiert"""
+    return sorted(
+        username for username in source.keys() | database.keys()
+        if source.get(username) != database.get(username)
+    )
+
+def drill_down(source, transform, cursor, key, usernames):
+    """Vergleicht für wenige Benutzer die einzelnen Tupel
+
+    Gibt {username: (nur in der Quelle, nur in der Datenbank)} mit Counter-
+    Objekten der kanonischen Tupel zurück.
+    """
+    wanted = set(usernames)
+    expected = {username: Counter() for username in wanted}
+    for record in transform(source.for_shard(lambda username: username in wanted), source.entries()):
+        if record.username in wanted:
+            expected[record.username][normalize(record)] += 1
+
+    ledger_column, user_column, date_column, description_column = LEDGER_COLUMNS[key]
+    cursor.execute(f"""
+        SELECT u.username, {_canonical_sql(date_column, description_column)}
+        FROM transactions t
+        JOIN users u ON u.{user_column} = t.{ledger_column}
+        WHERE u.username = ANY(%s)
+    """, (list(wanted),))
+    actual = {username: Counter() for username in wanted}
+    for username, canonical in cursor.fetchall():
+        actual[username][canonical] += 1
+
+    return {
+        username: (expected[username] - actual[username], actual[username] - expected[username])
+        for username in usernames
+    }
+
+def verify_against_source(source, transform, conn, key, drill_users=DRILL_DOWN_USERS):
+    """Vergleicht Quelle und Datenbank und liefert ein Ergebnis-Dict
+
+    Enthält die Anzahl verglichener Benutzer und Transaktionen, die Liste der
+    abweichenden Benutzer und für die ersten drill_users die Einzeltupel.
+    """
+    expected = source_digests(source, transform)
+    cursor = conn.cursor()
+    actual = database_digests(cursor, key)
+    mismatched = diff_digests(expected, actual)
+
+    details = {}
+    if mismatched:
+        details = drill_down(source, transform, cursor, key, mismatched[:drill_users])
+    conn.rollback()
+    cursor.close()
+
+    return {
+        'users': len(expected),
+        'transactions': sum(entry[0] for entry in expected.values()),
+        'mismatched': mismatched,
+        'details': details
+    }
+
+def print_report(result):
+    """Gibt das Ergebnis von verify_against_source aus"""
+    mismatched = result['mismatched']
+    if not mismatched:
+        print(f"✅ Verifikation: {result['users']} Benutzer und {result['transactions']} "
+              f"Transaktionen stimmen mit der Quelle überein")
+        return
+
+    print(f"❌ Verifikation: {len(mismatched)} von {result['users']} Benutzern weichen von der Quelle ab")
+    for username, (missing, extra) in result['details'].items():
+        print(f"  {username}: {sum(missing.values())} fehlen, {sum(extra.values())} zusätzlich in der Datenbank")
+        for canonical in list(missing.elements())[:DRILL_DOWN_ROWS]:
+            print(f"    - {canonical}")
+        for canonical in list(extra.elements())[:DRILL_DOWN_ROWS]:
+            print(f"    + {canonical}")
+    if len(mismatched) > len(result['details']):
+        print(f"  ... und {len(mismatched) - len(result['details'])} weitere Benutzer")
@@ -1,12 +1,8 @@
--- Erstelle Tabellen für Getränkekasse
--- Lösche bestehende Tabellen falls vorhanden
-DROP TABLE IF EXISTS transactions;
-DROP TABLE IF EXISTS users;
-DROP TABLE IF EXISTS drinks;
-DROP TABLE IF EXISTS admin_settings;
+-- Grundschema der Getränkekasse (vorher create_tables.sql)
+-- IF NOT EXISTS übernimmt auch Datenbanken, die vor der Versionierung angelegt wurden
 
 -- Drinks Tabelle
-CREATE TABLE drinks (
+CREATE TABLE IF NOT EXISTS drinks (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) UNIQUE NOT NULL,
     price DECIMAL(10,2) NOT NULL,
@@ -14,7 +10,7 @@ CREATE TABLE drinks (
 );
 
 -- Users Tabelle
-CREATE TABLE users (
+CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     username VARCHAR(255) UNIQUE NOT NULL,
     pin VARCHAR(4) NOT NULL,
@@ -23,7 +19,7 @@ CREATE TABLE users (
 );
 
 -- Transactions Tabelle (für consumption history)
-CREATE TABLE transactions (
+CREATE TABLE IF NOT EXISTS transactions (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     transaction_date TIMESTAMP NOT NULL,
@@ -35,21 +31,20 @@ CREATE TABLE transactions (
 );
 
 -- Admin Tabelle
-CREATE TABLE admin_settings (
+CREATE TABLE IF NOT EXISTS admin_settings (
     id SERIAL PRIMARY KEY,
     setting_key VARCHAR(255) UNIQUE NOT NULL,
     setting_value TEXT,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Indizes erstellen
-CREATE INDEX idx_transactions_user_id ON transactions(user_id);
-CREATE INDEX idx_transactions_date ON transactions(transaction_date);
-CREATE INDEX idx_transactions_type ON transactions(transaction_type);
+-- Indizes
+CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions(user_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(transaction_date);
+CREATE INDEX IF NOT EXISTS idx_transactions_type ON transactions(transaction_type);
 
 -- Standard Admin-Einstellungen
-INSERT INTO admin_settings (setting_key, setting_value) VALUES 
+INSERT INTO admin_settings (setting_key, setting_value) VALUES
 ('password', '9999'),
-('timersDisabled', 'false');
-
-COMMIT;
+('timersDisabled', 'false')
+ON CONFLICT (setting_key) DO NOTHING;
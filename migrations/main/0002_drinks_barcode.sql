@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Barcode je Getränk (vorher add_barcode_column.sql)
+-- Spalte ohne Default: nur eine kurze Sperre; der eindeutige Index wird
+-- nebenläufig gebaut und trägt den Namen der früheren UNIQUE-Constraint
+ALTER TABLE drinks ADD COLUMN IF NOT EXISTS barcode VARCHAR(255);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS drinks_barcode_key ON drinks (barcode);
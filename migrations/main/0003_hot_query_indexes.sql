@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- Indizes für die heißen Abfragen (geprüft mit plan_check.py)
+-- getUserTransactions (database.js): Transaktionen eines Benutzers, neueste zuerst, ohne Sortierung
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, transaction_date DESC);
+-- Top-Getränke: nur Käufe, per Index-Only-Scan zählbar
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_purchase_drink ON transactions (drink_name) WHERE transaction_type = 'purchase';
+-- user_id allein deckt idx_transactions_user_date mit ab
+DROP INDEX CONCURRENTLY IF EXISTS idx_transactions_user_id;
@@ -0,0 +1,26 @@
+-- Vereinfachtes Schema von migrate_simple.py: transactions.username -> users.username
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(255) UNIQUE NOT NULL,
+    display_name VARCHAR(255) NOT NULL,
+    pin_hash VARCHAR(255) NOT NULL,
+    balance DECIMAL(10,2) DEFAULT 0.00,
+    role VARCHAR(50) DEFAULT 'user',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(255) NOT NULL,
+    transaction_type VARCHAR(50) NOT NULL,
+    amount DECIMAL(10,2) NOT NULL,
+    item_name VARCHAR(255),
+    timestamp TIMESTAMP NOT NULL,
+    note TEXT,
+    FOREIGN KEY (username) REFERENCES users(username)
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_transactions_username ON transactions(username);
+CREATE INDEX IF NOT EXISTS idx_transactions_timestamp ON transactions(timestamp);
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Parallele, nach Benutzern geshardete Migration für Getränkekasse
+Jeder Worker-Prozess lädt seinen Shard über eine eigene Verbindung in
+UNLOGGED-Staging-Tabellen; der Koordinator übernimmt alle Shards in einer
+einzigen Transaktion, sodass ein fehlgeschlagener Shard nichts hinterlässt.
+"""
+
+import uuid
+import zlib
+from multiprocessing import Pool
+import db_access
+from bulk_load import DEFAULT_BATCH_SIZE, copy_rows
+from migration_pipeline import transform
+
+def shard_of(username, workers):
+    """Stabile Shard-Nummer eines Benutzers (unabhängig von PYTHONHASHSEED)"""
+    return zlib.crc32(username.encode('utf-8')) % workers
+
+def _shard_tables(run_id, shard):
+    return (
+        f"migration_shard_{run_id}_{shard}_users",
+        f"migration_shard_{run_id}_{shard}_transactions"
+    )
+
+def _load_shard(args):
+    """Worker: lädt alle Benutzer eines Shards samt Transaktionen in Staging-Tabellen"""
+    source, connect_kwargs, run_id, shard, workers, batch_size = args
+    users_table, transactions_table = _shard_tables(run_id, shard)
+
+    source = source.for_shard(lambda username: shard_of(username, workers) == shard)
+
+    conn = db_access.open_target(**connect_kwargs)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            CREATE UNLOGGED TABLE {users_table} (
+                seq BIGSERIAL,
+                username VARCHAR(255) NOT NULL,
+                pin VARCHAR(4) NOT NULL,
+                balance DECIMAL(10,2)
+            )
+        """)
+        cursor.execute(f"""
+            CREATE UNLOGGED TABLE {transactions_table} (
+                username VARCHAR(255) NOT NULL,
+                transaction_date TIMESTAMP NOT NULL,
+                amount DECIMAL(10,2) NOT NULL,
+                transaction_type VARCHAR(50) NOT NULL,
+                description TEXT,
+                drink_name VARCHAR(255)
+            )
+        """)
+
+        user_count = copy_rows(
+            cursor, users_table, ('username', 'pin', 'balance'),
+            ((user.username, user.pin, user.balance) for user in source.users()),
+            batch_size
+        )
+
+        transaction_count = copy_rows(
+            cursor, transactions_table,
+            ('username', 'transaction_date', 'amount', 'transaction_type', 'description', 'drink_name'),
+            transform(source, source.entries()),
+            batch_size
+        )
+
+        conn.commit()
+        cursor.close()
+        return shard, user_count, transaction_count
+    finally:
+        conn.close()
+
+def _merge_shard(cursor, run_id, shard):
+    """Übernimmt einen Shard set-basiert in users und transactions"""
+    users_table, transactions_table = _shard_tables(run_id, shard)
+
+    # Bei doppelten Benutzern gewinnt wie bisher der letzte Eintrag
+    cursor.execute(f"""
+        INSERT INTO users (username, pin, balance)
+        SELECT DISTINCT ON (username) username, pin, balance
+        FROM {users_table}
+        ORDER BY username, seq DESC
+        ON CONFLICT (username) DO UPDATE SET
+            pin = EXCLUDED.pin,
+            balance = EXCLUDED.balance
+    """)
+
+    cursor.execute(f"""
+        INSERT INTO transactions
+        (user_id, transaction_date, amount, transaction_type, description, drink_name)
+        SELECT u.id, s.transaction_date, s.amount, s.transaction_type, s.description, s.drink_name
+        FROM {transactions_table} s
+        JOIN users u ON u.username = s.username
+    """)
+
+def _drop_shard_tables(cursor, run_id, workers):
+    for shard in range(workers):
+        for table in _shard_tables(run_id, shard):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+def run_sharded_migration(conn, source, connect_kwargs, workers, batch_size=DEFAULT_BATCH_SIZE):
+    """Migriert Benutzer und Transaktionen mit mehreren Worker-Prozessen
+
+    Getränke und Admin-Einstellungen migriert der Aufrufer vorab über conn.
+    Die Übernahme aller Shards läuft in der offenen Transaktion von conn, der
+    Aufrufer committet. Schlägt ein Shard fehl, wird conn zurückgerollt, die
+    Staging-Tabellen werden entfernt und der Fehler wird weitergereicht.
+    """
+    run_id = uuid.uuid4().hex[:12]
+    print(f"🔀 Starte {workers} Worker (Lauf {run_id})...")
+
+    jobs = [
+        (source, connect_kwargs, run_id, shard, workers, batch_size)
+        for shard in range(workers)
+    ]
+
+    try:
+        with Pool(processes=workers) as pool:
+            results = pool.map(_load_shard, jobs)
+
+        cursor = conn.cursor()
+        total_users = 0
+        total_transactions = 0
+        for shard, user_count, transaction_count in sorted(results):
+            print(f"  Shard {shard}: {user_count} Benutzer, {transaction_count} Transaktionen")
+            _merge_shard(cursor, run_id, shard)
+            total_users += user_count
+            total_transactions += transaction_count
+
+        # Staging-Tabellen verschwinden mit dem Commit des Aufrufers
+        _drop_shard_tables(cursor, run_id, workers)
+        cursor.close()
+
+    except Exception:
+        conn.rollback()
+        cursor = conn.cursor()
+        _drop_shard_tables(cursor, run_id, workers)
+        conn.commit()
+        cursor.close()
+        print("❌ Mindestens ein Shard ist fehlgeschlagen, nichts wurde übernommen")
+        raise
+
+    print(f"✅ {total_users} Benutzer und {total_transactions} Transaktionen migriert ({workers} Worker)")
+    return total_users, total_transactions
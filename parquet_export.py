@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Spaltenorientierter Parquet-Export des Transaktionsjournals der Getränkekasse
+Streamt transactions (mit username) über einen serverseitigen Cursor in
+monatsweise partitionierte Parquet-Dateien (transactions/month=JJJJ-MM/) und
+schreibt drinks und users als Dimensionsdateien. Es ist immer nur eine
+Row-Group im Speicher. pyarrow ist optional und wird nur hierfür benötigt.
+"""
+
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow ist optional
+    pa = None
+    pq = None
+
+# Zeilen pro Row-Group (begrenzt den Speicherbedarf beim Schreiben)
+ROW_GROUP_SIZE = 100000
+
+TRANSACTION_FIELDS = (
+    ('id', 'int64'),
+    ('user_id', 'int32'),
+    ('username', 'string'),
+    ('transaction_date', 'timestamp'),
+    ('amount', 'decimal'),
+    ('transaction_type', 'dictionary'),
+    ('description', 'string'),
+    ('drink_name', 'dictionary'),
+)
+
+# Spalten mit wenigen verschiedenen Werten werden wörterbuchkodiert
+DICTIONARY_COLUMNS = ['transaction_type', 'drink_name', 'username']
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow nicht installiert (pip install pyarrow)")
+
+def _arrow_type(kind):
+    return {
+        'int64': pa.int64(),
+        'int32': pa.int32(),
+        'string': pa.string(),
+        'timestamp': pa.timestamp('us'),
+        'decimal': pa.decimal128(10, 2),
+        'dictionary': pa.dictionary(pa.int32(), pa.string()),
+    }[kind]
+
+def transaction_schema():
+    require_pyarrow()
+    return pa.schema([(name, _arrow_type(kind)) for name, kind in TRANSACTION_FIELDS])
+
+def _write_table(path, columns, rows):
+    """Schreibt eine kleine Dimensionstabelle in eine Parquet-Datei"""
+    names = [name for name, _ in columns]
+    data = list(zip(*rows)) if rows else [[] for _ in names]
+    table = pa.table(
+        [pa.array(values, type=arrow_type) for values, (_, arrow_type) in zip(data, columns)],
+        names=names
+    )
+    pq.write_table(table, path, compression='zstd')
+    return table.num_rows
+
+class MonthPartitionWriter:
+    """Schreibt Row-Groups in die Parquet-Datei des jeweiligen Monats
+
+    Die Zeilen kommen nach transaction_date sortiert, daher ist immer nur die
+    Datei des aktuellen Monats geöffnet.
+    """
+
+    def __init__(self, directory, schema):
+        self.directory = directory
+        self.schema = schema
+        self.month = None
+        self.writer = None
+        self.files = []
+
+    def _open(self, month):
+        self.close()
+        partition = os.path.join(self.directory, f"month={month}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, 'part-0.parquet')
+        self.writer = pq.ParquetWriter(
+            path, self.schema, compression='zstd', use_dictionary=DICTIONARY_COLUMNS
+        )
+        self.month = month
+        self.files.append(path)
+
+    def write(self, month, columns):
+        if month != self.month:
+            self._open(month)
+        batch = pa.record_batch(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+def _export_range(conn, partitions, bounds, fetch_size, ledger='transactions'):
+    """Streamt die Transaktionen eines Zeitraums (oder aller) in die Monatsdateien"""
+    where = "WHERE t.transaction_date >= %s AND t.transaction_date < %s" if bounds else ""
+    rows_cursor = conn.cursor(name='export_ledger')
+    rows_cursor.itersize = fetch_size
+    rows_cursor.execute(f"""
+        SELECT to_char(t.transaction_date, 'YYYY-MM'),
+               t.id, t.user_id, u.username, t.transaction_date, t.amount,
+               t.transaction_type, t.description, t.drink_name
+        FROM {ledger} t
+        JOIN users u ON u.id = t.user_id
+        {where}
+        ORDER BY t.transaction_date, t.id
+    """, bounds)
+
+    total = 0
+    try:
+        while True:
+            rows = rows_cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            # Eine Row-Group je Monat und Abruf
+            start = 0
+            while start < len(rows):
+                month = rows[start][0]
+                end = start
+                while end < len(rows) and rows[end][0] == month:
+                    end += 1
+                partitions.write(month, [list(column) for column in zip(*rows[start:end])][1:])
+                start = end
+            total += len(rows)
+    finally:
+        rows_cursor.close()
+    return total
+
+def export_ledger(conn, directory, profiler, fetch_size=ROW_GROUP_SIZE, months=None, ledger='transactions'):
+    """Exportiert Dimensionen und Transaktionsjournal nach directory
+
+    Mit months (Liste von (Beginn, Ende)) wird das Journal je Monat abgefragt,
+    sodass bei partitioniertem transactions jede Abfrage nur eine Partition
+    liest und sortiert. ledger ist die Tabelle oder Unterabfrage der
+    Transaktionen, etwa einschließlich Archiv. Gibt ein Dict mit den Zeilenzahlen und geschriebenen
+    Monatsdateien zurück.
+    """
+    require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    cursor = conn.cursor()
+    result = {}
+
+    with profiler.stage('drinks') as stage:
+        cursor.execute("SELECT id, name, price FROM drinks ORDER BY name")
+        stage.rows = result['drinks'] = _write_table(
+            os.path.join(directory, 'drinks.parquet'),
+            [('id', pa.int32()), ('name', pa.string()), ('price', pa.decimal128(10, 2))],
+            cursor.fetchall()
+        )
+
+    with profiler.stage('users') as stage:
+        cursor.execute("SELECT id, username, balance, created_at FROM users ORDER BY id")
+        stage.rows = result['users'] = _write_table(
+            os.path.join(directory, 'users.parquet'),
+            [('id', pa.int32()), ('username', pa.string()),
+             ('balance', pa.decimal128(10, 2)), ('created_at', pa.timestamp('us'))],
+            cursor.fetchall()
+        )
+    cursor.close()
+
+    schema = transaction_schema()
+    partitions = MonthPartitionWriter(os.path.join(directory, 'transactions'), schema)
+
+    with profiler.stage('export') as stage:
+        total = 0
+        try:
+            for bounds in months or [None]:
+                total += _export_range(conn, partitions, bounds, fetch_size, ledger)
+        finally:
+            partitions.close()
+
+        stage.rows = result['transactions'] = total
+
+    result['partitions'] = partitions.files
+    return result
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Plan-Prüfung der heißen Abfragen für Getränkekasse
+Führt für jede Abfrage, die die App im laufenden Betrieb ständig stellt,
+EXPLAIN (ANALYZE, BUFFERS) aus und schlägt fehl, sobald ein Plan auf einen
+sequentiellen Scan zurückfällt oder mehr Puffer-Blöcke liest als erlaubt.
+Standardmäßig wird eine wegwerfbare Datenbank mit synthetischen Daten über den
+normalen Migrationspfad befüllt, sodass genau die Indizes aus migrations/
+geprüft werden; mit --live läuft die Prüfung gegen die Datenbank aus
+database-config.json.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import namedtuple
+import db_access
+from benchmark_migration import ThrowawayPostgres
+from generate_benchmark_data import add_generator_arguments, generate
+from migration_pipeline import NestedJsonSource, UserIdSchemaSink, MigrationPipeline
+
+# sql mit %(username)s; seq_scan_ok: Relationen, die vollständig gelesen werden
+# dürfen; buffer_budget: Blöcke (Treffer + gelesen) bei den Standardparametern
+HotQuery = namedtuple('HotQuery', 'name sql seq_scan_ok buffer_budget')
+
+HOT_QUERIES = (
+    # database.js getUserTransactions
+    HotQuery('user_transactions', """
+        SELECT t.transaction_date as date, t.amount, t.transaction_type as type,
+               t.description, t.drink_name
+        FROM transactions t
+        JOIN users u ON t.user_id = u.id
+        WHERE u.username = %(username)s
+        ORDER BY t.transaction_date DESC
+    """, (), 150),
+    # database.js getUser / Anmeldung
+    HotQuery('user_by_username', """
+        SELECT id, username, pin, balance FROM users WHERE username = %(username)s
+    """, (), 10),
+    # Letzte Käufe eines Benutzers (Verlauf mit Limit)
+    HotQuery('user_recent_transactions', """
+        SELECT t.transaction_date, t.amount, t.transaction_type, t.drink_name
+        FROM transactions t
+        JOIN users u ON t.user_id = u.id
+        WHERE u.username = %(username)s
+        ORDER BY t.transaction_date DESC
+        LIMIT 20
+    """, (), 40),
+    # Top-Getränke wie in show_database_stats und stats_summary_rebuild
+    HotQuery('top_drinks', """
+        SELECT drink_name, COUNT(*) as purchases
+        FROM transactions
+        WHERE transaction_type = 'purchase' AND drink_name IS NOT NULL
+        GROUP BY drink_name
+        ORDER BY purchases DESC
+        LIMIT 5
+    """, (), 600),
+)
+
+SCRATCH_DATABASE = 'plan_check'
+
+# Sequentielle Scans über weniger Zeilen (leere Partitionen, winzige Tabellen)
+# sind billiger als ein Index und kein Befund; echte Regressionen fängt das
+# Puffer-Budget
+SEQ_SCAN_MIN_ROWS = 100
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from _plan_nodes(child)
+
+def _scanned_rows(node):
+    """Gelesene Zeilen eines Scan-Knotens über alle Schleifen, inklusive gefilterter"""
+    rows = node.get('Actual Rows', 0) + node.get('Rows Removed by Filter', 0)
+    return rows * node.get('Actual Loops', 1)
+
+def _explain(cursor, query, params):
+    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query.sql}", params)
+    result = cursor.fetchone()[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]['Plan']
+
+def check_query(cursor, query, params, budget_scale=1.0):
+    """Prüft den Plan einer Abfrage
+
+    Gibt (Plan-Wurzel, Blöcke, Liste der Verstöße) zurück. Die Blöcke sind die
+    Summe aus Treffern und Lesezugriffen im geteilten Puffer über den ganzen
+    Plan, ohne die Planung selbst. Sequentielle Scans über weniger als
+    SEQ_SCAN_MIN_ROWS Zeilen zählen nicht als Verstoß.
+    """
+    plan = _explain(cursor, query, params)
+    problems = []
+    for node in _plan_nodes(plan):
+        relation = node.get('Relation Name')
+        if (node['Node Type'].endswith('Seq Scan') and relation not in query.seq_scan_ok
+                and _scanned_rows(node) >= SEQ_SCAN_MIN_ROWS):
+            problems.append(f"sequentieller Scan auf {relation}")
+
+    buffers = plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0)
+    budget = int(query.buffer_budget * budget_scale)
+    if buffers > budget:
+        problems.append(f"{buffers} Blöcke statt höchstens {budget}")
+    return plan, buffers, problems
+
+def _sample_username(cursor):
+    """Ein Benutzer aus der Mitte der id-Reihenfolge als Parameter"""
+    cursor.execute("SELECT username FROM users ORDER BY id OFFSET (SELECT COUNT(*) / 2 FROM users) LIMIT 1")
+    row = cursor.fetchone()
+    if row is None:
+        raise RuntimeError("Keine Benutzer in der Datenbank")
+    return row[0]
+
+def check_plans(conn, queries=HOT_QUERIES, budget_scale=1.0, verbose=False):
+    """Prüft alle Abfragen und gibt die Liste der fehlgeschlagenen Namen zurück
+
+    Jede Abfrage läuft einmal zum Aufwärmen, damit die angezeigte Zeit nicht
+    vom kalten Cache abhängt; das Budget zählt Treffer und Lesezugriffe
+    gleichermaßen und ist davon unabhängig. ANALYZE führt die
+    Abfragen aus; alles läuft daher in einer Transaktion, die verworfen wird.
+    """
+    cursor = conn.cursor()
+    params = {'username': _sample_username(cursor)}
+    failed = []
+    try:
+        for query in queries:
+            cursor.execute(query.sql, params)
+            cursor.fetchall()
+            plan, buffers, problems = check_query(cursor, query, params, budget_scale)
+            if problems:
+                failed.append(query.name)
+                print(f"❌ {query.name}: {'; '.join(problems)}")
+            else:
+                print(f"✅ {query.name}: {plan['Node Type']}, {buffers} Blöcke, "
+                      f"{plan['Actual Total Time']:.2f} ms")
+            if verbose or problems:
+                for node in _plan_nodes(plan):
+                    relation = f" auf {node['Relation Name']}" if 'Relation Name' in node else ''
+                    index = f" ({node['Index Name']})" if 'Index Name' in node else ''
+                    print(f"    {node['Node Type']}{relation}{index}: {node['Actual Rows']} Zeilen")
+    finally:
+        conn.rollback()
+        cursor.close()
+    return failed
+
+def seed_database(connect_kwargs, args):
+    """Befüllt eine leere Datenbank über Migrationen und Pipeline wie im Betrieb"""
+    data_dir = tempfile.mkdtemp(prefix='getraenkekasse_plan_check_')
+    try:
+        data_path = os.path.join(data_dir, 'data.json')
+        counts = generate(
+            data_path, 'nested', args.users, args.transactions_per_user,
+            args.drinks, args.days, args.seed
+        )
+        print(f"📂 {counts['users']} Benutzer, {counts['transactions']} Transaktionen")
+
+        conn = db_access.open_target(**connect_kwargs)
+        try:
+            cursor = conn.cursor()
+            UserIdSchemaSink.create_tables(cursor, args.partitioned)
+            conn.commit()
+            cursor.close()
+
+            source = NestedJsonSource(data_path)
+            source.check()
+            sink = UserIdSchemaSink(bulk=True)
+            MigrationPipeline(source, sink, connect_kwargs=connect_kwargs).run(conn)
+
+            # Sichtbarkeitskarte und Statistiken wie nach autovacuum
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute("VACUUM ANALYZE")
+            cursor.close()
+            conn.autocommit = False
+        finally:
+            conn.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def parse_args():
+    """Liest die Kommandozeilen-Optionen"""
+    parser = argparse.ArgumentParser(description='Plan-Prüfung der heißen Abfragen')
+    add_generator_arguments(parser)
+    parser.add_argument('--partitioned', action='store_true',
+                       help='transactions in der Testdatenbank monatsweise partitionieren')
+    parser.add_argument('--live', action='store_true',
+                       help='Ohne Befüllen gegen die Datenbank aus database-config.json prüfen')
+    parser.add_argument('--existing', action='store_true',
+                       help='Scratch-Datenbank auf dem Server aus database-config.json statt eines temporären Clusters')
+    parser.add_argument('--budget-scale', type=float, default=1.0,
+                       help='Faktor für die Puffer-Budgets, z.B. bei größeren Daten (Standard: 1.0)')
+    parser.add_argument('--verbose', action='store_true',
+                       help='Plan-Knoten auch bei bestandener Prüfung anzeigen')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    print("🔍 Prüfe Pläne der heißen Abfragen...")
+
+    try:
+        if args.live:
+            conn = db_access.open_connection()
+            try:
+                failed = check_plans(conn, budget_scale=args.budget_scale, verbose=args.verbose)
+            finally:
+                conn.close()
+        else:
+            with ThrowawayPostgres(existing=args.existing) as server:
+                with server.scratch_database(SCRATCH_DATABASE) as connect_kwargs:
+                    seed_database(connect_kwargs, args)
+                    conn = db_access.open_target(**connect_kwargs)
+                    try:
+                        failed = check_plans(conn, budget_scale=args.budget_scale, verbose=args.verbose)
+                    finally:
+                        conn.close()
+    except Exception as e:
+        print(f"❌ Plan-Prüfung fehlgeschlagen: {e}")
+        sys.exit(1)
+
+    if failed:
+        print(f"❌ Plan-Regression: {', '.join(failed)}")
+        sys.exit(1)
+    print("✅ Alle Pläne innerhalb der Vorgaben")
+
+if __name__ == "__main__":
+    main()
@@ -8,54 +8,159 @@ import subprocess
 import sys
 import os
 import argparse
-from datetime import datetime
+import time
+from datetime import datetime, date
 import psycopg2
+from stage_profiler import StageProfiler, add_profile_arguments, profiler_from_args
+import parquet_export
+import incremental_backup
+import shadow_restore
+import backup_verify
+import stats_summary
+import balance_reconcile
+import ledger_partitions
+import ledger_archive
+import schema_migrate
+import db_access
 
-# Konfiguration
-DATABASE_NAME = "getraenkekasse"
-DATABASE_USER = "getraenkekasse_user"
-DEFAULT_PASSWORD = "getraenkekasse_password_2025"
+# Zeilen pro Round Trip des serverseitigen Export-Cursors
+EXPORT_FETCH_SIZE = 10000
+
+# Aktionen, deren Verbindung zur Live-Datenbank vor dem Profil aufgebaut wird;
+# restore, rollback und verify arbeiten mit eigenen bzw. umbenannten Datenbanken
+POOLED_ACTIONS = ('backup', 'reconcile', 'partitions', 'archive', 'schema', 'export', 'stats')
 
 def load_database_config():
-    """Lädt die Datenbank-Konfiguration"""
+    """Lädt die Datenbank-Konfiguration (einmal je Prozess, siehe db_access)"""
+    return db_access.load_config()
+
+def _pg_env(config):
+    """Umgebung mit Passwort für die PostgreSQL Client Tools"""
+    env = os.environ.copy()
+    env['PGPASSWORD'] = config['password']
+    return env
+
+def _pg_connection_args(config, database=None):
+    return [
+        '-h', config['host'],
+        '-p', str(config['port']),
+        '-U', config['user'],
+        '-d', database or config['database'],
+        '--no-password'
+    ]
+
+def _path_size(path):
+    """Größe einer Datei oder eines Verzeichnisses in Bytes"""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path) for name in names
+        )
+    return os.path.getsize(path)
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+def detect_backup_format(backup_file):
+    """Erkennt plain (SQL), custom (pg_dump -Fc), directory (pg_dump -Fd)
+    oder incremental (Manifest im Backup-Speicher)"""
+    if os.path.isdir(backup_file):
+        return 'directory'
+    if backup_file.endswith('.json'):
+        return 'incremental'
+    with open(backup_file, 'rb') as file:
+        if file.read(5) == b'PGDMP':
+            return 'custom'
+    return 'plain'
+
+# Dateiendung und pg_dump-Option je Backup-Format
+BACKUP_FORMATS = {
+    'plain': ('.sql', 'p'),
+    'custom': ('.dump', 'c'),
+    'directory': ('', 'd'),
+}
+
+def create_incremental_backup(store_root=incremental_backup.DEFAULT_STORE):
+    """Sichert nur neue Transaktionen seit dem letzten Backup in den Backup-Speicher"""
+    store = incremental_backup.BackupStore(store_root)
+    
+    print(f"🗄️ Erstelle inkrementelles Backup in {store_root}/")
+    
     try:
-        with open('database-config.json', 'r') as file:
-            config = json.load(file)
-            return config['database']
-    except FileNotFoundError:
-        return {
-            'host': 'localhost',
-            'port': 5432,
-            'database': DATABASE_NAME,
-            'user': DATABASE_USER,
-            'password': DEFAULT_PASSWORD
-        }
-
-def create_backup():
-    """Erstellt ein SQL-Backup der Datenbank"""
+        conn = db_access.connect()
+        start = time.perf_counter()
+        manifest = incremental_backup.create_incremental_backup(conn, store)
+        duration = time.perf_counter() - start
+        db_access.release(conn)
+        
+        stats = manifest['stats']
+        rows = sum(chunk['rows'] for chunk in manifest['transactions'])
+        manifest_file = store.manifest_path(manifest['name'])
+        print(f"✅ Backup erfolgreich erstellt: {manifest_file}")
+        print(f"📊 {rows} neue Transaktionen (bis id {manifest['high_water_mark']}), "
+              f"{stats['objects_written']} neue und {stats['objects_reused']} wiederverwendete Objekte")
+        print(f"⏱️ Dauer: {duration:.1f}s, Größe: {_format_size(stats['bytes_written'])}")
+        return manifest_file
+        
+    except Exception as e:
+        print(f"❌ Fehler beim Erstellen des inkrementellen Backups: {e}")
+        return None
+
+def create_backup(backup_format='plain', jobs=1, compress=None, store_root=incremental_backup.DEFAULT_STORE):
+    """Erstellt ein Backup der Datenbank
+
+    plain schreibt ein SQL-Skript, custom ein komprimiertes Archiv und directory
+    ein Verzeichnis mit einer Datei je Tabelle, das pg_dump mit jobs parallelen
+    Verbindungen schreibt. compress ist die Kompressionsstufe (0-9).
+    incremental sichert nur die Änderungen seit dem letzten Backup.
+    """
+    if backup_format == 'incremental':
+        return create_incremental_backup(store_root)
+    
     config = load_database_config()
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_file = f"backup_getraenkekasse_{timestamp}.sql"
+    extension, format_flag = BACKUP_FORMATS[backup_format]
+    backup_file = f"backup_getraenkekasse_{timestamp}{extension}"
     
-    print(f"🗄️ Erstelle Backup: {backup_file}")
+    if jobs > 1 and backup_format != 'directory':
+        print("❌ Parallele Backups (--jobs) sind nur mit --format directory möglich")
+        return None
+    
+    print(f"🗄️ Erstelle Backup: {backup_file} ({backup_format}, {jobs} Job(s))")
     
     try:
-        # Umgebungsvariable für Passwort setzen
-        env = os.environ.copy()
-        env['PGPASSWORD'] = config['password']
-        
-        # pg_dump ausführen
-        subprocess.check_call([
-            'pg_dump',
-            '-h', config['host'],
-            '-p', str(config['port']),
-            '-U', config['user'],
-            '-d', config['database'],
-            '-f', backup_file,
-            '--no-password'
-        ], env=env)
+        conn = db_access.connect()
+        # pg_dump liest denselben Snapshot, aus dem die Sollwerte für restore stammen
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_export_snapshot()")
+        snapshot = cursor.fetchone()[0]
+        summary = shadow_restore.database_summary(cursor)
+        
+        command = ['pg_dump'] + _pg_connection_args(config) + [
+            '-F', format_flag, '-f', backup_file, '--snapshot', snapshot
+        ]
+        if jobs > 1:
+            command += ['-j', str(jobs)]
+        if compress is not None:
+            command += ['-Z', str(compress)]
+        
+        # pg_dump ausführen, solange die Transaktion den Snapshot offen hält
+        start = time.perf_counter()
+        try:
+            subprocess.check_call(command, env=_pg_env(config))
+        finally:
+            conn.rollback()
+            cursor.close()
+            db_access.release(conn)
+        duration = time.perf_counter() - start
+        shadow_restore.write_summary(backup_file, summary)
         
         print(f"✅ Backup erfolgreich erstellt: {backup_file}")
+        print(f"⏱️ Dauer: {duration:.1f}s, Größe: {_format_size(_path_size(backup_file))}")
         return backup_file
         
     except subprocess.CalledProcessError as e:
@@ -64,16 +169,41 @@ def create_backup():
     except FileNotFoundError:
         print("❌ pg_dump nicht gefunden. Bitte PostgreSQL Client Tools installieren.")
         return None
+    except psycopg2.Error as e:
+        print(f"❌ Fehler beim Erstellen des Backups: {e}")
+        return None
 
-def restore_backup(backup_file):
-    """Stellt ein Backup wieder her"""
+def _restore_command(config, backup_file, backup_format, jobs, database=None, clean=True):
+    if backup_format == 'plain':
+        # SQL-Skript einspielen (immer einzeln); in eine leere Datenbank ohne Fehlertoleranz
+        command = ['psql'] + _pg_connection_args(config, database) + ['-f', backup_file]
+        if not clean:
+            command += ['-v', 'ON_ERROR_STOP=1']
+        return command
+    # Parallel wiederherstellen; eine bestehende Datenbank vorher leeren
+    command = ['pg_restore'] + _pg_connection_args(config, database) + ['-j', str(jobs), backup_file]
+    if clean:
+        command[-1:-1] = ['--clean', '--if-exists']
+    return command
+
+def restore_backup(backup_file, jobs=1, shadow=False):
+    """Stellt ein Backup wieder her
+
+    SQL-Backups werden per psql eingespielt, custom- und directory-Backups per
+    pg_restore mit jobs parallelen Verbindungen. Mit shadow wird ohne Rückfrage
+    über eine Schatten-Datenbank wiederhergestellt (siehe restore_via_shadow).
+    """
     if not os.path.exists(backup_file):
         print(f"❌ Backup-Datei nicht gefunden: {backup_file}")
         return False
     
+    if shadow:
+        return restore_via_shadow(backup_file, jobs)
+    
     config = load_database_config()
+    backup_format = detect_backup_format(backup_file)
     
-    print(f"🔄 Stelle Backup wieder her: {backup_file}")
+    print(f"🔄 Stelle Backup wieder her: {backup_file} ({backup_format})")
     print("⚠️ WARNUNG: Alle aktuellen Daten werden überschrieben!")
     
     response = input("Fortfahren? (j/N): ")
@@ -81,219 +211,740 @@ def restore_backup(backup_file):
         print("Abgebrochen.")
         return False
     
+    if backup_format == 'incremental':
+        return _restore_incremental(config, backup_file)
+    
     try:
-        # Umgebungsvariable für Passwort setzen
-        env = os.environ.copy()
-        env['PGPASSWORD'] = config['password']
-        
-        # Datenbank leeren und wiederherstellen
-        subprocess.check_call([
-            'psql',
-            '-h', config['host'],
-            '-p', str(config['port']),
-            '-U', config['user'],
-            '-d', config['database'],
-            '-f', backup_file,
-            '--no-password'
-        ], env=env)
+        command = _restore_command(config, backup_file, backup_format, jobs)
+        start = time.perf_counter()
+        subprocess.check_call(command, env=_pg_env(config))
+        duration = time.perf_counter() - start
         
         print(f"✅ Backup erfolgreich wiederhergestellt: {backup_file}")
+        print(f"⏱️ Dauer: {duration:.1f}s, Größe: {_format_size(_path_size(backup_file))}")
         return True
         
     except subprocess.CalledProcessError as e:
         print(f"❌ Fehler beim Wiederherstellen des Backups: {e}")
         return False
+    except FileNotFoundError:
+        print("❌ psql/pg_restore nicht gefunden. Bitte PostgreSQL Client Tools installieren.")
+        return False
+
+def _incremental_store(manifest_file):
+    """Backup-Speicher und Manifest-Name zu einer Manifest-Datei"""
+    manifest_file = os.path.abspath(manifest_file)
+    store = incremental_backup.BackupStore(os.path.dirname(os.path.dirname(manifest_file)))
+    return store, os.path.basename(manifest_file)[:-len('.json')]
+
+def _load_into(config, backup_file, backup_format, jobs, database):
+    """Spielt ein Backup in die leere Datenbank database ein"""
+    if backup_format != 'incremental':
+        command = _restore_command(config, backup_file, backup_format, jobs, database, clean=False)
+        subprocess.check_call(command, env=_pg_env(config))
+        return
+    
+    # Inkrementelle Backups enthalten nur Daten: Schema der Live-Datenbank übernehmen
+    schema = subprocess.run(
+        ['pg_dump'] + _pg_connection_args(config) + ['--schema-only'],
+        env=_pg_env(config), check=True, capture_output=True
+    ).stdout
+    subprocess.run(
+        ['psql'] + _pg_connection_args(config, database) + ['-q', '-v', 'ON_ERROR_STOP=1'],
+        env=_pg_env(config), check=True, input=schema, stdout=subprocess.DEVNULL
+    )
+    store, name = _incremental_store(backup_file)
+    conn = db_access.open_connection(database=database)
+    try:
+        incremental_backup.restore_incremental_backup(conn, store, name)
+    finally:
+        conn.close()
+
+def _expected_summary(backup_file, backup_format):
+    if backup_format == 'incremental':
+        store, name = _incremental_store(backup_file)
+        return store.load_manifest(name).get('summary')
+    return shadow_restore.load_summary(backup_file)
+
+def restore_via_shadow(backup_file, jobs=1):
+    """Stellt ein Backup ohne Rückfrage über eine Schatten-Datenbank wieder her
 
-def export_to_json():
-    """Exportiert die Datenbank zurück ins JSON-Format"""
+    Das Backup wird parallel in eine frische Datenbank geladen, während die
+    Live-Datenbank weiterläuft. Erst wenn Zeilenzahlen und Salden mit den
+    beim Backup gespeicherten Sollwerten übereinstimmen, werden die beiden
+    Datenbanken in einer Transaktion umbenannt; die bisherige bleibt als
+    <datenbank>_before_<zeit> für ein Rollback erhalten.
+    """
     config = load_database_config()
+    backup_format = detect_backup_format(backup_file)
+    live = config['database']
+    shadow = shadow_restore.shadow_name(live)
+    
+    print(f"🔄 Stelle Backup über Schatten-Datenbank wieder her: {backup_file} ({backup_format}) → {shadow}")
+    
+    try:
+        admin = shadow_restore.admin_connection(config)
+    except psycopg2.Error as e:
+        print(f"❌ Keine Verbindung zur Wartungsdatenbank postgres: {e}")
+        return False
+    
+    swapped = False
+    try:
+        shadow_restore.create_database(admin, shadow, live)
+        
+        start = time.perf_counter()
+        _load_into(config, backup_file, backup_format, jobs, shadow)
+        load_duration = time.perf_counter() - start
+        print(f"📥 Schatten-Datenbank geladen in {load_duration:.1f}s")
+        
+        conn = db_access.open_connection(database=shadow)
+        cursor = conn.cursor()
+        cursor.execute("ANALYZE")
+        actual = shadow_restore.database_summary(cursor)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        counts = ', '.join(f"{table} {count}" for table, count in actual['counts'].items())
+        print(f"📊 {counts}, Gesamtguthaben {actual['balance_total']}")
+        
+        expected = _expected_summary(backup_file, backup_format)
+        if expected is None:
+            print("⚠️ Keine Sollwerte zum Backup gefunden, nur Schema und Zeilenzahlen geprüft")
+        else:
+            problems = shadow_restore.compare_summaries(expected, actual)
+            if problems:
+                print("❌ Schatten-Datenbank weicht vom Backup ab, Live-Datenbank bleibt unverändert:")
+                for problem in problems:
+                    print(f"  {problem}")
+                return False
+            print("✅ Zeilenzahlen und Salden stimmen mit dem Backup überein")
+        
+        previous, swap_duration = shadow_restore.swap_in(admin, live, shadow)
+        swapped = True
+        
+        print(f"✅ Backup erfolgreich wiederhergestellt: {backup_file}")
+        print(f"⏱️ Laden: {load_duration:.1f}s (ohne Ausfall), Umschalten: {swap_duration:.2f}s")
+        print(f"↩️ Vorherige Datenbank: {previous} (Rollback: python3 postgres_backup.py rollback)")
+        return True
+        
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Fehler beim Laden der Schatten-Datenbank: {e}")
+        return False
+    except FileNotFoundError:
+        print("❌ psql/pg_restore nicht gefunden. Bitte PostgreSQL Client Tools installieren.")
+        return False
+    except Exception as e:
+        print(f"❌ Fehler beim Wiederherstellen des Backups: {e}")
+        return False
+    finally:
+        if not swapped:
+            shadow_restore.drop_database(admin, shadow)
+        admin.close()
+
+def rollback_restore():
+    """Tauscht die vor dem letzten Schatten-Restore aktive Datenbank wieder ein"""
+    config = load_database_config()
+    live = config['database']
+    
+    try:
+        admin = shadow_restore.admin_connection(config)
+        try:
+            previous, retired, duration = shadow_restore.roll_back(admin, live)
+        finally:
+            admin.close()
+        
+        print(f"✅ {previous} ist wieder {live}")
+        print(f"↩️ Zurückgestellt: {retired}, Umschalten: {duration:.2f}s")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Fehler beim Rollback: {e}")
+        return False
+
+def _restore_incremental(config, manifest_file):
+    """Setzt den Stand eines Manifests aus der Backup-Kette zusammen"""
+    store, name = _incremental_store(manifest_file)
+    
+    try:
+        conn = db_access.connect()
+        start = time.perf_counter()
+        table_rows, transaction_rows = incremental_backup.restore_incremental_backup(conn, store, name)
+        duration = time.perf_counter() - start
+        db_access.release(conn)
+        
+        print(f"✅ Backup erfolgreich wiederhergestellt: {manifest_file}")
+        print(f"📊 {table_rows} Zeilen in users/drinks/admin_settings, {transaction_rows} Transaktionen "
+              f"aus {len(store.chain(name))} Backup(s)")
+        print(f"⏱️ Dauer: {duration:.1f}s")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Fehler beim Wiederherstellen des Backups: {e}")
+        return False
+
+def verify_backup(backup_file, jobs=1):
+    """Prüft, ob sich ein Backup wiederherstellen lässt und zur Datenbank passt
+
+    Das Backup wird in eine Scratch-Datenbank geladen, danach werden je Tabelle
+    reihenfolgeunabhängige Prüfsummen auf der Live- und der wiederhergestellten
+    Seite parallel berechnet. Die Scratch-Datenbank wird immer entfernt.
+    """
+    if not os.path.exists(backup_file):
+        print(f"❌ Backup-Datei nicht gefunden: {backup_file}")
+        return False
+    
+    config = load_database_config()
+    backup_format = detect_backup_format(backup_file)
+    scratch = shadow_restore.shadow_name(config['database'], 'verify')
+    
+    print(f"🔍 Prüfe Backup: {backup_file} ({backup_format}) in {scratch}")
+    
+    try:
+        admin = shadow_restore.admin_connection(config)
+    except psycopg2.Error as e:
+        print(f"❌ Keine Verbindung zur Wartungsdatenbank postgres: {e}")
+        return False
+    
+    try:
+        shadow_restore.create_database(admin, scratch, config['database'])
+        
+        start = time.perf_counter()
+        _load_into(config, backup_file, backup_format, jobs, scratch)
+        load_duration = time.perf_counter() - start
+        print(f"📥 Wiederhergestellt in {load_duration:.1f}s")
+        
+        live_kwargs = db_access.connect_kwargs()
+        start = time.perf_counter()
+        results = backup_verify.verify_databases(live_kwargs, dict(live_kwargs, database=scratch), max(jobs, 2))
+        checksum_duration = time.perf_counter() - start
+        
+        for result in results:
+            live, restored = result['live'], result['restored']
+            marker = '✅' if result['match'] else '❌'
+            print(f"{marker} {result['table']}: {restored['rows']} Zeilen, {restored['checksum']} "
+                  f"({restored['seconds']:.1f}s / live {live['seconds']:.1f}s)")
+            if not result['match']:
+                print(f"   live: {live['rows']} Zeilen, {live['checksum']}")
+        
+        mismatches = [result['table'] for result in results if not result['match']]
+        print(f"⏱️ Restore: {load_duration:.1f}s, Prüfsummen: {checksum_duration:.1f}s")
+        if mismatches:
+            # Seit dem Backup geänderte Daten fallen ebenfalls hierunter
+            print(f"❌ Abweichungen in: {', '.join(mismatches)} (Änderungen seit dem Backup erscheinen ebenfalls hier)")
+            return False
+        print("✅ Backup ist wiederherstellbar und stimmt mit der Datenbank überein")
+        return True
+        
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Backup ließ sich nicht wiederherstellen: {e}")
+        return False
+    except FileNotFoundError:
+        print("❌ psql/pg_restore nicht gefunden. Bitte PostgreSQL Client Tools installieren.")
+        return False
+    except Exception as e:
+        print(f"❌ Fehler beim Prüfen des Backups: {e}")
+        return False
+    finally:
+        shadow_restore.drop_database(admin, scratch)
+        admin.close()
+
+def _admin_value(value):
+    """Wandelt einen gespeicherten Admin-Wert zurück in boolean/numeric"""
+    if value.lower() in ['true', 'false']:
+        return value.lower() == 'true'
+    if value.isdigit():
+        return int(value)
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def _export_transaction(trans_date, amount, trans_type, description, drink_name):
+    transaction = {
+        "date": trans_date.isoformat() + "Z",
+        "amount": float(amount),
+        "type": trans_type,
+        "description": description or ""
+    }
+    
+    # Für alte Kompatibilität: drink-Feld für alte Transaktionen
+    if trans_type == "purchase" and drink_name:
+        transaction["drink"] = drink_name
+    
+    return transaction
+
+def _write_users(conn, file, ledger='transactions'):
+    """Schreibt alle Benutzer samt consumption in einem Durchlauf
+
+    Ein serverseitiger Cursor liefert Benutzer und Transaktionen sortiert nach
+    (username, transaction_date); die Zeilen werden beim Lesen zu Benutzern
+    gruppiert und sofort geschrieben, sodass der Speicherbedarf konstant bleibt.
+    ledger ist die Tabelle oder Unterabfrage der Transaktionen. Gibt
+    (Benutzer, Transaktionen) zurück.
+    """
+    cursor = conn.cursor(name='export_users')
+    cursor.itersize = EXPORT_FETCH_SIZE
+    cursor.execute(f"""
+        SELECT u.username, u.pin, u.balance,
+               t.transaction_date, t.amount, t.transaction_type, t.description, t.drink_name
+        FROM users u
+        LEFT JOIN {ledger} t ON t.user_id = u.id
+        ORDER BY u.username, t.transaction_date, t.id
+    """)
+    
+    user_count = 0
+    transaction_count = 0
+    current = None
+    balance = 0
+    
+    def close_user():
+        file.write(f"\n      ],\n      \"balance\": {json.dumps(balance)}\n    }}")
+    
+    for username, pin, user_balance, trans_date, amount, trans_type, description, drink_name in cursor:
+        if username != current:
+            if current is not None:
+                close_user()
+            file.write(",\n    {\n" if user_count else "\n    {\n")
+            file.write(f"      \"username\": {json.dumps(username, ensure_ascii=False)},\n")
+            file.write(f"      \"pin\": {json.dumps(pin, ensure_ascii=False)},\n")
+            file.write("      \"consumption\": [")
+            current = username
+            balance = float(user_balance) if user_balance else 0
+            user_count += 1
+            first_transaction = True
+        
+        # Benutzer ohne Transaktionen liefern genau eine Zeile mit NULLs
+        if trans_date is None:
+            continue
+        
+        transaction = _export_transaction(trans_date, amount, trans_type, description, drink_name)
+        file.write("\n        " if first_transaction else ",\n        ")
+        file.write(json.dumps(transaction, ensure_ascii=False))
+        first_transaction = False
+        transaction_count += 1
+    
+    if current is not None:
+        close_user()
+    
+    cursor.close()
+    return user_count, transaction_count
+
+def export_to_json(profiler=None, with_archive=False):
+    """Exportiert die Datenbank zurück ins JSON-Format
+
+    Die Datei wird während des Lesens geschrieben, statt erst die komplette
+    Historie im Speicher aufzubauen. Mit with_archive enthält consumption
+    statt der Eröffnungsbuchungen wieder die archivierten Transaktionen.
+    """
+    profiler = profiler or StageProfiler('postgres_backup')
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     json_file = f"export_data_{timestamp}.json"
+    temp_file = f"{json_file}.tmp"
     
     print(f"📤 Exportiere Daten nach JSON: {json_file}")
     
     try:
         # Verbindung zur Datenbank
-        conn = psycopg2.connect(
-            host=config['host'],
-            port=config['port'],
-            database=config['database'],
-            user=config['user'],
-            password=config['password']
-        )
+        conn = db_access.connect()
         cursor = conn.cursor()
+        ledger = 'transactions'
+        if with_archive and ledger_archive.has_archive(cursor):
+            ledger = ledger_archive.stitched_ledger()
         
-        # Datenstruktur erstellen
-        data = {
-            "drinks": [],
-            "users": [],
-            "admin": {}
-        }
-        
-        # Getränke exportieren
-        cursor.execute("SELECT name, price FROM drinks ORDER BY name")
-        for row in cursor.fetchall():
-            data["drinks"].append({
-                "name": row[0],
-                "price": float(row[1])
-            })
-        
-        # Benutzer exportieren
-        cursor.execute("SELECT id, username, pin, balance FROM users ORDER BY username")
-        users_data = cursor.fetchall()
-        
-        for user_row in users_data:
-            user_id, username, pin, balance = user_row
-            
-            # Transaktionen für diesen Benutzer laden
-            cursor.execute("""
-                SELECT transaction_date, amount, transaction_type, description, drink_name
-                FROM transactions 
-                WHERE user_id = %s 
-                ORDER BY transaction_date
-            """, (user_id,))
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            # Getränke exportieren
+            with profiler.stage('drinks') as stage:
+                cursor.execute("SELECT name, price FROM drinks ORDER BY name")
+                drinks = [
+                    {"name": name, "price": float(price)}
+                    for name, price in cursor.fetchall()
+                ]
+                file.write("{\n  \"drinks\": ")
+                file.write(json.dumps(drinks, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+                stage.rows = len(drinks)
             
-            consumption = []
-            for trans_row in cursor.fetchall():
-                trans_date, amount, trans_type, description, drink_name = trans_row
-                
-                transaction = {
-                    "date": trans_date.isoformat() + "Z",
-                    "amount": float(amount),
-                    "type": trans_type,
-                    "description": description or ""
-                }
-                
-                # Für alte Kompatibilität: drink-Feld für alte Transaktionen
-                if trans_type == "purchase" and drink_name:
-                    transaction["drink"] = drink_name
-                
-                consumption.append(transaction)
+            # Benutzer mit Transaktionen exportieren
+            with profiler.stage('export') as stage:
+                file.write(",\n  \"users\": [")
+                user_count, transaction_count = _write_users(conn, file, ledger)
+                file.write("\n  ]" if user_count else "]")
+                stage.rows = transaction_count
             
-            data["users"].append({
-                "username": username,
-                "pin": pin,
-                "consumption": consumption,
-                "balance": float(balance) if balance else 0
-            })
-        
-        # Admin-Einstellungen exportieren
-        cursor.execute("SELECT setting_key, setting_value FROM admin_settings")
-        for row in cursor.fetchall():
-            key, value = row
-            # Versuche boolean/numeric Werte zu konvertieren
-            if value.lower() in ['true', 'false']:
-                data["admin"][key] = value.lower() == 'true'
-            elif value.isdigit():
-                data["admin"][key] = int(value)
-            else:
-                try:
-                    data["admin"][key] = float(value)
-                except ValueError:
-                    data["admin"][key] = value
+            # Admin-Einstellungen exportieren
+            with profiler.stage('admin') as stage:
+                cursor.execute("SELECT setting_key, setting_value FROM admin_settings")
+                admin = {key: _admin_value(value) for key, value in cursor.fetchall()}
+                file.write(",\n  \"admin\": ")
+                file.write(json.dumps(admin, indent=2, ensure_ascii=False).replace("\n", "\n  "))
+                file.write("\n}")
+                stage.rows = len(admin)
         
         cursor.close()
-        conn.close()
+        db_access.release(conn)
         
-        # JSON-Datei schreiben
-        with open(json_file, 'w', encoding='utf-8') as file:
-            json.dump(data, file, indent=2, ensure_ascii=False)
+        # Erst die vollständige Datei unter dem endgültigen Namen ablegen
+        os.replace(temp_file, json_file)
         
         print(f"✅ JSON-Export erfolgreich: {json_file}")
-        print(f"📊 Exportiert: {len(data['drinks'])} Getränke, {len(data['users'])} Benutzer")
+        print(f"📊 Exportiert: {len(drinks)} Getränke, {user_count} Benutzer, {transaction_count} Transaktionen")
         
         return json_file
         
     except Exception as e:
         print(f"❌ Fehler beim JSON-Export: {e}")
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
         return None
 
-def show_database_stats():
-    """Zeigt Statistiken über die Datenbank"""
-    config = load_database_config()
+def export_to_parquet(profiler=None, with_archive=False):
+    """Exportiert das Transaktionsjournal monatsweise nach Parquet
+
+    Mit with_archive werden archivierte Transaktionen statt der
+    Eröffnungsbuchungen exportiert.
+    """
+    profiler = profiler or StageProfiler('postgres_backup')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    directory = f"export_parquet_{timestamp}"
+    
+    print(f"📤 Exportiere Daten nach Parquet: {directory}/")
     
     try:
-        conn = psycopg2.connect(
-            host=config['host'],
-            port=config['port'],
-            database=config['database'],
-            user=config['user'],
-            password=config['password']
-        )
+        parquet_export.require_pyarrow()
+        
+        conn = db_access.connect()
+        # Ein Snapshot für alle Monatsabfragen
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        months = None
+        ledger = 'transactions'
         cursor = conn.cursor()
+        if with_archive and ledger_archive.has_archive(cursor):
+            ledger = ledger_archive.stitched_ledger()
+        elif ledger_partitions.is_partitioned(cursor):
+            months = [(month, ledger_partitions.next_month(month))
+                      for month in ledger_partitions.ledger_months(cursor)]
+        cursor.close()
+        result = parquet_export.export_ledger(conn, directory, profiler, months=months, ledger=ledger)
+        db_access.release(conn)
+        
+        print(f"✅ Parquet-Export erfolgreich: {directory}/")
+        print(f"📊 Exportiert: {result['drinks']} Getränke, {result['users']} Benutzer, "
+              f"{result['transactions']} Transaktionen in {len(result['partitions'])} Monaten")
+        
+        return directory
+        
+    except Exception as e:
+        print(f"❌ Fehler beim Parquet-Export: {e}")
+        return None
+
+def show_database_stats(with_archive=False):
+    """Zeigt Statistiken über die Datenbank
+
+    Die Werte kommen in einem Round Trip aus den per Trigger gepflegten
+    Summentabellen (stats_summary.py) statt aus Scans über transactions.
+    Mit with_archive werden die archivierten Transaktionen statt der
+    Eröffnungsbuchungen mitgezählt.
+    """
+    try:
+        conn = db_access.connect()
+        summary = stats_summary.read_summary(conn)
+        if with_archive:
+            _add_archive_summary(conn, summary)
+        db_access.release(conn)
         
         print("📊 DATENBANK STATISTIKEN")
         print("=" * 30)
         
-        # Benutzer-Statistiken
-        cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = cursor.fetchone()[0]
-        print(f"👥 Benutzer: {user_count}")
-        
-        cursor.execute("SELECT SUM(balance) FROM users")
-        total_balance = cursor.fetchone()[0] or 0
-        print(f"💰 Gesamtguthaben: {float(total_balance):.2f}€")
-        
-        # Getränke-Statistiken
-        cursor.execute("SELECT COUNT(*) FROM drinks")
-        drink_count = cursor.fetchone()[0]
-        print(f"🥤 Getränke: {drink_count}")
-        
-        # Transaktions-Statistiken
-        cursor.execute("SELECT COUNT(*) FROM transactions")
-        trans_count = cursor.fetchone()[0]
-        print(f"📋 Transaktionen: {trans_count}")
-        
-        cursor.execute("""
-            SELECT transaction_type, COUNT(*) 
-            FROM transactions 
-            GROUP BY transaction_type 
-            ORDER BY COUNT(*) DESC
-        """)
+        print(f"👥 Benutzer: {summary['users']}")
+        print(f"💰 Gesamtguthaben: {float(summary['balance_total']):.2f}€")
+        print(f"🥤 Getränke: {summary['drinks']}")
+        print(f"📋 Transaktionen: {summary['transactions']}")
+        
         print("\n📈 Transaktionstypen:")
-        for trans_type, count in cursor.fetchall():
+        for trans_type, count in summary['transaction_types']:
             print(f"  {trans_type}: {count}")
         
         # Top Getränke
-        cursor.execute("""
-            SELECT drink_name, COUNT(*) as purchases
-            FROM transactions 
-            WHERE transaction_type = 'purchase' AND drink_name IS NOT NULL
-            GROUP BY drink_name 
-            ORDER BY purchases DESC 
-            LIMIT 5
-        """)
-        top_drinks = cursor.fetchall()
-        if top_drinks:
+        if summary['top_drinks']:
             print("\n🏆 Top Getränke:")
-            for drink, count in top_drinks:
+            for drink, count in summary['top_drinks']:
                 print(f"  {drink}: {count}x")
         
+    except Exception as e:
+        print(f"❌ Fehler beim Laden der Statistiken: {e}")
+
+def _add_archive_summary(conn, summary):
+    """Ergänzt die Summen um das Archiv und nimmt die Eröffnungsbuchungen heraus"""
+    cursor = conn.cursor()
+    archived, types, drinks = ledger_archive.archive_summary(cursor)
+    purchases = stats_summary.drink_purchases(cursor)
+    conn.rollback()
+    cursor.close()
+    
+    counts = dict(summary['transaction_types'])
+    opening = counts.pop(ledger_archive.OPENING_TYPE, 0)
+    for trans_type, count in types.items():
+        counts[trans_type] = counts.get(trans_type, 0) + count
+    summary['transactions'] += archived - opening
+    summary['transaction_types'] = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    
+    # Top-Getränke erst nach dem Zusammenführen aller live und archivierten
+    # Käufe auswählen, sonst fehlen live schwächere Getränke mit großem Archiv
+    for drink, count in drinks.items():
+        purchases[drink] = purchases.get(drink, 0) + count
+    summary['top_drinks'] = sorted(purchases.items(), key=lambda item: (-item[1], item[0]))[:5]
+
+def show_period_stats(by='day', since=None, until=None, drink=None, username=None):
+    """Zeigt Käufe und Einzahlungen je Tag, Woche oder Monat
+
+    Die Werte kommen aus den Tagessummen in stats_daily, die vorher bis zum
+    aktuellen Stand des Journals nachgezogen werden.
+    """
+    try:
+        conn = db_access.connect()
+        days, rolled_up_until = stats_summary.refresh_rollup(conn)
+        cursor = conn.cursor()
+        rows = stats_summary.query_rollup(cursor, by, since, until, drink, username)
         cursor.close()
-        conn.close()
+        db_access.release(conn)
+        
+        filters = [f"{label} {value}" for label, value in
+                   (('ab', since), ('bis', until), ('Getränk', drink), ('Benutzer', username)) if value]
+        print(f"📊 STATISTIK JE {({'day': 'TAG', 'week': 'WOCHE', 'month': 'MONAT'})[by]}"
+              + (f" ({', '.join(filters)})" if filters else ""))
+        print("=" * 30)
+        print(f"{'Zeitraum':<12} {'Käufe':>8} {'Umsatz':>12} {'Einzahlungen':>14}")
+        for period, purchases, revenue, deposits in rows:
+            print(f"{period.isoformat():<12} {purchases:>8} {float(revenue):>11.2f}€ {float(deposits):>13.2f}€")
+        if not rows:
+            print("  Keine Transaktionen im Zeitraum")
+        print(f"\n🔄 Tagessummen: {days} Tag(e) neu berechnet, Stand {rolled_up_until or '-'}")
+        return True
         
     except Exception as e:
         print(f"❌ Fehler beim Laden der Statistiken: {e}")
+        return False
+
+def rebuild_stats():
+    """Baut Summentabellen und Tagessummen vollständig neu auf"""
+    try:
+        conn = db_access.connect()
+        cursor = conn.cursor()
+        stats_summary.install_summary_tables(cursor)
+        stats_summary.install_rollup(cursor)
+        stats_summary.reset_rollup(cursor)
+        conn.commit()
+        cursor.close()
+        days, _ = stats_summary.refresh_rollup(conn)
+        db_access.release(conn)
+        print(f"✅ Statistik neu aufgebaut ({days} Tage zusammengefasst)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Fehler beim Neuaufbau der Statistik: {e}")
+        return False
+
+def maintain_partitions(months_ahead=ledger_partitions.MONTHS_AHEAD, batch_ids=ledger_partitions.BACKFILL_IDS):
+    """Partitioniert transactions bei Bedarf online um und legt künftige Monate an
+
+    Idempotent und für einen regelmäßigen Cron-Lauf gedacht.
+    """
+    try:
+        conn = db_access.connect()
+        cursor = conn.cursor()
+        
+        if not ledger_partitions.is_partitioned(cursor):
+            print("🗂️ transactions ist nicht partitioniert, baue im laufenden Betrieb um...")
+            copied, lock_seconds, dropped = ledger_partitions.migrate_to_partitioned(
+                conn, batch_ids, months_ahead, stats_summary.reinstall_triggers
+            )
+            print(f"✅ {copied} Transaktionen kopiert, exklusive Sperre {lock_seconds * 1000:.0f}ms")
+            print(f"📦 Alte Tabelle bleibt als {ledger_partitions.RETIRED_TABLE} erhalten")
+            if dropped:
+                print(f"🔁 Trigger an die neue Tabelle übernommen: {', '.join(dropped)}")
+        
+        created, moved = ledger_partitions.ensure_partitions(cursor, months_ahead)
+        conn.commit()
+        cursor.close()
+        db_access.release(conn)
+        
+        print(f"✅ {len(created)} Monatspartition(en) angelegt, "
+              f"{moved} Zeilen aus der Default-Partition verschoben")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Fehler bei der Partitionierung: {e}")
+        return False
+
+def upgrade_schema(track='main'):
+    """Spielt ausstehende Schema-Migrationen ein und zeigt den Stand"""
+    try:
+        conn = db_access.connect()
+        applied = schema_migrate.upgrade(conn, track)
+        migrations = schema_migrate.status(conn, track)
+        db_access.release(conn)
+    except Exception as e:
+        print(f"❌ Fehler bei der Schema-Migration: {e}")
+        return False
+    
+    for version, name, seconds in applied:
+        print(f"✅ {version:04d}_{name} eingespielt ({seconds:.1f}s)")
+    if not applied:
+        print(f"✅ Schema {track} ist aktuell")
+    for version, name, applied_at, changed in migrations:
+        state = applied_at.strftime('%Y-%m-%d %H:%M') if applied_at else 'ausstehend'
+        print(f"  {version:04d}_{name}: {state}" + (" ⚠️ Datei geändert" if changed else ""))
+    return True
+
+def archive_ledger(before, chunk_users=ledger_archive.CHUNK_USERS):
+    """Verschiebt Transaktionen vor before ins Archiv und schreibt Eröffnungsbuchungen"""
+    connect_kwargs = db_access.connect_kwargs()
+    
+    print(f"🗄️ Archiviere Transaktionen vor {before.isoformat()} ({chunk_users} Benutzer je Transaktion)")
+    
+    try:
+        result = ledger_archive.archive_before(connect_kwargs, before, chunk_users)
+    except Exception as e:
+        print(f"❌ Fehler beim Archivieren: {e}")
+        return False
+    
+    if not result['transactions']:
+        print("✅ Keine Transaktionen vor dem Stichtag, nichts zu archivieren")
+        return True
+    
+    print(f"✅ {result['transactions']} Transaktionen von {result['users']} Benutzern archiviert "
+          f"(Summe {float(result['amount']):+.2f}€ in Eröffnungsbuchungen)")
+    if result['dropped_partitions']:
+        print(f"🗂️ Leere Partitionen entfernt: {', '.join(result['dropped_partitions'])}")
+    print(f"⏱️ Dauer: {result['seconds']:.1f}s")
+    return True
+
+def reconcile_balances(jobs=1, chunk_users=balance_reconcile.CHUNK_USERS, repair=None, limit=20):
+    """Vergleicht users.balance jedes Benutzers mit der Summe seiner Transaktionen"""
+    connect_kwargs = db_access.connect_kwargs()
+    
+    print(f"⚖️ Gleiche Guthaben mit dem Journal ab ({jobs} Job(s), {chunk_users} Benutzer je Abfrage)"
+          + (f", Reparatur: {repair}" if repair else ""))
+    
+    try:
+        result = balance_reconcile.reconcile(connect_kwargs, chunk_users, jobs, repair)
+    except Exception as e:
+        print(f"❌ Fehler beim Abgleich: {e}")
+        return False
+    
+    drifts = result['drifts']
+    for user_id, username, balance, ledger, delta in drifts[:limit]:
+        print(f"  {username} (id {user_id}): Guthaben {float(balance):.2f}€, "
+              f"Journal {float(ledger):.2f}€, Differenz {float(delta):+.2f}€")
+    if len(drifts) > limit:
+        print(f"  ... und {len(drifts) - limit} weitere")
+    
+    print(f"⏱️ {result['users']} Benutzer in {result['chunks']} Bereich(en), Dauer: {result['seconds']:.1f}s")
+    if not drifts:
+        print("✅ Alle Guthaben stimmen mit dem Journal überein")
+        return True
+    
+    total = sum(delta for *_, delta in drifts)
+    print(f"⚠️ {len(drifts)} Benutzer weichen ab, Summe der Differenzen {float(total):+.2f}€")
+    if repair:
+        print(f"🔧 {result['repaired']} Benutzer repariert")
+        return True
+    return False
 
 def main():
     parser = argparse.ArgumentParser(description='PostgreSQL Backup/Restore für Getränkekasse')
-    parser.add_argument('action', choices=['backup', 'restore', 'export', 'stats'], 
-                       help='Aktion: backup, restore, export oder stats')
-    parser.add_argument('--file', help='Backup-Datei für restore')
+    parser.add_argument('action', choices=['backup', 'restore', 'rollback', 'verify', 'reconcile', 'partitions', 'archive', 'schema', 'export', 'stats'], 
+                       help='Aktion: backup, restore, rollback, verify, reconcile, partitions, archive, schema, export oder stats')
+    parser.add_argument('--file', help='Backup-Datei für restore und verify')
+    parser.add_argument('--format', choices=['json', 'parquet', 'plain', 'custom', 'directory', 'incremental'], default=None,
+                       help='export: json (Standard) oder parquet; backup: plain (Standard), custom, directory oder incremental')
+    parser.add_argument('--store', default=incremental_backup.DEFAULT_STORE,
+                       help=f'Backup-Speicher für backup --format incremental (Standard: {incremental_backup.DEFAULT_STORE})')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Parallele Jobs für backup (nur directory), restore/verify (custom/directory), die Prüfsummen von verify und reconcile')
+    parser.add_argument('--compress', type=int, choices=range(10), metavar='0-9',
+                       help='Kompressionsstufe für backup (custom/directory)')
+    parser.add_argument('--shadow', action='store_true',
+                       help='restore ohne Rückfrage über eine Schatten-Datenbank mit Umschalten per Umbenennung')
+    parser.add_argument('--repair', choices=balance_reconcile.REPAIR_MODES,
+                       help='reconcile: balance setzt das Guthaben auf die Journalsumme, ledger bucht die Differenz als adjustment')
+    parser.add_argument('--chunk-users', type=int,
+                       help=f'reconcile/archive: Benutzer-ids je Abfrage (Standard: {balance_reconcile.CHUNK_USERS} '
+                            f'bzw. {ledger_archive.CHUNK_USERS})')
+    parser.add_argument('--before', type=date.fromisoformat, metavar='JJJJ-MM-TT',
+                       help='archive: Transaktionen vor diesem Tag archivieren')
+    parser.add_argument('--track', choices=schema_migrate.TRACKS, default='main',
+                       help='schema: Migrationsspur, main (Standard) oder simple (migrate_simple.py)')
+    parser.add_argument('--with-archive', action='store_true',
+                       help='export/stats: archivierte Transaktionen statt der Eröffnungsbuchungen einbeziehen')
+    parser.add_argument('--since', type=date.fromisoformat, metavar='JJJJ-MM-TT',
+                       help='stats: Zeitraum ab diesem Tag (inklusive)')
+    parser.add_argument('--until', type=date.fromisoformat, metavar='JJJJ-MM-TT',
+                       help='stats: Zeitraum bis zu diesem Tag (inklusive)')
+    parser.add_argument('--by', choices=stats_summary.ROLLUP_PERIODS,
+                       help='stats: Werte je day, week oder month aus den Tagessummen')
+    parser.add_argument('--drink', help='stats: nur Käufe dieses Getränks')
+    parser.add_argument('--user', help='stats: nur Transaktionen dieses Benutzers')
+    parser.add_argument('--rebuild', action='store_true',
+                       help='stats: Summentabellen und Tagessummen neu aufbauen')
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
+    profiler = profiler_from_args(args, f"postgres_backup_{args.action}")
+    
+    if args.action in ('restore', 'verify') and not args.file:
+        print("❌ Backup-Datei mit --file angeben")
+        sys.exit(1)
+    if args.action == 'archive' and not args.before:
+        print("❌ Stichtag mit --before angeben")
+        sys.exit(1)
     
-    if args.action == 'backup':
-        create_backup()
-    elif args.action == 'restore':
-        if not args.file:
-            print("❌ Backup-Datei mit --file angeben")
+    formats = {'backup': ('plain', 'custom', 'directory', 'incremental'), 'export': ('json', 'parquet')}
+    if args.format and args.format not in formats.get(args.action, ()):
+        parser.error(f"--format {args.format} passt nicht zur Aktion {args.action}")
+    
+    if args.action in POOLED_ACTIONS:
+        try:
+            db_access.warm_up()
+        except psycopg2.Error as e:
+            print(f"❌ Keine Verbindung zur Datenbank: {e}")
             sys.exit(1)
-        restore_backup(args.file)
-    elif args.action == 'export':
-        export_to_json()
-    elif args.action == 'stats':
-        show_database_stats()
+    
+    profiler.start()
+    result = None
+    try:
+        if args.action == 'backup':
+            result = profiler.run('backup', create_backup, args.format or 'plain', args.jobs, args.compress, args.store)
+        elif args.action == 'restore':
+            result = profiler.run('restore', restore_backup, args.file, args.jobs, args.shadow)
+        elif args.action == 'verify':
+            result = profiler.run('verify', verify_backup, args.file, args.jobs)
+        elif args.action == 'reconcile':
+            result = profiler.run('reconcile', reconcile_balances, args.jobs,
+                                  args.chunk_users or balance_reconcile.CHUNK_USERS, args.repair)
+        elif args.action == 'schema':
+            result = profiler.run('schema', upgrade_schema, args.track)
+        elif args.action == 'archive':
+            result = profiler.run('archive', archive_ledger, args.before,
+                                  args.chunk_users or ledger_archive.CHUNK_USERS)
+        elif args.action == 'partitions':
+            result = profiler.run('partitions', maintain_partitions)
+        elif args.action == 'rollback':
+            result = profiler.run('rollback', rollback_restore)
+        elif args.action == 'export' and args.format == 'parquet':
+            result = export_to_parquet(profiler, args.with_archive)
+        elif args.action == 'export':
+            result = export_to_json(profiler, args.with_archive)
+        elif args.action == 'stats' and args.rebuild:
+            result = profiler.run('rebuild', rebuild_stats)
+        elif args.action == 'stats' and (args.by or args.since or args.until or args.drink or args.user):
+            result = profiler.run('stats', show_period_stats,
+                                  args.by or 'day', args.since, args.until, args.drink, args.user)
+        elif args.action == 'stats':
+            profiler.run('stats', show_database_stats, args.with_archive)
+            result = True
+    finally:
+        profiler.finish('ok' if result else 'error')
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Versionierte Schema-Migrationen für Getränkekasse
+Die Migrationen liegen als nummerierte SQL-Dateien unter migrations/<Spur>/
+(main: Schema mit user_id, simple: Schema von migrate_simple.py). Die Tabelle
+schema_migrations hält je Spur die eingespielten Versionen samt Prüfsumme.
+Ist die Datenbank aktuell, kostet upgrade zwei kurze Abfragen.
+
+Dateien laufen jeweils in einer Transaktion. Beginnt eine Datei mit
+"-- migrate: no-transaction", wird sie Anweisung für Anweisung im Autocommit
+ausgeführt; so sind CREATE INDEX CONCURRENTLY möglich, die den laufenden
+Betrieb nicht blockieren. Jede Anweisung solcher Dateien muss idempotent sein
+(IF NOT EXISTS), darf kein $$ enthalten und endet mit ; am Zeilenende. Alle
+Anweisungen laufen mit lock_timeout und werden bei Sperrkonflikten mit
+wachsender Wartezeit wiederholt.
+"""
+
+import hashlib
+import os
+import re
+import time
+import psycopg2
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+TRACKS = ('main', 'simple')
+
+NO_TRANSACTION = '-- migrate: no-transaction'
+
+# Wartezeit auf Sperren je Anweisung, danach neuer Versuch
+LOCK_TIMEOUT = '2s'
+ATTEMPTS = 5
+BACKOFF_SECONDS = 1.0
+
+VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        track VARCHAR(50) NOT NULL,
+        version INTEGER NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        seconds REAL,
+        PRIMARY KEY (track, version)
+    )
+"""
+
+_FILE_NAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+_CONCURRENT_INDEX = re.compile(
+    r'^CREATE\s+(UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(\w+)\s+(.*)$',
+    re.IGNORECASE | re.DOTALL
+)
+
+_CONCURRENT_DROP = re.compile(
+    r'^DROP\s+INDEX\s+CONCURRENTLY\s+(?:IF\s+EXISTS\s+)?(\w+)$', re.IGNORECASE
+)
+
+class Migration:
+    """Eine Migrationsdatei: Version, Name, SQL und Prüfsumme"""
+
+    def __init__(self, path):
+        match = _FILE_NAME.match(os.path.basename(path))
+        if not match:
+            raise ValueError(f"Ungültiger Name einer Migration: {path}")
+        self.version = int(match.group(1))
+        self.name = match.group(2)
+        with open(path, 'r', encoding='utf-8') as file:
+            self.sql = file.read()
+        self.checksum = hashlib.sha256(self.sql.encode('utf-8')).hexdigest()
+        self.transactional = not self.sql.lstrip().startswith(NO_TRANSACTION)
+
+    def statements(self):
+        """Einzelne Anweisungen (nur für Dateien ohne Transaktion)"""
+        statement = []
+        for line in self.sql.splitlines():
+            if line.strip().startswith('--') and not statement:
+                continue
+            statement.append(line)
+            if line.rstrip().endswith(';'):
+                text = '\n'.join(statement).strip().rstrip(';').strip()
+                if text:
+                    yield text
+                statement = []
+        if '\n'.join(statement).strip():
+            yield '\n'.join(statement).strip()
+
+def load_migrations(track='main'):
+    """Alle Migrationen einer Spur, nach Version sortiert"""
+    directory = os.path.join(MIGRATIONS_DIR, track)
+    migrations = [Migration(os.path.join(directory, name))
+                  for name in sorted(os.listdir(directory)) if name.endswith('.sql')]
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Doppelte Versionsnummer in {directory}")
+    return sorted(migrations, key=lambda migration: migration.version)
+
+def current_version(cursor, track='main'):
+    """Höchste eingespielte Version (0 ohne Versionstabelle)
+
+    Die Prüfung auf die Tabelle ist eine eigene Abfrage: eine Unterabfrage
+    auf schema_migrations würde schon beim Planen fehlschlagen, wenn es die
+    Tabelle noch nicht gibt.
+    """
+    cursor.execute("SELECT to_regclass('schema_migrations')")
+    if cursor.fetchone()[0] is None:
+        return 0
+    cursor.execute(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_migrations WHERE track = %s", (track,)
+    )
+    return cursor.fetchone()[0]
+
+def applied_migrations(cursor, track='main'):
+    """{Version: (Name, Prüfsumme, eingespielt am)} der Spur"""
+    cursor.execute(
+        "SELECT version, name, checksum, applied_at FROM schema_migrations WHERE track = %s",
+        (track,)
+    )
+    return {version: (name, checksum, applied_at) for version, name, checksum, applied_at in cursor.fetchall()}
+
+def _with_retries(conn, action, attempts, description):
+    """Führt action aus und wiederholt sie bei Sperr-Timeouts und Deadlocks"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return action()
+        except (psycopg2.errors.LockNotAvailable, psycopg2.errors.DeadlockDetected) as e:
+            if not conn.autocommit:
+                conn.rollback()
+            if attempt == attempts:
+                raise
+            wait = BACKOFF_SECONDS * 2 ** (attempt - 1)
+            print(f"  ⏳ {description}: Sperre nicht verfügbar ({e.pgcode}), "
+                  f"neuer Versuch {attempt + 1}/{attempts} in {wait:.0f}s")
+            time.sleep(wait)
+
+def _drop_invalid_index(cursor, name):
+    """Entfernt einen abgebrochenen CONCURRENTLY-Index, den IF NOT EXISTS sonst überspringt"""
+    cursor.execute("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = %s AND c.relnamespace = to_regnamespace(current_schema())
+          AND NOT i.indisvalid
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhparent = c.oid)
+    """, (name,))
+    if cursor.fetchone():
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+def _partitions(cursor, table):
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s AND p.relnamespace = to_regnamespace(current_schema())
+          AND p.relkind = 'p'
+        ORDER BY c.relname
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+def _create_index_concurrently(conn, cursor, statement, attempts):
+    """CREATE INDEX CONCURRENTLY, bei partitionierten Tabellen je Partition
+
+    Auf der partitionierten Tabelle selbst gibt es kein CONCURRENTLY: dort
+    wird der Index mit ON ONLY (nur Katalog) angelegt, je Partition
+    nebenläufig gebaut und anschließend angehängt.
+    """
+    unique, name, table, definition = _CONCURRENT_INDEX.match(statement).groups()
+    unique = unique or ''
+    partitions = _partitions(cursor, table)
+
+    def build(index, target):
+        _drop_invalid_index(cursor, index)
+        cursor.execute(f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {index} ON {target} {definition}")
+
+    if not partitions:
+        _with_retries(conn, lambda: build(name, table), attempts, name)
+        return
+
+    _with_retries(
+        conn, lambda: cursor.execute(f"CREATE {unique}INDEX IF NOT EXISTS {name} ON ONLY {table} {definition}"),
+        attempts, name
+    )
+    for partition in partitions:
+        child = f"{name}_{partition}"[:63]
+        _with_retries(conn, lambda: build(child, partition), attempts, child)
+        cursor.execute("""
+            SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(%s) AND inhparent = to_regclass(%s)
+        """, (child, name))
+        if cursor.fetchone() is None:
+            _with_retries(conn, lambda: cursor.execute(f"ALTER INDEX {name} ATTACH PARTITION {child}"), attempts, child)
+
+def _drop_index_concurrently(conn, cursor, statement, attempts):
+    """DROP INDEX CONCURRENTLY; partitionierte Indizes kennen kein CONCURRENTLY
+
+    Für sie bleibt ein DROP INDEX, das nur kurz den Katalog sperrt.
+    """
+    name = _CONCURRENT_DROP.match(statement).group(1)
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (name,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    if row[0] == 'I':
+        statement = f"DROP INDEX IF EXISTS {name}"
+    _with_retries(conn, lambda: cursor.execute(statement), attempts, name)
+
+def _apply(conn, track, migration, lock_timeout, attempts):
+    """Spielt eine Migration ein und trägt sie in schema_migrations ein"""
+    cursor = conn.cursor()
+    start = time.perf_counter()
+
+    def record():
+        cursor.execute("""
+            INSERT INTO schema_migrations (track, version, name, checksum, seconds)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (track, migration.version, migration.name, migration.checksum, time.perf_counter() - start))
+
+    if migration.transactional:
+        def run():
+            cursor.execute(f"SET LOCAL lock_timeout = '{lock_timeout}'")
+            cursor.execute(migration.sql)
+            record()
+            conn.commit()
+        _with_retries(conn, run, attempts, migration.name)
+    else:
+        conn.autocommit = True
+        try:
+            cursor.execute(f"SET lock_timeout = '{lock_timeout}'")
+            for statement in migration.statements():
+                if _CONCURRENT_INDEX.match(statement):
+                    _create_index_concurrently(conn, cursor, statement, attempts)
+                elif _CONCURRENT_DROP.match(statement):
+                    _drop_index_concurrently(conn, cursor, statement, attempts)
+                else:
+                    _with_retries(conn, lambda: cursor.execute(statement), attempts, migration.name)
+            record()
+            cursor.execute("RESET lock_timeout")
+        finally:
+            conn.autocommit = False
+
+    cursor.close()
+    return time.perf_counter() - start
+
+def upgrade(conn, track='main', lock_timeout=LOCK_TIMEOUT, attempts=ATTEMPTS):
+    """Bringt das Schema der Spur auf den neuesten Stand
+
+    Committet offene Arbeit der Verbindung. Ein session-weiter Advisory-Lock
+    verhindert, dass zwei Prozesse gleichzeitig migrieren. Weicht die
+    Prüfsumme einer bereits eingespielten Datei ab, wird abgebrochen. Gibt die
+    eingespielten Migrationen als [(Version, Name, Sekunden)] zurück.
+    """
+    migrations = load_migrations(track)
+    latest = migrations[-1].version if migrations else 0
+
+    conn.commit()
+    cursor = conn.cursor()
+    if current_version(cursor, track) >= latest:
+        conn.rollback()
+        cursor.close()
+        return []
+
+    cursor.execute("SELECT pg_advisory_lock(hashtext('schema_migrations'))")
+    try:
+        cursor.execute(VERSION_TABLE)
+        applied = applied_migrations(cursor, track)
+        conn.commit()
+
+        for migration in migrations:
+            if migration.version in applied and applied[migration.version][1] != migration.checksum:
+                raise RuntimeError(
+                    f"Migration {migration.version:04d}_{migration.name} wurde nach dem Einspielen geändert"
+                )
+
+        done = []
+        for migration in migrations:
+            if migration.version in applied:
+                continue
+            print(f"🧱 Migration {track}/{migration.version:04d}_{migration.name}...")
+            seconds = _apply(conn, track, migration, lock_timeout, attempts)
+            done.append((migration.version, migration.name, seconds))
+        return done
+    finally:
+        conn.rollback()
+        cursor.execute("SELECT pg_advisory_unlock(hashtext('schema_migrations'))")
+        conn.commit()
+        cursor.close()
+
+def status(conn, track='main'):
+    """[(Version, Name, eingespielt am oder None, geändert)] aller Dateien der Spur"""
+    cursor = conn.cursor()
+    applied = applied_migrations(cursor, track) if current_version(cursor, track) else {}
+    conn.rollback()
+    cursor.close()
+    return [
+        (migration.version, migration.name,
+         applied[migration.version][2] if migration.version in applied else None,
+         migration.version in applied and applied[migration.version][1] != migration.checksum)
+        for migration in load_migrations(track)
+    ]
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Restore ohne Ausfallzeit über eine Schatten-Datenbank für Getränkekasse
+Ein Backup wird in eine frisch angelegte Datenbank eingespielt, gegen die beim
+Backup festgehaltenen Zeilenzahlen und Salden geprüft und erst dann per
+Umbenennung in einer einzigen Transaktion gegen die Live-Datenbank getauscht.
+Die bisherige Datenbank bleibt für ein Rollback erhalten.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+from decimal import Decimal
+import psycopg2
+import db_access
+
+SUMMARY_TABLES = ('users', 'drinks', 'transactions', 'admin_settings')
+
+# Versuche, falls sich zwischen Trennen und Umbenennen doch eine Verbindung anmeldet
+SWAP_ATTEMPTS = 5
+
+def database_summary(cursor):
+    """Zeilenzahlen und Summen, gegen die ein Restore geprüft wird"""
+    summary = {'counts': {}}
+    for table in SUMMARY_TABLES:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        summary['counts'][table] = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(SUM(balance), 0) FROM users")
+    summary['balance_total'] = str(cursor.fetchone()[0])
+    cursor.execute("SELECT COALESCE(SUM(amount), 0) FROM transactions")
+    summary['transaction_total'] = str(cursor.fetchone()[0])
+    return summary
+
+def summary_path(backup_file):
+    return backup_file.rstrip('/') + '.summary.json'
+
+def write_summary(backup_file, summary):
+    with open(summary_path(backup_file), 'w', encoding='utf-8') as file:
+        json.dump(summary, file, indent=2)
+
+def load_summary(backup_file):
+    """Liefert die beim Backup gespeicherte Zusammenfassung oder None"""
+    path = summary_path(backup_file)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def compare_summaries(expected, actual):
+    """Liefert die Abweichungen zwischen erwarteter und tatsächlicher Zusammenfassung"""
+    problems = []
+    for table, count in expected['counts'].items():
+        if actual['counts'].get(table) != count:
+            problems.append(f"{table}: {actual['counts'].get(table)} statt {count} Zeilen")
+    for key in ('balance_total', 'transaction_total'):
+        if key in expected and Decimal(actual[key]) != Decimal(expected[key]):
+            problems.append(f"{key}: {actual[key]} statt {expected[key]}")
+    return problems
+
+def admin_connection(config):
+    """Verbindung zur Wartungsdatenbank postgres für CREATE/ALTER DATABASE"""
+    conn = db_access.open_target(
+        host=config['host'],
+        port=config['port'],
+        database='postgres',
+        user=config['user'],
+        password=config['password']
+    )
+    conn.autocommit = True
+    return conn
+
+def shadow_name(database, label='shadow'):
+    """Eindeutiger Name; die Prozess-id trennt Läufe in derselben Sekunde"""
+    return f"{database}_{label}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+
+def create_database(admin, name, source):
+    """Legt name leer aus template0 mit Kodierung und Locale von source an
+
+    template1 kann eine andere Kodierung haben (z.B. SQL_ASCII); die Kopie
+    muss sich bei Umlauten wie die Quelle verhalten.
+    """
+    cursor = admin.cursor()
+    cursor.execute("""
+        SELECT pg_encoding_to_char(encoding), datcollate, datctype
+        FROM pg_database WHERE datname = %s
+    """, (source,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.close()
+        raise RuntimeError(f"Datenbank {source} nicht gefunden")
+    cursor.execute(
+        f'CREATE DATABASE "{name}" TEMPLATE template0 ENCODING %s LC_COLLATE %s LC_CTYPE %s', row
+    )
+    cursor.close()
+
+def drop_database(admin, name):
+    cursor = admin.cursor()
+    cursor.execute(f'DROP DATABASE IF EXISTS "{name}"')
+    cursor.close()
+
+def _rename_pair(admin, current, replacement, retired):
+    """Benennt current in retired und replacement in current um, atomar
+
+    Neue Verbindungen auf current werden vorher gesperrt und bestehende
+    getrennt. Gibt die Dauer der Umschaltung in Sekunden zurück.
+    """
+    cursor = admin.cursor()
+    start = time.perf_counter()
+    cursor.execute(f'ALTER DATABASE "{current}" ALLOW_CONNECTIONS false')
+    try:
+        for attempt in range(1, SWAP_ATTEMPTS + 1):
+            cursor.execute("""
+                SELECT pg_terminate_backend(pid)
+                FROM pg_stat_activity
+                WHERE datname = %s AND pid <> pg_backend_pid()
+            """, (current,))
+            try:
+                # ALTER DATABASE ... RENAME ist transaktional: beide oder keine
+                admin.autocommit = False
+                cursor.execute(f'ALTER DATABASE "{current}" RENAME TO "{retired}"')
+                cursor.execute(f'ALTER DATABASE "{replacement}" RENAME TO "{current}"')
+                admin.commit()
+                break
+            except psycopg2.errors.ObjectInUse:
+                admin.rollback()
+                if attempt == SWAP_ATTEMPTS:
+                    raise
+                time.sleep(0.2 * attempt)
+            except Exception:
+                # Sonst scheitert auch das Freigeben der Verbindungen unten
+                admin.rollback()
+                raise
+            finally:
+                admin.autocommit = True
+    except Exception:
+        cursor.execute(f'ALTER DATABASE "{current}" ALLOW_CONNECTIONS true')
+        cursor.close()
+        raise
+
+    # Die zurückgestellte Datenbank bleibt für ein Rollback erreichbar
+    cursor.execute(f'ALTER DATABASE "{retired}" ALLOW_CONNECTIONS true')
+    cursor.close()
+    return time.perf_counter() - start
+
+def swap_in(admin, live, shadow):
+    """Macht shadow zur Live-Datenbank und liefert (alter Name der bisherigen, Dauer)"""
+    previous = shadow_name(live, 'before')
+    duration = _rename_pair(admin, live, shadow, previous)
+    return previous, duration
+
+def latest_previous(admin, live):
+    """Die zuletzt zurückgestellte Datenbank oder None"""
+    cursor = admin.cursor()
+    cursor.execute(
+        "SELECT datname FROM pg_database WHERE datname LIKE %s ORDER BY datname DESC LIMIT 1",
+        (f"{live}\\_before\\_%",)
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
+
+def roll_back(admin, live):
+    """Tauscht die zuletzt zurückgestellte Datenbank wieder ein
+
+    Gibt (wiederhergestellte, zurückgestellte, Dauer) zurück.
+    """
+    previous = latest_previous(admin, live)
+    if not previous:
+        raise RuntimeError(f"Keine zurückgestellte Datenbank {live}_before_* gefunden")
+    retired = shadow_name(live, 'rolledback')
+    duration = _rename_pair(admin, live, previous, retired)
+    return previous, retired, duration
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Stufenweise Laufzeit- und Speichermessung für die Python-Werkzeuge der Getränkekasse
+Erfasst je Stufe (load, create_tables, drinks, users, transactions, admin,
+commit, export, ...) Wall-Zeit, Zeilen, Durchsatz und Peak-RSS und schreibt
+alles als JSON-Bericht. Optional kommen ein cProfile-Dump und die größten
+Allokationen aus tracemalloc hinzu.
+"""
+
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+# Anzahl Allokationsstellen im Bericht
+TRACEMALLOC_TOP = 25
+
+def peak_rss_kb():
+    """Peak-RSS des aktuellen Prozesses in KiB"""
+    # ru_maxrss ist unter Linux in KiB, unter macOS in Bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+class StageRecord:
+    """Messwerte einer Stufe; rows setzt der Aufrufer"""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.seconds = 0.0
+        self.peak_rss_kb = None
+
+    def as_dict(self):
+        return {
+            'stage': self.name,
+            'seconds': round(self.seconds, 6),
+            'rows': self.rows,
+            'rows_per_sec': round(self.rows / self.seconds, 1) if self.rows and self.seconds else None,
+            'peak_rss_kb': self.peak_rss_kb
+        }
+
+class StageProfiler:
+    """Misst Stufen eines Laufs und schreibt den Bericht
+
+    Ohne enabled werden keine Messwerte gesammelt und kein Bericht geschrieben,
+    die Aufrufer können die Stufen trotzdem unverändert umschließen.
+    """
+
+    def __init__(self, script, enabled=False, report_path=None, cpu=False, memory=False):
+        self.script = script
+        self.enabled = enabled
+        self.report_path = report_path or f"profile_{script}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        self.cpu = enabled and cpu
+        self.memory = enabled and memory
+        self.stages = []
+        self.started_at = None
+        self._start = None
+        self._cprofile = None
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.started_at = datetime.now().isoformat()
+        self._start = time.perf_counter()
+        if self.memory:
+            tracemalloc.start()
+        if self.cpu:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    @contextmanager
+    def stage(self, name):
+        """Umschließt eine Stufe; im with-Block kann record.rows gesetzt werden"""
+        record = StageRecord(name)
+        if not self.enabled:
+            yield record
+            return
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            record.peak_rss_kb = peak_rss_kb()
+            self.stages.append(record)
+
+    def run(self, name, func, *args):
+        """Führt func(*args) als Stufe aus; eine int-Rückgabe zählt als Zeilen"""
+        with self.stage(name) as record:
+            result = func(*args)
+            if isinstance(result, int) and not isinstance(result, bool):
+                record.rows = result
+            elif isinstance(result, tuple) and all(isinstance(value, int) for value in result):
+                record.rows = sum(result)
+        return result
+
+    def _memory_report(self):
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        top = []
+        for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]:
+            frame = stat.traceback[0]
+            top.append({
+                'location': f"{frame.filename}:{frame.lineno}",
+                'size_kb': round(stat.size / 1024, 1),
+                'count': stat.count
+            })
+        return {
+            'current_kb': round(current / 1024, 1),
+            'peak_kb': round(peak / 1024, 1),
+            'top_allocations': top
+        }
+
+    def finish(self, status='ok'):
+        """Beendet die Messung und schreibt den JSON-Bericht"""
+        if not self.enabled:
+            return None
+
+        report = {
+            'script': self.script,
+            'argv': sys.argv[1:],
+            'status': status,
+            'started_at': self.started_at,
+            'wall_seconds': round(time.perf_counter() - self._start, 6),
+            'peak_rss_kb': peak_rss_kb(),
+            'stages': [record.as_dict() for record in self.stages]
+        }
+
+        if self._cprofile:
+            self._cprofile.disable()
+            cprofile_path = os.path.splitext(self.report_path)[0] + '.prof'
+            self._cprofile.dump_stats(cprofile_path)
+            report['cprofile'] = cprofile_path
+
+        if self.memory:
+            report['tracemalloc'] = self._memory_report()
+
+        with open(self.report_path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+        print(f"⏱️ Profil gespeichert: {self.report_path}")
+        for record in self.stages:
+            rows = f", {record.rows} Zeilen" if record.rows is not None else ""
+            print(f"  {record.name}: {record.seconds:.3f}s{rows}")
+        return report
+
+def add_profile_arguments(parser):
+    """Fügt --profile, --profile-cpu und --profile-memory hinzu"""
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='BERICHT',
+                       help='Laufzeit, Zeilen und Speicher je Stufe als JSON-Bericht schreiben '
+                            '(Standard: profile_<skript>_<zeit>.json)')
+    parser.add_argument('--profile-cpu', action='store_true',
+                       help='Mit --profile zusätzlich einen cProfile-Dump (.prof) schreiben')
+    parser.add_argument('--profile-memory', action='store_true',
+                       help='Mit --profile zusätzlich die größten Allokationen per tracemalloc erfassen')
+
+def profiler_from_args(args, script):
+    """Erzeugt den StageProfiler aus den geparsten Optionen"""
+    enabled = args.profile is not None or args.profile_cpu or args.profile_memory
+    return StageProfiler(
+        script, enabled, args.profile or None, args.profile_cpu, args.profile_memory
+    )
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Inkrementell gepflegte Statistik-Tabellen für Getränkekasse
+Statement-Trigger mit Transition-Tabellen übertragen jede Änderung an users,
+drinks und transactions als Delta in stats_totals, stats_transaction_types
+und stats_drink_purchases. Auch COPY und Massen-INSERTs kosten so nur eine
+Aktualisierung je Anweisung; TRUNCATE baut die Summen neu auf. Jede Sitzung
+schreibt in einen von STATS_SLOTS Zählerplätzen (pg_backend_pid() % STATS_SLOTS),
+damit parallele Käufe nicht bis zum Commit auf dieselbe Zeile warten; gelesen
+wird die Summe über alle Plätze. Die Statistik liest danach alles in einem
+Round Trip, unabhängig von der Größe des Journals.
+Für Auswertungen über Zeiträume fasst stats_daily das Journal je Tag, Benutzer,
+Typ und Getränk zusammen; refresh_rollup rechnet nur die Tage ab dem letzten
+Stand neu.
+"""
+
+import psycopg2
+
+ROLLUP_PERIODS = ('day', 'week', 'month')
+
+# Zählerplätze je Summe; mehr Plätze heißt weniger Wartezeit bei parallelen
+# Schreibern und etwas mehr Zeilen beim Lesen
+STATS_SLOTS = 16
+
+SUMMARY_TABLES = """
+    CREATE TABLE IF NOT EXISTS stats_totals (
+        slot SMALLINT PRIMARY KEY,
+        user_count BIGINT NOT NULL DEFAULT 0,
+        balance_total DECIMAL(14,2) NOT NULL DEFAULT 0,
+        drink_count BIGINT NOT NULL DEFAULT 0,
+        transaction_count BIGINT NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS stats_transaction_types (
+        slot SMALLINT NOT NULL,
+        transaction_type VARCHAR(50) NOT NULL,
+        transactions BIGINT NOT NULL,
+        PRIMARY KEY (slot, transaction_type)
+    );
+    CREATE TABLE IF NOT EXISTS stats_drink_purchases (
+        slot SMALLINT NOT NULL,
+        drink_name VARCHAR(255) NOT NULL,
+        purchases BIGINT NOT NULL,
+        PRIMARY KEY (slot, drink_name)
+    );
+"""
+
+# Erkennt die frühere Form mit je einer Zeile pro Summe
+UNSHARDED_LAYOUT = """
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'stats_totals' AND column_name = 'id'
+"""
+
+SUMMARY_SLOT = f"""
+    CREATE OR REPLACE FUNCTION stats_summary_slot() RETURNS SMALLINT AS $$
+        SELECT (pg_backend_pid() % {STATS_SLOTS})::SMALLINT;
+    $$ LANGUAGE sql STABLE;
+"""
+
+SUMMARY_FUNCTIONS = SUMMARY_SLOT + """
+    CREATE OR REPLACE FUNCTION stats_summary_rebuild() RETURNS void AS $$
+    BEGIN
+        DELETE FROM stats_totals;
+        INSERT INTO stats_totals (slot, user_count, balance_total, drink_count, transaction_count)
+        SELECT 0,
+               (SELECT COUNT(*) FROM users),
+               (SELECT COALESCE(SUM(balance), 0) FROM users),
+               (SELECT COUNT(*) FROM drinks),
+               (SELECT COUNT(*) FROM transactions);
+
+        DELETE FROM stats_transaction_types;
+        INSERT INTO stats_transaction_types (slot, transaction_type, transactions)
+        SELECT 0, transaction_type, COUNT(*) FROM transactions GROUP BY transaction_type;
+
+        DELETE FROM stats_drink_purchases;
+        INSERT INTO stats_drink_purchases (slot, drink_name, purchases)
+        SELECT 0, drink_name, COUNT(*) FROM transactions
+        WHERE transaction_type = 'purchase' AND drink_name IS NOT NULL
+        GROUP BY drink_name;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION stats_summary_truncate() RETURNS trigger AS $$
+    BEGIN
+        PERFORM stats_summary_rebuild();
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Addiert Deltas auf den Zählerplatz der eigenen Sitzung
+    CREATE OR REPLACE FUNCTION stats_summary_add_totals(
+        user_delta BIGINT, balance_delta DECIMAL, drink_delta BIGINT, transaction_delta BIGINT
+    ) RETURNS void AS $$
+    BEGIN
+        INSERT INTO stats_totals AS s (slot, user_count, balance_total, drink_count, transaction_count)
+        VALUES (stats_summary_slot(), user_delta, balance_delta, drink_delta, transaction_delta)
+        ON CONFLICT (slot) DO UPDATE SET
+            user_count = s.user_count + EXCLUDED.user_count,
+            balance_total = s.balance_total + EXCLUDED.balance_total,
+            drink_count = s.drink_count + EXCLUDED.drink_count,
+            transaction_count = s.transaction_count + EXCLUDED.transaction_count;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION stats_summary_users() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM stats_summary_add_totals(
+                (SELECT COUNT(*) FROM new_rows), (SELECT COALESCE(SUM(balance), 0) FROM new_rows), 0, 0
+            );
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM stats_summary_add_totals(
+                -(SELECT COUNT(*) FROM old_rows), -(SELECT COALESCE(SUM(balance), 0) FROM old_rows), 0, 0
+            );
+        ELSE
+            PERFORM stats_summary_add_totals(
+                0,
+                (SELECT COALESCE(SUM(balance), 0) FROM new_rows)
+                    - (SELECT COALESCE(SUM(balance), 0) FROM old_rows),
+                0, 0
+            );
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION stats_summary_drinks() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM stats_summary_add_totals(0, 0, (SELECT COUNT(*) FROM new_rows), 0);
+        ELSE
+            PERFORM stats_summary_add_totals(0, 0, -(SELECT COUNT(*) FROM old_rows), 0);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    -- Wendet Zu- (+1) und Abgänge (-1) von Transaktionen auf alle Summen an
+    CREATE OR REPLACE FUNCTION stats_summary_apply(types TEXT[], drinks TEXT[], signs INTEGER[])
+    RETURNS void AS $$
+    BEGIN
+        PERFORM stats_summary_add_totals(0, 0, 0, (SELECT COALESCE(SUM(sign), 0) FROM unnest(signs) AS sign));
+
+        INSERT INTO stats_transaction_types AS s (slot, transaction_type, transactions)
+        SELECT stats_summary_slot(), d.transaction_type, SUM(d.sign)
+        FROM unnest(types, signs) AS d (transaction_type, sign)
+        GROUP BY d.transaction_type
+        ON CONFLICT (slot, transaction_type) DO UPDATE SET
+            transactions = s.transactions + EXCLUDED.transactions;
+
+        INSERT INTO stats_drink_purchases AS s (slot, drink_name, purchases)
+        SELECT stats_summary_slot(), d.drink_name, SUM(d.sign)
+        FROM unnest(types, drinks, signs) AS d (transaction_type, drink_name, sign)
+        WHERE d.transaction_type = 'purchase' AND d.drink_name IS NOT NULL
+        GROUP BY d.drink_name
+        ON CONFLICT (slot, drink_name) DO UPDATE SET
+            purchases = s.purchases + EXCLUDED.purchases;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION stats_summary_transactions() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            PERFORM stats_summary_apply(
+                ARRAY(SELECT transaction_type FROM old_rows),
+                ARRAY(SELECT drink_name FROM old_rows),
+                ARRAY(SELECT -1 FROM old_rows)
+            );
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM stats_summary_apply(
+                ARRAY(SELECT transaction_type FROM new_rows),
+                ARRAY(SELECT drink_name FROM new_rows),
+                ARRAY(SELECT 1 FROM new_rows)
+            );
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+# (Triggername, Tabelle, Ereignis, Transition-Tabellen, Funktion)
+TRIGGERS = (
+    ('stats_summary_users_insert', 'users', 'INSERT', 'NEW TABLE AS new_rows', 'stats_summary_users'),
+    ('stats_summary_users_delete', 'users', 'DELETE', 'OLD TABLE AS old_rows', 'stats_summary_users'),
+    ('stats_summary_users_update', 'users', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows', 'stats_summary_users'),
+    ('stats_summary_drinks_insert', 'drinks', 'INSERT', 'NEW TABLE AS new_rows', 'stats_summary_drinks'),
+    ('stats_summary_drinks_delete', 'drinks', 'DELETE', 'OLD TABLE AS old_rows', 'stats_summary_drinks'),
+    ('stats_summary_transactions_insert', 'transactions', 'INSERT', 'NEW TABLE AS new_rows', 'stats_summary_transactions'),
+    ('stats_summary_transactions_delete', 'transactions', 'DELETE', 'OLD TABLE AS old_rows', 'stats_summary_transactions'),
+    ('stats_summary_transactions_update', 'transactions', 'UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows', 'stats_summary_transactions'),
+    ('stats_summary_users_truncate', 'users', 'TRUNCATE', None, 'stats_summary_truncate'),
+    ('stats_summary_drinks_truncate', 'drinks', 'TRUNCATE', None, 'stats_summary_truncate'),
+    ('stats_summary_transactions_truncate', 'transactions', 'TRUNCATE', None, 'stats_summary_truncate'),
+)
+
+# Liest Summen, Transaktionstypen, Top-Getränke und den Trigger-Stand in einer
+# Abfrage; die Zählerplätze werden dabei aufsummiert
+READ_SUMMARY = """
+    SELECT SUM(t.user_count), SUM(t.balance_total), SUM(t.drink_count), SUM(t.transaction_count),
+           (SELECT COALESCE(json_agg(json_build_array(transaction_type, transactions)
+                                     ORDER BY transactions DESC, transaction_type), '[]')
+            FROM (SELECT transaction_type, SUM(transactions) AS transactions
+                  FROM stats_transaction_types
+                  GROUP BY transaction_type HAVING SUM(transactions) > 0) types),
+           (SELECT COALESCE(json_agg(json_build_array(drink_name, purchases)
+                                     ORDER BY purchases DESC, drink_name), '[]')
+            FROM (SELECT drink_name, SUM(purchases) AS purchases
+                  FROM stats_drink_purchases
+                  GROUP BY drink_name HAVING SUM(purchases) > 0
+                  ORDER BY purchases DESC, drink_name LIMIT 5) top),
+           (SELECT COUNT(*) FROM pg_trigger
+            WHERE tgname LIKE 'stats\\_summary\\_%' AND NOT tgisinternal),
+           to_regproc('stats_summary_slot') IS NOT NULL
+    FROM stats_totals t
+    HAVING COUNT(*) > 0
+"""
+
+def install_summary_tables(cursor, rebuild=True):
+    """Legt Statistik-Tabellen, Funktionen und Trigger an und baut die Summen auf
+
+    Idempotent; wird auch aufgerufen, wenn Trigger fehlen, etwa weil die
+    Tabellen neu angelegt wurden. Die Sperre verhindert,
+    dass zwischen Neuaufbau und Trigger Änderungen verloren gehen. Mit
+    rebuild=False bleiben die Summen unverändert, etwa wenn nur die Tabelle
+    hinter den Triggern ausgetauscht wurde. Tabellen der früheren Form ohne
+    Zählerplätze werden ersetzt und neu aufgebaut. Der Aufrufer committet.
+    """
+    # Sperre zuerst: Schreiber halten sie, bevor ihre Trigger die Summen sperren
+    cursor.execute("LOCK TABLE users, drinks, transactions IN SHARE ROW EXCLUSIVE MODE")
+    cursor.execute(UNSHARDED_LAYOUT)
+    if cursor.fetchone() is not None:
+        cursor.execute("DROP TABLE stats_totals, stats_transaction_types, stats_drink_purchases")
+        rebuild = True
+    cursor.execute(SUMMARY_TABLES)
+    cursor.execute(SUMMARY_FUNCTIONS)
+    for name, table, event, transition, function in TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+        referencing = f"REFERENCING {transition} " if transition else ""
+        cursor.execute(
+            f"CREATE TRIGGER {name} AFTER {event} ON {table} "
+            f"{referencing}FOR EACH STATEMENT EXECUTE PROCEDURE {function}()"
+        )
+    if rebuild:
+        cursor.execute("SELECT stats_summary_rebuild()")
+
+def reinstall_triggers(cursor, dropped):
+    """Legt die Statistik-Trigger einer ausgetauschten transactions-Tabelle neu an
+
+    Passt als reinstall_triggers für ledger_partitions.migrate_to_partitioned
+    und läuft dort noch unter der Sperre des Umschaltens. Die Summen bleiben
+    gültig, die Daten sind dieselben.
+    """
+    if any(name.startswith('stats_summary_') for name in dropped):
+        install_summary_tables(cursor, rebuild=False)
+    if any(name.startswith('stats_rollup_') for name in dropped):
+        install_rollup(cursor)
+
+def read_summary(conn):
+    """Liefert die Statistik aus den Summentabellen
+
+    Fehlen Tabellen oder Trigger, werden sie einmalig angelegt. Gibt ein Dict
+    mit Zählern, Gesamtguthaben, Transaktionstypen und Top-Getränken zurück.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(READ_SUMMARY)
+        row = cursor.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        row = None
+
+    # Ohne stats_summary_slot stammen Tabellen und Trigger noch aus der Form ohne Zählerplätze
+    if row is None or row[6] != len(TRIGGERS) or not row[7]:
+        print("📦 Lege Statistik-Tabellen an und baue die Summen einmalig auf...")
+        install_summary_tables(cursor)
+        conn.commit()
+        cursor.execute(READ_SUMMARY)
+        row = cursor.fetchone()
+    conn.rollback()
+    cursor.close()
+
+    user_count, balance_total, drink_count, transaction_count, types, top_drinks, _, _ = row
+    return {
+        'users': user_count,
+        'balance_total': balance_total,
+        'drinks': drink_count,
+        'transactions': transaction_count,
+        'transaction_types': [tuple(entry) for entry in types],
+        'top_drinks': [tuple(entry) for entry in top_drinks]
+    }
+
+def drink_purchases(cursor):
+    """Käufe je Getränk aus stats_drink_purchases, ohne Begrenzung auf die Top 5"""
+    cursor.execute("""
+        SELECT drink_name, SUM(purchases) FROM stats_drink_purchases
+        GROUP BY drink_name HAVING SUM(purchases) > 0
+    """)
+    return dict(cursor.fetchall())
+
+ROLLUP_TABLES = """
+    CREATE TABLE IF NOT EXISTS stats_daily (
+        day DATE NOT NULL,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        transaction_type VARCHAR(50) NOT NULL,
+        drink_name VARCHAR(255) NOT NULL DEFAULT '',
+        transactions BIGINT NOT NULL,
+        amount DECIMAL(14,2) NOT NULL,
+        PRIMARY KEY (day, user_id, transaction_type, drink_name)
+    );
+    CREATE INDEX IF NOT EXISTS idx_stats_daily_drink_day ON stats_daily (drink_name, day);
+    CREATE INDEX IF NOT EXISTS idx_stats_daily_user_day ON stats_daily (user_id, day);
+    CREATE TABLE IF NOT EXISTS stats_rollup_state (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        last_id BIGINT NOT NULL DEFAULT 0,
+        rolled_up_until TIMESTAMP
+    );
+    INSERT INTO stats_rollup_state (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+    -- Nach TRUNCATE passt der Stand nicht mehr zum Journal: alles neu aufbauen
+    CREATE OR REPLACE FUNCTION stats_rollup_reset() RETURNS trigger AS $$
+    BEGIN
+        DELETE FROM stats_daily;
+        UPDATE stats_rollup_state SET last_id = 0, rolled_up_until = NULL;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS stats_rollup_transactions_truncate ON transactions;
+    CREATE TRIGGER stats_rollup_transactions_truncate AFTER TRUNCATE ON transactions
+        FOR EACH STATEMENT EXECUTE PROCEDURE stats_rollup_reset();
+"""
+
+# Archivierte Transaktionen (ledger_archive.py) fließen in die Tagessummen mit
+# ein: beim vollständigen Neuaufbau alle archivierten Monate, sonst nur Zeilen
+# der ohnehin neu berechneten Tage
+ROLLUP_ARCHIVE_DAYS = """
+    UNION
+    SELECT day::date
+    FROM (SELECT MIN(month) AS first, MAX(month) AS last FROM transactions_archive) a,
+         generate_series(a.first, a.last + INTERVAL '1 month' - INTERVAL '1 day', INTERVAL '1 day') AS day
+    WHERE %(last_id)s = 0
+"""
+
+ROLLUP_ARCHIVE_ROWS = """
+    UNION ALL
+    SELECT r.transaction_date::date, a.user_id, r.transaction_type, COALESCE(r.drink_name, ''), r.amount
+    FROM transactions_archive a
+    CROSS JOIN LATERAL json_to_recordset(a.rows) AS r(
+        transaction_date TIMESTAMP, amount DECIMAL(10,2), transaction_type VARCHAR(50), drink_name VARCHAR(255)
+    )
+    WHERE a.month >= date_trunc('month', (SELECT MIN(day) FROM rollup_days))
+      AND a.month <= (SELECT MAX(day) FROM rollup_days)
+      AND r.transaction_date::date IN (SELECT day FROM rollup_days)
+"""
+
+def has_archive(cursor):
+    cursor.execute("SELECT to_regclass('transactions_archive') IS NOT NULL")
+    return cursor.fetchone()[0]
+
+def install_rollup(cursor):
+    """Legt stats_daily samt Stand-Tabelle an (idempotent, der Aufrufer committet)"""
+    cursor.execute(ROLLUP_TABLES)
+
+def reset_rollup(cursor):
+    """Verwirft die Tagessummen, der nächste refresh_rollup baut alles neu auf"""
+    cursor.execute("DELETE FROM stats_daily")
+    cursor.execute("UPDATE stats_rollup_state SET last_id = 0, rolled_up_until = NULL")
+
+def refresh_rollup(conn):
+    """Bringt stats_daily auf den Stand des Journals
+
+    Neu berechnet werden alle Tage ab dem zuletzt zusammengefassten
+    transaction_date sowie die Tage aller Zeilen oberhalb des id-Stands, damit
+    auch nachträglich datierte Buchungen erfasst werden. Gibt (neu berechnete
+    Tage, Stand) zurück.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT last_id, rolled_up_until FROM stats_rollup_state FOR UPDATE")
+        row = cursor.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        row = None
+    if row is None:
+        print("📦 Lege Tagessummen an und fasse das Journal einmalig zusammen...")
+        install_rollup(cursor)
+        conn.commit()
+        cursor.execute("SELECT last_id, rolled_up_until FROM stats_rollup_state FOR UPDATE")
+        row = cursor.fetchone()
+    last_id, rolled_up_until = row
+
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM transactions")
+    max_id = cursor.fetchone()[0]
+    if max_id < last_id:
+        # Journal wurde ohne TRUNCATE neu befüllt
+        reset_rollup(cursor)
+        last_id, rolled_up_until = 0, None
+
+    archived = has_archive(cursor)
+    cursor.execute(f"""
+        CREATE TEMP TABLE rollup_days ON COMMIT DROP AS
+        SELECT DISTINCT transaction_date::date AS day
+        FROM transactions
+        WHERE id > %(last_id)s AND id <= %(max_id)s
+        UNION
+        SELECT day::date
+        FROM generate_series(%(since)s::date, CURRENT_DATE, INTERVAL '1 day') AS day
+        WHERE %(since)s IS NOT NULL
+        {ROLLUP_ARCHIVE_DAYS if archived else ""}
+    """, {'last_id': last_id, 'max_id': max_id, 'since': rolled_up_until})
+    days = cursor.rowcount
+
+    cursor.execute("DELETE FROM stats_daily WHERE day IN (SELECT day FROM rollup_days)")
+    cursor.execute(f"""
+        INSERT INTO stats_daily (day, user_id, transaction_type, drink_name, transactions, amount)
+        SELECT day, user_id, transaction_type, drink_name, COUNT(*), SUM(amount)
+        FROM (
+            SELECT d.day, t.user_id, t.transaction_type, COALESCE(t.drink_name, '') AS drink_name, t.amount
+            FROM rollup_days d
+            JOIN transactions t
+              ON t.transaction_date >= d.day AND t.transaction_date < d.day + 1
+            WHERE t.id <= %s AND t.user_id IS NOT NULL
+              -- Konstante Grenzen erlauben das Ausblenden alter Monatspartitionen
+              AND t.transaction_date >= (SELECT MIN(day) FROM rollup_days)
+              AND t.transaction_date < (SELECT MAX(day) FROM rollup_days) + 1
+            {ROLLUP_ARCHIVE_ROWS if archived else ""}
+        ) r
+        GROUP BY day, user_id, transaction_type, drink_name
+    """, (max_id,))
+
+    cursor.execute("""
+        UPDATE stats_rollup_state SET
+            last_id = %s,
+            rolled_up_until = GREATEST(rolled_up_until, (SELECT MAX(transaction_date) FROM transactions))
+        RETURNING rolled_up_until
+    """, (max_id,))
+    rolled_up_until = cursor.fetchone()[0]
+    conn.commit()
+    cursor.close()
+    return days, rolled_up_until
+
+def query_rollup(cursor, by='day', since=None, until=None, drink=None, username=None):
+    """Käufe und Einzahlungen je Zeitraum aus stats_daily
+
+    since und until sind inklusive Datumsgrenzen. Gibt Zeilen
+    (Zeitraum, Käufe, Umsatz Käufe, Einzahlungen) zurück.
+    """
+    if by not in ROLLUP_PERIODS:
+        raise ValueError(f"Unbekannter Zeitraum: {by}")
+
+    conditions = []
+    params = {'by': by}
+    if since:
+        conditions.append("d.day >= %(since)s")
+        params['since'] = since
+    if until:
+        conditions.append("d.day <= %(until)s")
+        params['until'] = until
+    if drink:
+        conditions.append("d.drink_name = %(drink)s")
+        params['drink'] = drink
+    if username:
+        conditions.append("d.user_id = (SELECT id FROM users WHERE username = %(username)s)")
+        params['username'] = username
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor.execute(f"""
+        SELECT date_trunc(%(by)s, d.day)::date AS period,
+               COALESCE(SUM(d.transactions) FILTER (WHERE d.transaction_type = 'purchase'), 0),
+               COALESCE(-SUM(d.amount) FILTER (WHERE d.transaction_type = 'purchase'), 0),
+               COALESCE(SUM(d.amount) FILTER (WHERE d.transaction_type = 'deposit'), 0)
+        FROM stats_daily d
+        {where}
+        GROUP BY period
+        ORDER BY period
+    """, params)
+    return cursor.fetchall()